@@ -0,0 +1,29 @@
+"""ASGI entry point, e.g. ``uvicorn asgi:app``.
+
+Requests run on a thread pool behind one event loop and bill PDFs render in
+a process pool, so a single process keeps serving /billed and /login while
+bills render.  ``ASGI_THREADS`` and ``PDF_WORKERS`` size the two pools.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+from app import app as flask_app
+from parking.asgi import WsgiToAsgi
+
+
+def start_pdf_workers():
+    if flask_app.config.get('PDF_EXECUTOR') is None:
+        workers = int(os.environ.get('PDF_WORKERS', os.cpu_count() or 1))
+        flask_app.config['PDF_EXECUTOR'] = ProcessPoolExecutor(workers)
+
+
+def stop_pdf_workers():
+    executor = flask_app.config.pop('PDF_EXECUTOR', None)
+    if executor is not None:
+        executor.shutdown(wait=False)
+
+
+app = WsgiToAsgi(flask_app,
+                 threads=int(os.environ.get('ASGI_THREADS', 64)),
+                 on_startup=start_pdf_workers,
+                 on_shutdown=stop_pdf_workers)
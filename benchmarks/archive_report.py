@@ -0,0 +1,109 @@
+"""Compare disk footprint and cold read speed of the billed record formats.
+
+Writes the same synthetic records as the old pretty-printed JSON file, as
+live JSON Lines shards and as archived (compressed) shards, then reads each
+back with the page cache dropped for those files where the OS allows it.
+
+    python benchmarks/archive_report.py --records 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parking.storage import MONTHS, ShardedStore, zstandard  # noqa: E402
+
+SITE = 'bench'
+
+
+def make_records(count, seed=7):
+    rng = random.Random(seed)
+    names = ['Kumar', 'Arivu', 'Selvam', 'Priya', 'Ravi', 'Lakshmi', 'Murugan', 'Devi']
+    for i in range(count):
+        month = MONTHS[i % 12]
+        yield {
+            'name': f"{rng.choice(names)} {i}",
+            'vehicle_no': f"TN {rng.randint(1, 99):02d} {rng.choice('ABCDEFGH')}{rng.choice('ABCDEFGH')} {rng.randint(1, 9999):04d}",
+            'vehicle_type': rng.choice(['bike', 'car', 'auto', 'other']),
+            'site': SITE,
+            'slot_number': f"SLOT-{rng.randint(1, 14):02d}",
+            'month': month,
+            'year': str(2020 + i // 12 % 5),
+            'payment_mode': rng.choice(['Cash', 'Online', 'Card', 'UPI']),
+            'bill_date': f"{rng.randint(1, 28):02d}-{MONTHS.index(month) + 1:02d}-2024 10:{rng.randint(0, 59):02d}:00",
+            'bill_amount': 'Rs. 1000.00',
+            'created_by': rng.choice(['Master', 'Arivuselvi', 'Venkatesan', 'Dhiyanes']),
+        }
+
+
+def drop_cache(paths):
+    """Ask the kernel to forget cached pages of ``paths`` (best effort)"""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+def dir_files(path):
+    return [os.path.join(path, name) for name in os.listdir(path)
+            if not name.startswith('.') and name != 'manifest.json']
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=100000)
+    args = parser.parse_args()
+
+    records = list(make_records(args.records))
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = os.path.join(tmp, 'billed_records.json')
+        with open(legacy, 'w') as f:
+            json.dump(records, f, indent=2)
+        drop_cache([legacy])
+
+        def read_legacy():
+            with open(legacy, 'r') as f:
+                return len(json.load(f))
+        count, seconds = timed(read_legacy)
+        rows.append(('json indent=2 (old)', os.path.getsize(legacy), count, seconds))
+
+        codecs = ['gzip'] + (['zstd'] if zstandard else [])
+        for codec in [None] + codecs:
+            store = ShardedStore(os.path.join(tmp, codec or 'live'))
+            store.append_many(SITE, records)
+            if codec:
+                for period in store.periods(SITE):
+                    store.archive(SITE, period, codec)
+            files = dir_files(store.site_dir(SITE))
+            drop_cache(files)
+            count, seconds = timed(lambda: sum(1 for _ in store.iter_records(SITE)))
+            label = f"jsonl + {codec} (archived)" if codec else 'jsonl shards (live)'
+            rows.append((label, sum(os.path.getsize(p) for p in files), count, seconds))
+
+    base_bytes, base_seconds = rows[0][1], rows[0][3]
+    print(f"{'format':28} {'bytes':>12} {'size':>7} {'records':>9} {'read s':>8} {'speed':>7}")
+    for label, size, count, seconds in rows:
+        print(f"{label:28} {size:12,d} {size / base_bytes:6.1%} {count:9,d} {seconds:8.3f} {base_seconds / seconds:6.2f}x")
+
+
+if __name__ == '__main__':
+    main()
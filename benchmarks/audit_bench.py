@@ -0,0 +1,76 @@
+"""Latency /generate gains from audit logging.
+
+Generates the same bills through two apps on scratch stores, one with the
+audit log and one where auditing does nothing, alternating between them so
+both see the same machine load.  Reported per bill format: mean and median
+request time and the audit overhead.  The background writer's fsyncs run
+off the request path, so they count only as far as they compete for CPU.
+
+    python benchmarks/audit_bench.py --bills 300
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parking.web import create_app  # noqa: E402
+
+BILL_FORM = {
+    'name': 'Bench Customer', 'vehicle_no': 'TN 31 AB 1234', 'vehicle_type': 'car',
+    'slot_number': 'SLOT-01', 'month': 'January', 'year': '2025', 'payment_mode': 'Cash',
+}
+
+
+class NoAudit:
+    def record(self, *args, **kwargs):
+        pass
+
+
+def client(data_dir, audited):
+    app = create_app({'DATA_DIR': data_dir, 'MIGRATE_LEGACY_FILES': False})
+    if not audited:
+        app.extensions['parking'].audit = NoAudit()
+    test_client = app.test_client()
+    test_client.post('/login', data={'username': 'Master', 'password': 'Master123'})
+    return test_client
+
+
+def generate(test_client, fmt):
+    start = time.perf_counter()
+    response = test_client.post('/generate', data=dict(BILL_FORM, format=fmt))
+    assert response.status_code == 200, response.data[:200]
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bills', type=int, default=300)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    print(f"{'format':>7} {'plain ms':>9} {'audited ms':>11} {'median':>15} {'overhead':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in ('pdf', 'text'):
+            clients = {audited: client(os.path.join(tmp, f"{fmt}-{audited}"), audited)
+                       for audited in (False, True)}
+            # Warm up: fonts, indexes and the ledger are loaded here
+            for test_client in clients.values():
+                for _ in range(5):
+                    generate(test_client, fmt)
+            times = {False: [], True: []}
+            for _ in range(args.bills):
+                for audited, test_client in clients.items():
+                    times[audited].append(generate(test_client, fmt))
+            plain, audited = (statistics.mean(times[key]) for key in (False, True))
+            medians = [statistics.median(times[key]) * 1000 for key in (False, True)]
+            print(f"{fmt:>7} {plain * 1000:>9.2f} {audited * 1000:>11.2f} "
+                  f"{medians[0]:>7.2f}/{medians[1]:<7.2f} {(audited / plain - 1) * 100:>8.1f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Cost of a backup run against the size of the store.
+
+For each store size, bills are written and shipped once (the first, full
+backup), then ``--new`` more bills are saved and shipped again.  The
+incremental run sends only those bills, so its time and bytes stay flat as
+the store grows, while copying the site directory grows with it (and
+the copy isn't even fsynced; every shipped object is).
+
+    python benchmarks/backup_bench.py --records 20000 100000 500000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.archive_report import SITE, make_records  # noqa: E402
+from parking.backup import DirectoryTarget, ship  # noqa: E402
+from parking.storage import ShardedStore  # noqa: E402
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, nargs='+', default=[20000, 100000, 500000])
+    parser.add_argument('--new', type=int, default=1000, help="bills saved between backups")
+    args = parser.parse_args()
+
+    print(f"{'records':>8} {'run':>12} {'ms':>9} {'KiB sent':>10}")
+    for count in args.records:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = ShardedStore(os.path.join(tmp, 'data'))
+            store.initialize(SITE)
+            records = list(make_records(count + args.new))
+            for start in range(0, count, 10000):
+                store.append_many(SITE, records[start:min(start + 10000, count)], bill_prefix='VP')
+            target = DirectoryTarget(os.path.join(tmp, 'replica'))
+            point, seconds = timed(ship, store, target, SITE)
+            print(f"{count:>8,d} {'full':>12} {seconds * 1000:>9.1f} {point['bytes'] / 1024:>10,.0f}")
+            store.append_many(SITE, records[count:], bill_prefix='VP')
+            # Let the full backup's writeback finish so it isn't charged to the fsyncs below
+            os.sync()
+            point, seconds = timed(ship, store, target, SITE)
+            print(f"{count:>8,d} {f'+{args.new:,d} bills':>12} {seconds * 1000:>9.1f} "
+                  f"{point['bytes'] / 1024:>10,.0f}")
+            copy = os.path.join(tmp, 'copy')
+            _, seconds = timed(shutil.copytree, store.site_dir(SITE), copy)
+            size = sum(os.path.getsize(os.path.join(root, name))
+                       for root, _, names in os.walk(copy) for name in names)
+            print(f"{count:>8,d} {'copy site':>12} {seconds * 1000:>9.1f} {size / 1024:>10,.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""Render time of each bill format.
+
+Renders the same bills as PDF, printable HTML, text receipt and ESC/POS
+and prints the time per bill and the speed-up over PDF.
+
+    python benchmarks/bill_formats_bench.py --bills 2000
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.archive_report import make_records  # noqa: E402
+from parking.bills import FORMATS  # noqa: E402
+from parking.inventory import load_inventory  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bills', type=int, default=2000)
+    args = parser.parse_args()
+
+    # fpdf warns about substituting Arial on every bill
+    warnings.simplefilter('ignore')
+    site = load_inventory().get_site().header()
+    records = [dict(record, bill_no=f"VP-{i:06d}") for i, record in enumerate(make_records(args.bills))]
+    timings = {}
+    print(f"{'format':>8} {'ms/bill':>9} {'bytes':>7} {'vs pdf':>7}")
+    for fmt, bill_format in FORMATS.items():
+        start = time.perf_counter()
+        for record in records:
+            body = bill_format.render(record, site)
+        timings[fmt] = (time.perf_counter() - start) / len(records)
+        print(f"{fmt:>8} {timings[fmt] * 1000:>9.3f} {len(body):>7,d} "
+              f"{timings['pdf'] / timings[fmt]:>6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Time to first byte and peak memory of /billed, streamed vs buffered.
+
+``buffered`` joins the whole response body before sending any of it, as
+render_template_string used to; ``streamed`` sends the chunks of
+stream_page as they are rendered, each dropped once written.  ``cold``
+clears the fragment cache first, so every record is read and rendered;
+``warm`` serves cached fragments.  Peak is the most memory traced during
+the request (the fragment cache a cold request fills is counted too).
+
+    python benchmarks/billed_stream_bench.py --records 20000 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.test import EnvironBuilder, run_wsgi_app  # noqa: E402
+
+from benchmarks.archive_report import make_records  # noqa: E402
+from parking.inventory import load_inventory  # noqa: E402
+from parking.storage import ShardedStore  # noqa: E402
+from parking.web import create_app  # noqa: E402
+
+
+def request(app, cookie, buffered):
+    environ = EnvironBuilder(path='/billed', headers={'Cookie': cookie}).get_environ()
+    start = time.perf_counter()
+    body, status, _ = run_wsgi_app(app, environ)
+    first = None
+    size = 0
+    if buffered:
+        data = b''.join(body)
+        first = time.perf_counter() - start
+        size = len(data)
+        del data
+    else:
+        for chunk in body:
+            if first is None:
+                first = time.perf_counter() - start
+            size += len(chunk)
+    if hasattr(body, 'close'):
+        body.close()
+    return first, time.perf_counter() - start, size
+
+
+def measure(app, cookie, buffered, cold):
+    fragments = app.extensions['parking'].fragments
+    if cold:
+        fragments.clear()
+    first, total, size = request(app, cookie, buffered)
+    if cold:
+        fragments.clear()
+    tracemalloc.start()
+    request(app, cookie, buffered)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first, total, size, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, nargs='+', default=[20000, 100000])
+    args = parser.parse_args()
+
+    site = load_inventory().get_site()
+    print(f"{'records':>8} {'cache':>5} {'mode':>9} {'first ms':>9} {'total ms':>9} "
+          f"{'page KiB':>9} {'peak KiB':>9}")
+    for count in args.records:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = ShardedStore(tmp)
+            store.initialize(site.id)
+            store.append_many(site.id, list(make_records(count)), bill_prefix=site.bill_prefix)
+            app = create_app({'DATA_DIR': tmp, 'MIGRATE_LEGACY_FILES': False})
+            client = app.test_client()
+            client.post('/login', data={'username': 'Master', 'password': 'Master123'})
+            cookie = f"session={client.get_cookie('session').value}"
+            for cold in (True, False):
+                for buffered in (True, False):
+                    first, total, size, peak = measure(app, cookie, buffered, cold)
+                    print(f"{count:>8,d} {'cold' if cold else 'warm':>5} "
+                          f"{'buffered' if buffered else 'streamed':>9} {first * 1000:>9.1f} "
+                          f"{total * 1000:>9.1f} {size / 1024:>9,.0f} {peak / 1024:>9,.0f}")
+
+
+if __name__ == '__main__':
+    main()
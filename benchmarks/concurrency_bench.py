@@ -0,0 +1,167 @@
+"""Concurrency of the WSGI and ASGI entry points under mixed load.
+
+Sends bill generations mixed with light /billed and /login requests at a
+fixed arrival rate, in process, against:
+
+* ``wsgi``: a sync server with ``--workers`` request slots (gunicorn sync
+  workers or the Vercel handler); every request, including PDF rendering,
+  holds a slot until it finishes.
+* ``asgi``: ``asgi.app`` with its thread pool and PDF process pool.
+
+It reports throughput and the latency of the light requests, measured from
+arrival so waiting for a free worker counts; that is what a user browsing
+/billed while bills print notices.  The ASGI side only pulls ahead when
+there are spare cores for the PDF processes or requests wait on disk; on a
+single core both end up sharing one CPU.
+
+    python benchmarks/concurrency_bench.py --bills 40 --pages 200 --workers 4
+"""
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('PARKING_DATA_DIR', tempfile.mkdtemp(prefix='parking-bench-'))
+
+from werkzeug.test import EnvironBuilder, run_wsgi_app  # noqa: E402
+
+import asgi  # noqa: E402
+from app import app as flask_app  # noqa: E402
+from parking.asgi import WsgiToAsgi  # noqa: E402
+
+BILL_FORM = {
+    'name': 'Bench Customer', 'vehicle_no': 'TN 31 AB 1234', 'vehicle_type': 'car',
+    'slot_number': 'SLOT-01', 'month': 'January', 'year': '2025',
+    'bill_amount': '1500', 'payment_mode': 'Cash',
+}
+
+
+def login_cookie():
+    client = flask_app.test_client()
+    client.post('/login', data={'username': 'Master', 'password': 'Master123'})
+    cookie = client.get_cookie('session')
+    return f"session={cookie.value}"
+
+
+def workload(bills, pages):
+    requests = [('POST', '/generate', BILL_FORM)] * bills
+    light = [('GET', '/billed', None), ('GET', '/login', None)] * (pages // 2)
+    # Interleave so light requests arrive while bills are rendering
+    mixed = []
+    for index in range(max(len(requests), len(light))):
+        mixed.extend(requests[index:index + 1])
+        mixed.extend(light[index:index + 1])
+    return mixed
+
+
+def run_wsgi(requests, cookie, workers, rate):
+    def call(request, submitted):
+        method, path, form = request
+        environ = EnvironBuilder(path=path, method=method, data=form,
+                                 headers={'Cookie': cookie}).get_environ()
+        body, status, _ = run_wsgi_app(flask_app, environ, buffered=True)
+        b''.join(body)
+        # Latency includes the wait for a free worker, as a client sees it
+        return path, status, time.perf_counter() - submitted
+
+    with ThreadPoolExecutor(workers) as pool:
+        futures = []
+        start = time.perf_counter()
+        for index, request in enumerate(requests):
+            due = start + index / rate
+            time.sleep(max(0.0, due - time.perf_counter()))
+            futures.append(pool.submit(call, request, due))
+        return [future.result() for future in futures]
+
+
+async def run_asgi(requests, cookie, app, rate):
+    async def call(request, submitted):
+        await asyncio.sleep(max(0.0, submitted - time.perf_counter()))
+        method, path, form = request
+        builder = EnvironBuilder(path=path, method=method, data=form)
+        environ = builder.get_environ()
+        body = environ['wsgi.input'].read()
+        headers = [(b'cookie', cookie.encode())]
+        if form:
+            headers += [(b'content-type', environ['CONTENT_TYPE'].encode()),
+                        (b'content-length', str(len(body)).encode())]
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+                 'headers': headers, 'server': ('localhost', 80), 'client': ('127.0.0.1', 0)}
+        pending = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        status = []
+
+        async def receive():
+            return pending.pop() if pending else {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        await app(scope, receive, send)
+        return path, status[0], time.perf_counter() - submitted
+
+    start = time.perf_counter()
+    return await asyncio.gather(*(call(request, start + index / rate)
+                                  for index, request in enumerate(requests)))
+
+
+async def with_lifespan(app, coroutine_factory):
+    messages = asyncio.Queue()
+    await messages.put({'type': 'lifespan.startup'})
+
+    async def send(message):
+        pass
+
+    lifespan = asyncio.create_task(app({'type': 'lifespan'}, messages.get, send))
+    await asyncio.sleep(0)
+    try:
+        return await coroutine_factory()
+    finally:
+        await messages.put({'type': 'lifespan.shutdown'})
+        await lifespan
+
+
+def report(label, results, elapsed):
+    light = sorted(seconds for path, _, seconds in results if path != '/generate')
+    bills = sorted(seconds for path, _, seconds in results if path == '/generate')
+    errors = sum(1 for _, status, _ in results if not str(status).startswith(('2', '3')))
+    print(f"{label:12} total {elapsed:6.2f}s  {len(results) / elapsed:7.1f} req/s  "
+          f"pages p50 {light[len(light) // 2] * 1000:7.1f} ms  "
+          f"p95 {light[int(len(light) * 0.95)] * 1000:7.1f} ms  "
+          f"bills p50 {bills[len(bills) // 2] * 1000:7.1f} ms  errors {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bills', type=int, default=40)
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--rate', type=float, default=200,
+                        help='arrival rate in requests per second')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='request slots of the sync WSGI server')
+    parser.add_argument('--threads', type=int, default=64,
+                        help='thread pool size of the ASGI adapter')
+    args = parser.parse_args()
+
+    cookie = login_cookie()
+    requests = workload(args.bills, args.pages)
+    print(f"{args.bills} bills + {args.pages} page views, data in {os.environ['PARKING_DATA_DIR']}")
+
+    start = time.perf_counter()
+    results = run_wsgi(requests, cookie, args.workers, args.rate)
+    report(f"wsgi x{args.workers}", results, time.perf_counter() - start)
+
+    app = WsgiToAsgi(flask_app, threads=args.threads,
+                     on_startup=asgi.start_pdf_workers, on_shutdown=asgi.stop_pdf_workers)
+    start = time.perf_counter()
+    results = asyncio.run(with_lifespan(app, lambda: run_asgi(requests, cookie, app, args.rate)))
+    report('asgi', results, time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Bills issued between two dates: scanning bill_date strings vs the time index.
+
+``scan`` is what answering the question took before records had
+``issued_at``: parse the bill_date of every record.  ``index`` is
+SearchIndex.between on the sorted time index.  Both answer the same
+one-day and one-month queries.
+
+    python benchmarks/date_range_bench.py --records 200000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.archive_report import make_records  # noqa: E402
+from parking.search import SearchIndex  # noqa: E402
+from parking.storage import BILL_DATE_FORMAT, add_timestamps  # noqa: E402
+
+RANGES = {
+    'one day': (datetime(2024, 3, 14), datetime(2024, 3, 15)),
+    'one month': (datetime(2024, 6, 1), datetime(2024, 7, 1)),
+}
+
+
+def scan(records, first, after):
+    return [record for record in records
+            if first <= datetime.strptime(record['bill_date'], BILL_DATE_FORMAT) < after]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=200000)
+    args = parser.parse_args()
+
+    records = [add_timestamps(record) for record in make_records(args.records)]
+    with tempfile.TemporaryDirectory() as tmp:
+        index = SearchIndex(os.path.join(tmp, 'search'))
+        index.build(records)
+        print(f"{'range':>10} {'bills':>7} {'scan ms':>9} {'index ms':>9} {'speed-up':>9}")
+        for name, (first, after) in RANGES.items():
+            start = time.perf_counter()
+            expected = scan(records, first, after)
+            scanned = time.perf_counter() - start
+            start = time.perf_counter()
+            found = index.between(first.timestamp(), after.timestamp())
+            indexed = time.perf_counter() - start
+            assert len(found) == len(expected)
+            print(f"{name:>10} {len(found):>7,d} {scanned * 1000:>9.1f} {indexed * 1000:>9.3f} "
+                  f"{scanned / indexed:>8.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""A monthly delivery run against local SMTP and webhook stand-ins.
+
+Queues one bill per tenant for email and for the messaging webhook, the
+way the Send Month's Bills button does, and measures how long the outbox
+takes to deliver them all.  The SMTP stand-in speaks just enough SMTP to
+accept mail and counts sessions, so connection reuse shows; the webhook
+stand-in is a keep-alive HTTP server that counts requests, so batching
+shows.  ``--fail-every N`` makes every Nth email a temporary (451) failure
+to exercise retries; backoff is shortened to keep the run short.
+
+Also reports what a saved bill costs the request: one outbox append.
+
+    python benchmarks/delivery_bench.py --bills 1000 --workers 2 4
+"""
+import argparse
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.archive_report import make_records  # noqa: E402
+from parking import delivery  # noqa: E402
+from parking.bills import render_pdf  # noqa: E402
+from parking.delivery import Outbox, SmtpTransport, WebhookTransport  # noqa: E402
+from parking.inventory import load_inventory  # noqa: E402
+from parking.serialization import loads  # noqa: E402
+
+
+class SmtpStandIn(socketserver.ThreadingTCPServer):
+    """Accepts any mail; every ``fail_every``-th message gets a 451"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, fail_every=0):
+        super().__init__(('127.0.0.1', 0), SmtpHandler)
+        self.fail_every = fail_every
+        self.sessions = 0
+        self.messages = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.sessions += 1
+        self.reply('220 stand-in ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in (b'EHLO', b'HELO'):
+                self.reply('250-stand-in')
+                self.reply('250 8BITMIME')
+            elif command == b'DATA':
+                self.reply('354 go ahead')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                with server.lock:
+                    server.messages += 1
+                    fail = server.fail_every and server.messages % server.fail_every == 0
+                    if fail:
+                        server.failed += 1
+                self.reply('451 try again later' if fail else '250 queued')
+            elif command == b'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+
+class WebhookStandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), WebhookHandler)
+        self.requests = 0
+        self.messages = 0
+        self.lock = threading.Lock()
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.messages += len(loads(body)['messages'])
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(bills, workers, batch, fail_every):
+    smtp = serve(SmtpStandIn(fail_every))
+    webhook = serve(WebhookStandIn())
+    site = load_inventory().get_site()
+    header = site.header()
+
+    def transports():
+        return {'email': SmtpTransport('127.0.0.1', smtp.server_address[1]),
+                'message': WebhookTransport(f"http://127.0.0.1:{webhook.server_address[1]}/bills")}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        outbox = Outbox(tmp, transports, ('email', 'message'), render_pdf, workers=workers, batch_size=batch)
+        records = list(make_records(bills))
+        for number, record in enumerate(records, 1):
+            record['bill_no'] = f"VP202401-{number:04d}"
+        messages = [{'channel': channel, 'to': to, 'site': site.id, 'record': record, 'header': header}
+                    for record in records
+                    for channel, to in (('email', f"tenant{record['bill_no']}@example.com"),
+                                        ('message', '+91 90000 00000'))]
+        start = time.perf_counter()
+        queued = outbox.enqueue(messages)
+        queued_in = time.perf_counter() - start
+        drained = outbox.wait_idle(600)
+        seconds = time.perf_counter() - start
+        stats = outbox.stats()
+        outbox.close()
+    smtp.shutdown()
+    webhook.shutdown()
+    return {
+        'queued': queued, 'queue_ms': queued_in * 1000, 'seconds': seconds, 'drained': drained,
+        'sent': stats['sent'], 'retried': stats['retried'], 'dead': stats['dead'],
+        'smtp_sessions': smtp.sessions, 'http_requests': webhook.requests,
+    }
+
+
+def single_enqueue(count=500):
+    """Mean cost of queueing one bill, as a request does"""
+    site = load_inventory().get_site()
+    with tempfile.TemporaryDirectory() as tmp:
+        outbox = Outbox(tmp, dict, (), render_pdf)
+        records = list(make_records(count))
+        start = time.perf_counter()
+        for number, record in enumerate(records):
+            record['bill_no'] = f"VP202401-{number:04d}"
+            outbox.enqueue([{'channel': 'email', 'to': 'tenant@example.com', 'site': site.id,
+                             'record': record, 'header': site.header()}])
+        return (time.perf_counter() - start) / count * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bills', type=int, default=1000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--batch', type=int, default=50)
+    parser.add_argument('--fail-every', type=int, default=0)
+    args = parser.parse_args()
+    if args.fail_every:
+        delivery.BACKOFF_BASE = 0.2
+
+    print(f"queueing one bill in a request: {single_enqueue():.3f} ms")
+    print(f"{'workers':>7} {'messages':>8} {'queue ms':>9} {'seconds':>8} {'msg/s':>7} "
+          f"{'retried':>7} {'dead':>5} {'smtp sessions':>13} {'http requests':>13}")
+    for workers in args.workers:
+        result = run(args.bills, workers, args.batch, args.fail_every)
+        print(f"{workers:>7} {result['sent']:>8,d} {result['queue_ms']:>9.1f} {result['seconds']:>8.2f} "
+              f"{result['sent'] / result['seconds']:>7,.0f} {result['retried']:>7,d} {result['dead']:>5,d} "
+              f"{result['smtp_sessions']:>13,d} {result['http_requests']:>13,d}"
+              + ('' if result['drained'] else '  (timed out)'))
+
+
+if __name__ == '__main__':
+    main()
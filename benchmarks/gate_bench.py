@@ -0,0 +1,98 @@
+"""Gate events per second on one core: ticket office, HTTP and batches.
+
+Replays a day of pay-and-park traffic: vehicles check in and check out
+again in a rolling window, so a few hundred are inside at any time.
+``office`` calls TicketOffice.record per event, ``http`` posts each event
+to /gate/in and /gate/out through the Flask app, ``batched`` posts them to
+/gate/events in batches as a gate controller would.  Every event is
+written to the log; fsyncs happen in the background.
+
+    python benchmarks/gate_bench.py --events 50000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parking.inventory import DEFAULT_TARIFFS  # noqa: E402
+from parking.tickets import TicketOffice  # noqa: E402
+from parking.web import create_app  # noqa: E402
+
+INSIDE = 300
+
+
+def traffic(count, start):
+    """``count`` gate events: each vehicle leaves INSIDE arrivals after it came"""
+    events = []
+    for number in range(count // 2 + INSIDE):
+        at = start + number * 10
+        if number < count // 2:
+            events.append({'type': 'in', 'vehicle_no': f"TN 31 Z {number:06d}",
+                           'vehicle_type': 'car' if number % 3 else 'bike', 'gate': 'G1', 'at': at})
+        if number >= INSIDE:
+            events.append({'type': 'out', 'vehicle_no': f"TN 31 Z {number - INSIDE:06d}",
+                           'gate': 'G2', 'at': at + 5})
+    return events
+
+
+def run_office(directory, events):
+    office = TicketOffice(directory, DEFAULT_TARIFFS)
+    office.load()
+    for event in events:
+        office.record([event])
+    office.sync()
+    return office.summary(limit=0)
+
+
+def client(directory):
+    app = create_app({'DATA_DIR': directory, 'MIGRATE_LEGACY_FILES': False})
+    test_client = app.test_client()
+    test_client.post('/login', data={'username': 'Master', 'password': 'Master123'})
+    return test_client
+
+
+def run_http(directory, events):
+    test_client = client(directory)
+    for event in events:
+        response = test_client.post(f"/gate/{event['type']}", json=event)
+        assert response.status_code in (200, 201), response.get_json()
+    return test_client.get('/gate?limit=0').get_json()
+
+
+def run_batched(directory, events, batch_size):
+    test_client = client(directory)
+    for index in range(0, len(events), batch_size):
+        results = test_client.post('/gate/events', json=events[index:index + batch_size]).get_json()
+        assert not any('error' in result for result in results)
+    return test_client.get('/gate?limit=0').get_json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=50000)
+    parser.add_argument('--batch-size', type=int, default=100)
+    args = parser.parse_args()
+
+    events = traffic(args.events, time.time() - args.events * 10)
+    runs = {
+        'office': run_office,
+        'http': run_http,
+        'batched': lambda directory, events: run_batched(directory, events, args.batch_size),
+    }
+    print(f"{'mode':>8} {'events':>8} {'seconds':>8} {'events/s':>9} {'inside':>7} {'closed':>8}")
+    for name, run in runs.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.process_time()
+            wall = time.perf_counter()
+            summary = run(os.path.join(tmp, 'main', 'tickets'), events) if name == 'office' else run(tmp, events)
+            cpu = time.process_time() - start
+            wall = time.perf_counter() - wall
+            print(f"{name:>8} {len(events):>8,d} {wall:>8.2f} {len(events) / wall:>9,.0f} "
+                  f"{summary['inside']:>7,d} {summary['closed']:>8,d}  (cpu {cpu:.2f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""CSV import time for growing row counts.
+
+Writes synthetic history CSVs (about half of the rows carry payment
+modes the importer rejects), imports each into a fresh store with the
+search index, and prints time per row.  Linear scaling shows as a flat
+microseconds-per-row column.
+
+    python benchmarks/import_bench.py --rows 125000,250000,500000,1000000
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.archive_report import make_records  # noqa: E402
+from parking.importer import import_csv, open_csv  # noqa: E402
+from parking.inventory import load_inventory  # noqa: E402
+from parking.search import SearchIndexes  # noqa: E402
+from parking.storage import ShardedStore  # noqa: E402
+
+COLUMNS = ['name', 'vehicle_no', 'vehicle_type', 'slot_number', 'month', 'year',
+           'payment_mode', 'bill_amount', 'bill_date', 'created_by']
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(make_records(rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', default='125000,250000,500000,1000000')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    site = load_inventory().get_site()
+    print(f"{'rows':>10} {'imported':>10} {'invalid':>9} {'seconds':>8} {'us/row':>7}")
+    for rows in (int(value) for value in args.rows.split(',')):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'history.csv')
+            write_csv(path, rows)
+            store = ShardedStore(os.path.join(tmp, 'data'))
+            store.initialize(site.id)
+            search = SearchIndexes(store)
+            start = time.perf_counter()
+            with open_csv(open(path, 'rb')) as stream:
+                for stats in import_csv(stream, store, site, search, 'bench', args.batch_size):
+                    pass
+            elapsed = time.perf_counter() - start
+            print(f"{rows:>10,d} {stats['imported']:>10,d} {stats['invalid']:>9,d} "
+                  f"{elapsed:>8.2f} {elapsed / rows * 1e6:>7.1f}")
+
+
+if __name__ == '__main__':
+    main()
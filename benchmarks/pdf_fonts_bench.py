@@ -0,0 +1,76 @@
+"""Per-bill PDF cost with core fonts, plain TrueType fonts and cached fonts.
+
+``core`` is the old Arial bill, ``ttf`` embeds the Unicode fonts the way
+fpdf2 does by default (parse on every bill, subset on every output) and
+``cached`` is render_pdf with parking/fonts.py.  Bills alternate between
+Latin and Tamil customer names.
+
+    PARKING_FONT_DIR=/path/to/noto python benchmarks/pdf_fonts_bench.py --bills 300
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.archive_report import make_records  # noqa: E402
+from fpdf.output import OutputProducer  # noqa: E402
+from parking import bills, fonts  # noqa: E402
+from parking.inventory import load_inventory  # noqa: E402
+
+TAMIL_NAMES = ['முருகன்', 'லட்சுமி', 'செல்வம்', 'அறிவு']
+
+
+def plain_ttf(pdf):
+    """Default fpdf2 embedding: add_font parses the files for every bill"""
+    found = fonts.find_fonts()
+    for family, styles in found.items():
+        for style, path in {'B': styles[''], 'I': styles[''], **styles}.items():
+            pdf.add_font(family, style, path)
+    if len(found) > 1:
+        pdf.set_fallback_fonts([family for family in found if family != fonts.TEXT_FAMILY], exact_match=False)
+    return fonts.TEXT_FAMILY
+
+
+def run(records, site, install, producer):
+    bills.install_fonts = install
+    bills.CachedFontOutputProducer = producer
+    start = time.perf_counter()
+    for record in records:
+        body = bills.render_pdf(record, site)
+    return (time.perf_counter() - start) / len(records), len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bills', type=int, default=300)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    found = fonts.find_fonts()
+    if fonts.TEXT_FAMILY not in found:
+        sys.exit("No Unicode fonts found; set PARKING_FONT_DIR (see parking/fonts.py)")
+    print("fonts:", ', '.join(f"{family}={os.path.basename(styles[''])}" for family, styles in found.items()))
+    site = dict(load_inventory().get_site().header(), languages=['en', 'ta'])
+    records = [dict(record, bill_no=f"VP-{i:06d}",
+                    name=f"{TAMIL_NAMES[i % 4]} {i}" if i % 2 else record['name'])
+               for i, record in enumerate(make_records(args.bills))]
+
+    modes = {
+        'core': (lambda pdf: None, OutputProducer),
+        'ttf': (plain_ttf, OutputProducer),
+        'cached': (fonts.install_fonts, fonts.CachedFontOutputProducer),
+    }
+    results = {}
+    print(f"{'fonts':>8} {'ms/bill':>9} {'bytes':>8} {'vs core':>8}")
+    for name, (install, producer) in modes.items():
+        # Warm up: the cached mode parses and subsets here, once
+        run(records[:4], site, install, producer)
+        results[name], size = run(records, site, install, producer)
+        print(f"{name:>8} {results[name] * 1000:>9.2f} {size:>8,d} {results[name] / results['core']:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
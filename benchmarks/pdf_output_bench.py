@@ -0,0 +1,111 @@
+"""Per-bill memory, time and size of the PDF output path.
+
+``before`` is the old path: fpdf2's bytearray buffer, copied into bytes,
+wrapped in BytesIO for send_file and read back in chunks, with plain-text
+ToUnicode maps.  ``after`` is render_pdf with parking/pdfoutput.py and the
+response body bill_response sends.  Peak is the most memory traced from
+the start of pdf.output() until the response body has been written out
+(the page layout before it is the same for both).
+
+    python benchmarks/pdf_output_bench.py --bills 300
+"""
+import argparse
+import io
+import os
+import sys
+import time
+import tracemalloc
+import warnings
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, send_file  # noqa: E402
+from benchmarks.archive_report import make_records  # noqa: E402
+from parking import bills  # noqa: E402
+from parking.fonts import CachedFontOutputProducer  # noqa: E402
+from parking.inventory import load_inventory  # noqa: E402
+
+
+class LegacyProducer(CachedFontOutputProducer):
+    """Cached fonts written the old way: ToUnicode maps not deflated"""
+
+    def _add_fonts(self):
+        font_objs_per_index = super()._add_fonts()
+        for font_obj in font_objs_per_index.values():
+            if font_obj.to_unicode is not None:
+                stream = font_obj.to_unicode
+                stream._contents = zlib.decompress(stream._contents)
+                stream.filter = None
+                stream.length = len(stream._contents)
+        return font_objs_per_index
+
+
+def start_output():
+    """Start measuring: the page is laid out, output begins"""
+    tracemalloc.reset_peak()
+    _output_start[0] = tracemalloc.get_traced_memory()[0]
+
+
+_output_start = [0]
+_pdf_bytes = bills.pdf_bytes
+
+
+def legacy_output(pdf):
+    start_output()
+    return bytes(pdf.output(output_producer_class=LegacyProducer))
+
+
+def new_output(pdf):
+    start_output()
+    return _pdf_bytes(pdf)
+
+
+def before(record, site):
+    bills.pdf_bytes = legacy_output
+    body = bills.render_pdf(record, site)
+    return send_file(io.BytesIO(body), as_attachment=True, download_name="bill.pdf",
+                     mimetype='application/pdf')
+
+
+def after(record, site):
+    bills.pdf_bytes = new_output
+    return Flask.response_class(bills.render_pdf(record, site), content_type='application/pdf')
+
+
+def run(records, site, respond):
+    peaks, size = [], 0
+    start = time.perf_counter()
+    for record in records:
+        response = respond(record, site)
+        # What the WSGI server does with the body
+        size = sum(len(chunk) for chunk in response.response)
+        response.close()
+        peaks.append(tracemalloc.get_traced_memory()[1] - _output_start[0])
+    return (time.perf_counter() - start) / len(records), sum(peaks) / len(peaks), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bills', type=int, default=300)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    site = load_inventory().get_site().header()
+    records = [dict(record, bill_no=f"VP-{i:06d}") for i, record in enumerate(make_records(args.bills))]
+    app = Flask(__name__)
+    print(f"{'output':>8} {'ms/bill':>9} {'peak KiB':>9} {'bytes':>8}")
+    with app.test_request_context():
+        for name, respond in (('before', before), ('after', after)):
+            # Warm up: fonts are parsed and subset here, once
+            run(records[:4], site, respond)
+            seconds, _, size = run(records, site, respond)
+            # Traced separately: tracing slows everything down
+            tracemalloc.start()
+            _, peak, _ = run(records, site, respond)
+            tracemalloc.stop()
+            print(f"{name:>8} {seconds * 1000:>9.2f} {peak / 1024:>9.1f} {size:>8,d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""As-you-type search latency over a large index.
+
+Builds a search index of synthetic bills, then times every keystroke prefix
+of a few typical queries (customer names and vehicle numbers), and the
+checkpoint load that replaces a rebuild at startup.
+
+    python benchmarks/search_bench.py --records 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.archive_report import make_records  # noqa: E402
+from parking.search import SearchIndex  # noqa: E402
+
+QUERIES = ['Kumar 4521', 'TN 31 AB 1234', 'selvam', 'tn07cd', '9999']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = SearchIndex(os.path.join(tmp, 'search'))
+        start = time.perf_counter()
+        index.build(make_records(args.records))
+        print(f"build + checkpoint: {len(index):,d} docs, {len(index.terms):,d} terms "
+              f"in {time.perf_counter() - start:.2f}s")
+
+        worst = 0.0
+        timings = []
+        for query in QUERIES:
+            for end in range(1, len(query) + 1):
+                prefix = query[:end]
+                start = time.perf_counter()
+                hits = index.search(prefix)
+                elapsed = (time.perf_counter() - start) * 1000
+                timings.append(elapsed)
+                if elapsed > worst:
+                    worst, worst_prefix = elapsed, prefix
+            print(f"{query!r:18} last keystroke {elapsed:6.3f} ms, {len(hits)} hits")
+        timings.sort()
+        print(f"keystrokes: {len(timings)}, median {timings[len(timings) // 2]:.3f} ms, "
+              f"worst {worst:.3f} ms ({worst_prefix!r})")
+
+        start = time.perf_counter()
+        loaded = SearchIndex(index.directory)
+        loaded.load()
+        print(f"startup checkpoint load: {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
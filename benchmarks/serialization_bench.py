@@ -0,0 +1,57 @@
+"""Encode/decode throughput of the JSON backends at 100k records.
+
+Compares the old ``json.dump(records, indent=2)`` file format with the
+compact JSON Lines format written by each installed backend.
+
+    python benchmarks/serialization_bench.py --records 100000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.archive_report import make_records  # noqa: E402
+from parking import serialization  # noqa: E402
+
+
+def best_of(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    records = list(make_records(args.records))
+    n = len(records)
+
+    rows = []
+    text, enc = best_of(lambda: json.dumps(records, indent=2), args.repeat)
+    _, dec = best_of(lambda: json.loads(text), args.repeat)
+    rows.append(('json indent=2 (old)', len(text.encode('utf-8')), enc, dec))
+
+    for name in serialization.available_backends():
+        _, dumps, loads = serialization.get_backend(name)
+        data, enc = best_of(lambda: b''.join(dumps(r) + b'\n' for r in records), args.repeat)
+        lines = data.splitlines()
+        _, dec = best_of(lambda: [loads(line) for line in lines], args.repeat)
+        rows.append((f"{name} jsonl", len(data), enc, dec))
+
+    print(f"{n:,d} records, default backend: {serialization.BACKEND}")
+    print(f"{'format':22} {'bytes':>12} {'encode rec/s':>14} {'decode rec/s':>14}")
+    for label, size, enc, dec in rows:
+        print(f"{label:22} {size:12,d} {n / enc:14,.0f} {n / dec:14,.0f}")
+
+
+if __name__ == '__main__':
+    main()
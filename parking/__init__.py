@@ -0,0 +1 @@
+"""Support modules for the Vengatesan Car Parking billing app."""
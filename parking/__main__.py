@@ -0,0 +1,430 @@
+"""Maintenance commands for the billing store.
+
+    python -m parking init                   create every site's store
+    python -m parking migrate                move old /tmp/billed_records*.json files in,
+                                             add timestamps to records written without them
+    python -m parking compact                archive closed months (compressed segments)
+    python -m parking reindex                rebuild the search indexes from the store
+    python -m parking verify                 integrity scan of every record
+    python -m parking audit                  check the audit log's hash chain
+    python -m parking export -o bills.csv    write bills as CSV or JSON Lines
+    python -m parking dues                   tenants with overdue bills
+    python -m parking backup /mnt/replica    ship what changed since the last backup
+    python -m parking restore /mnt/replica --bill VP202511-0042
+                                             restore the bills up to one bill, a time or a point
+    python -m parking import bills.csv       import bills from CSV
+    python -m parking bench                  storage and search throughput
+
+Commands act on every site unless ``--site`` is given (import and restore
+act on one site, the default one without ``--site``), on the store in
+``PARKING_DATA_DIR`` unless ``--data-dir`` is given.  Records are streamed,
+never loaded all at once, and every command reports elapsed time and
+records per second.
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from parking.audit import AuditLog, audit_dir, verify_log
+from parking.backup import DirectoryTarget, list_points, restore_logs, restore_records, ship
+from parking.events import EventBus, events_dir
+from parking.importer import BATCH_SIZE, CsvFormatError, format_progress, import_csv, open_csv
+from parking.inventory import load_inventory
+from parking.ledger import Ledgers
+from parking.search import SearchIndex, SearchIndexes
+from parking.serialization import dumps
+from parking.storage import (BILL_DATE_FORMAT, MONTHS, ShardedStore, data_dir_from_env,
+                             default_archive_codec, legacy_file, period_key)
+
+EXPORT_COLUMNS = ['bill_no', 'name', 'vehicle_no', 'vehicle_type', 'slot_number', 'month', 'year',
+                  'payment_mode', 'bill_amount', 'bill_date', 'created_by', 'issued_at']
+
+
+def report(label, count, seconds, file=None):
+    rate = count / seconds if seconds > 0 else float('inf')
+    print(f"{label}: {count:,d} records in {seconds:.2f}s ({rate:,.0f} records/s)", file=file, flush=True)
+
+
+def notify(args, site_id):
+    """Make open dashboards of the site reload"""
+    EventBus(events_dir(args.data_dir)).publish(site_id, {'type': 'resync'})
+
+
+def audit(args, action, site_id, user='cli', **details):
+    """Add a maintenance action that changed bills to the audit log"""
+    AuditLog(audit_dir(args.data_dir)).record(action, site_id, user=user, sync=True, **details)
+
+
+# -- commands ----------------------------------------------------------------
+
+def cmd_init(args, inventory, store):
+    for site in args.sites:
+        store.initialize(site.id)
+        print(f"{site.id}: {store.data_dir(site.id)}")
+    return 0
+
+
+def cmd_migrate(args, inventory, store):
+    for site in args.sites:
+        store.initialize(site.id)
+        migrated = migrate_legacy_file(args, inventory, store, site)
+        start = time.perf_counter()
+        stamped = store.add_timestamps(
+            site.id, progress=lambda period, done: print(f"  {period}: {done:,d} records", flush=True))
+        if stamped:
+            report(f"{site.id}: added timestamps", stamped, time.perf_counter() - start)
+        if migrated:
+            audit(args, 'migrate', site.id, records=migrated,
+                  file=args.file or legacy_file(site.id, inventory.default_site))
+            # Old bills are history: settled on the ledger
+            Ledgers(store).add_bills(site.id, store.iter_records(site.id), settled=True)
+        if migrated or stamped:
+            reindex(store, site.id)
+            notify(args, site.id)
+    return 0
+
+
+def migrate_legacy_file(args, inventory, store, site):
+    path = args.file or legacy_file(site.id, inventory.default_site)
+    if not os.path.exists(path):
+        print(f"{site.id}: no old records file ({path} not found)")
+        return 0
+    start = time.perf_counter()
+    count = store.import_legacy_file(
+        site.id, path, site.bill_prefix,
+        progress=lambda done: print(f"  {done:,d} records...", flush=True))
+    if not count and os.path.exists(path):
+        print(f"{site.id}: skipped {path} (site already has records, or the file is unreadable)")
+        return 0
+    report(f"{site.id}: migrated {path}", count, time.perf_counter() - start)
+    return count
+
+
+def cmd_compact(args, inventory, store):
+    before = period_key(MONTHS[datetime.now().month - 1], datetime.now().year)
+    for site in args.sites:
+        start = time.perf_counter()
+        periods = store.archive_before(site.id, before, args.codec)
+        footprint = store.footprint(site.id)
+        records = sum(footprint[period]['records'] for period in periods)
+        report(f"{site.id}: archived {len(periods)} months with {args.codec or default_archive_codec()}",
+               records, time.perf_counter() - start)
+        if periods:
+            audit(args, 'seal', site.id, periods=periods)
+        stored = sum(entry['bytes'] for entry in footprint.values())
+        raw = sum(entry['raw_bytes'] for entry in footprint.values())
+        print(f"  on disk {stored:,d} bytes (uncompressed {raw:,d})")
+    return 0
+
+
+def reindex(store, site_id):
+    start = time.perf_counter()
+    index = SearchIndex(os.path.join(store.data_dir(site_id), 'search'))
+    index.build(store.iter_records(site_id))
+    report(f"{site_id}: reindexed", len(index), time.perf_counter() - start)
+
+
+def cmd_reindex(args, inventory, store):
+    for site in args.sites:
+        reindex(store, site.id)
+    return 0
+
+
+def cmd_verify(args, inventory, store):
+    failed = False
+    for site in args.sites:
+        start = time.perf_counter()
+        result = store.verify(site.id)
+        report(f"{site.id}: verified", result['records'], time.perf_counter() - start)
+        for problem in result['problems']:
+            print(f"  {problem}")
+        failed = failed or bool(result['problems'])
+    print("problems found" if failed else "ok")
+    return 1 if failed else 0
+
+
+def cmd_audit(args, inventory, store):
+    start = time.perf_counter()
+    result = verify_log(AuditLog(audit_dir(args.data_dir)).path)
+    seconds = time.perf_counter() - start
+    print(f"audit log: {result['entries']:,d} entries checked in {seconds:.2f}s")
+    # Keep the head somewhere else: it is what shows entries cut off the end
+    print(f"  head {result['head']}")
+    for problem in result['problems']:
+        print(f"  {problem}")
+    print("problems found" if result['problems'] else "ok")
+    return 1 if result['problems'] else 0
+
+
+def cmd_export(args, inventory, store):
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+    fmt = args.format or ('jsonl' if args.output.endswith('.jsonl') else 'csv')
+    start = time.perf_counter()
+    count = 0
+    try:
+        writer = None
+        if fmt == 'csv':
+            writer = csv.DictWriter(output, EXPORT_COLUMNS + ['site'], extrasaction='ignore')
+            writer.writeheader()
+        for site in args.sites:
+            for record in store.iter_records(site.id):
+                record.setdefault('site', site.id)
+                if writer:
+                    writer.writerow(record)
+                else:
+                    output.write(dumps(record).decode('utf-8') + '\n')
+                count += 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    report(f"exported {fmt}", count, time.perf_counter() - start, file=args.log)
+    return 0
+
+
+def cmd_import(args, inventory, store):
+    site = args.sites[0]
+    store.initialize(site.id)
+    binary = sys.stdin.buffer if args.csv == '-' else open(args.csv, 'rb')
+    with open_csv(binary) as stream:
+        try:
+            for stats in import_csv(stream, store, site, SearchIndexes(store), args.created_by,
+                                    args.batch_size, Ledgers(store)):
+                print(f"  {format_progress(stats)}", flush=True)
+        except CsvFormatError as e:
+            print(f"error: {e}", file=sys.stderr)
+            return 1
+    audit(args, 'import', site.id, user=args.created_by, file=args.csv,
+          **{key: stats[key] for key in ('rows', 'imported', 'duplicates', 'invalid')})
+    for line, error in stats['errors']:
+        print(f"  line {line}: {error}")
+    report(f"{site.id}: imported", stats['imported'], stats['seconds'])
+    notify(args, site.id)
+    return 2 if stats['invalid'] else 0
+
+
+def cmd_dues(args, inventory, store):
+    ledgers = Ledgers(store)
+    for site in args.sites:
+        start = time.perf_counter()
+        tenants = ledgers.overdue(site.id)
+        totals = ledgers.totals(site.id)
+        print(f"{site.id}: {len(tenants)} tenants overdue, {totals['bills']} bills outstanding "
+              f"(Rs. {totals['amount']:,.2f}) in {time.perf_counter() - start:.3f}s")
+        for tenant in tenants:
+            since = datetime.fromtimestamp(tenant['oldest_due_at']).strftime('%d-%m-%Y')
+            bills = ', '.join(bill['bill_no'] for bill in tenant['bills'])
+            print(f"  {tenant['vehicle_no']:<16} {tenant['name']:<20} overdue Rs. {tenant['overdue']:,.2f} "
+                  f"since {since} ({bills})")
+    return 0
+
+
+def cmd_backup(args, inventory, store):
+    target = DirectoryTarget(args.replica)
+    for site in args.sites:
+        if args.list:
+            for point in list_points(target, site.id):
+                created = datetime.fromtimestamp(point['created_at']).strftime(BILL_DATE_FORMAT)
+                count = sum(shard['count'] for shard in point['manifest']['shards'].values())
+                print(f"{site.id}: point {point['seq']:>6,d}  {created}  {point['generation']}  "
+                      f"{count:,d} bills  {point['bytes']:,d} bytes shipped")
+            continue
+        start = time.perf_counter()
+        point = ship(store, target, site.id)
+        seconds = time.perf_counter() - start
+        if point is None:
+            print(f"{site.id}: nothing new ({seconds:.2f}s)")
+        else:
+            print(f"{site.id}: point {point['seq']}, {len(point['pieces'])} pieces, "
+                  f"{len(point['logs'])} log pieces, {point['bytes']:,d} bytes shipped in {seconds:.2f}s")
+    return 0
+
+
+def cmd_restore(args, inventory, store):
+    site = args.sites[0]
+    at = datetime.strptime(args.at, BILL_DATE_FORMAT).timestamp() if args.at else None
+    start = time.perf_counter()
+    try:
+        point, records = restore_records(DirectoryTarget(args.replica), site.id, args.bill, at, args.point)
+    except KeyError:
+        print(f"error: {args.replica} has no such backup point or bill of {site.id}", file=sys.stderr)
+        return 1
+    store.initialize(site.id)
+    snapshot_id = store.write_snapshot(site.id, records, created_by='cli')
+    store.merge_bill_counters(site.id, point['counters'])
+    snapshot = next(meta for meta in store.list_snapshots(site.id) if meta['id'] == snapshot_id)
+    report(f"{site.id}: snapshot {snapshot_id} from point {point['seq']}", snapshot['count'],
+           time.perf_counter() - start)
+    if args.snapshot_only:
+        return 0
+    store.restore_snapshot(site.id, snapshot_id, created_by='cli')
+    # Only logs lost with the data come back; live ones keep every payment
+    for name in restore_logs(DirectoryTarget(args.replica), store, site.id, point['seq']):
+        print(f"  restored the {name} log")
+    audit(args, 'restore', site.id, snapshot=snapshot_id, replica=args.replica, point=point['seq'],
+          bill=args.bill, at=args.at)
+    reindex(store, site.id)
+    notify(args, site.id)
+    return 0
+
+
+def synthetic_records(count, site, seed=7):
+    rng = random.Random(seed)
+    names = ['Kumar', 'Arivu', 'Selvam', 'Priya', 'Ravi', 'Lakshmi', 'Murugan', 'Devi']
+    for i in range(count):
+        yield {
+            'name': f"{rng.choice(names)} {i}",
+            'vehicle_no': f"TN {rng.randint(1, 99):02d} {rng.choice('ABCDEFGH')}{rng.choice('ABCDEFGH')} "
+                          f"{rng.randint(1, 9999):04d}",
+            'vehicle_type': 'car',
+            'site': site.id,
+            'slot_number': rng.choice(site.slot_ids),
+            'month': MONTHS[i % 12],
+            'year': str(2020 + i // 12 % 5),
+            'payment_mode': rng.choice(['Cash', 'Online']),
+            'bill_date': f"{rng.randint(1, 28):02d}-{i % 12 + 1:02d}-{2020 + i // 12 % 5} "
+                         f"{rng.randint(8, 20):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}",
+            'bill_amount': 'Rs. 1000.00',
+            'created_by': 'bench',
+        }
+
+
+def cmd_bench(args, inventory, store):
+    """Throughput on a scratch store; never touches the real data"""
+    site = args.sites[0]
+    with tempfile.TemporaryDirectory() as tmp:
+        scratch = ShardedStore(tmp)
+        scratch.initialize(site.id)
+        count = args.records
+
+        start = time.perf_counter()
+        batch = []
+        for record in synthetic_records(count, site):
+            batch.append(record)
+            if len(batch) >= 10000:
+                scratch.append_many(site.id, batch, site.bill_prefix)
+                batch = []
+        scratch.append_many(site.id, batch, site.bill_prefix)
+        report("append (batches of 10,000)", count, time.perf_counter() - start)
+
+        single = min(count, 2000)
+        start = time.perf_counter()
+        for record in synthetic_records(single, site, seed=8):
+            scratch.append(site.id, record, site.bill_prefix)
+        report("append (one bill at a time)", single, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        read = sum(1 for _ in scratch.iter_records(site.id))
+        report("read all", read, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        archived = scratch.archive_before(site.id, '9999-12')
+        report(f"archive {len(archived)} months", read, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        read = sum(1 for _ in scratch.iter_records(site.id))
+        report("read all (archived)", read, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        result = scratch.verify(site.id)
+        report(f"verify ({len(result['problems'])} problems)", result['records'], time.perf_counter() - start)
+
+        start = time.perf_counter()
+        index = SearchIndex(os.path.join(tmp, 'search'))
+        index.build(scratch.iter_records(site.id))
+        report("search index build", len(index), time.perf_counter() - start)
+        queries = ['Kumar 1', 'TN 31', 'selvam', 'tn07ab', '99']
+        start = time.perf_counter()
+        for query in queries:
+            for end in range(1, len(query) + 1):
+                index.search(query[:end])
+        keystrokes = sum(len(query) for query in queries)
+        elapsed = time.perf_counter() - start
+        print(f"search: {keystrokes} keystrokes, {elapsed / keystrokes * 1000:.3f} ms each")
+
+        months = [(datetime(year, month, 1), datetime(year + month // 12, month % 12 + 1, 1))
+                  for year in range(2020, 2025) for month in range(1, 13)]
+        start = time.perf_counter()
+        found = sum(len(index.between(first.timestamp(), after.timestamp())) for first, after in months)
+        report(f"date range ({len(months)} months)", found, time.perf_counter() - start)
+    return 0
+
+
+COMMANDS = {
+    'init': (cmd_init, "create the store of every site"),
+    'migrate': (cmd_migrate, "move old single-file JSON records into the store, add timestamps"),
+    'compact': (cmd_compact, "archive months before the current one into compressed segments"),
+    'reindex': (cmd_reindex, "rebuild search indexes from the stored records"),
+    'verify': (cmd_verify, "check every record against the manifests"),
+    'audit': (cmd_audit, "verify the hash chain of the audit log"),
+    'export': (cmd_export, "write all bills as CSV or JSON Lines"),
+    'import': (cmd_import, "import bills from a CSV file"),
+    'dues': (cmd_dues, "list tenants with overdue bills from the dues ledger"),
+    'backup': (cmd_backup, "ship new bills to a replica directory"),
+    'restore': (cmd_restore, "restore bills from a replica, up to a bill, a time or a point"),
+    'bench': (cmd_bench, "measure storage and search throughput on scratch data"),
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m parking', description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default=data_dir_from_env(),
+                        help="storage root (default: PARKING_DATA_DIR or %(default)s)")
+    parser.add_argument('--site', action='append', dest='site_ids', metavar='SITE',
+                        help="limit to this site (repeatable)")
+    # Where progress and timings go; export keeps stdout for the exported data
+    parser.set_defaults(log=sys.stdout, single_site=False)
+    commands = parser.add_subparsers(dest='command', required=True)
+    parsers = {name: commands.add_parser(name, help=help_text)
+               for name, (_, help_text) in COMMANDS.items()}
+    parsers['export'].set_defaults(log=sys.stderr)
+    # These write into one site: the default one unless --site names another
+    parsers['import'].set_defaults(single_site=True)
+    parsers['restore'].set_defaults(single_site=True)
+    parsers['migrate'].add_argument('--file', help="legacy JSON file (default: the site's old path)")
+    parsers['compact'].add_argument('--codec', choices=['gzip', 'zstd'])
+    parsers['export'].add_argument('-o', '--output', default='-', help="file, or - for stdout")
+    parsers['export'].add_argument('--format', choices=['csv', 'jsonl'])
+    parsers['import'].add_argument('csv', help="CSV file, or - for stdin")
+    parsers['import'].add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parsers['import'].add_argument('--created-by', default='import')
+    parsers['backup'].add_argument('replica', help="replica directory")
+    parsers['backup'].add_argument('--list', action='store_true', help="list backup points instead")
+    parsers['restore'].add_argument('replica', help="replica directory")
+    point = parsers['restore'].add_mutually_exclusive_group()
+    point.add_argument('--bill', help="up to and including this bill number")
+    point.add_argument('--at', help="bills issued by this time (DD-MM-YYYY HH:MM:SS)")
+    point.add_argument('--point', type=int, help="backup point number (default: the latest)")
+    parsers['restore'].add_argument('--snapshot-only', action='store_true',
+                                    help="only write the snapshot, leave the live data alone")
+    parsers['bench'].add_argument('--records', type=int, default=100000)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    inventory = load_inventory()
+    if args.single_site:
+        if args.site_ids and len(args.site_ids) > 1:
+            parser.error("exactly one --site required")
+        site_ids = args.site_ids or [inventory.default_site]
+    else:
+        site_ids = args.site_ids or list(inventory.sites)
+    unknown = [site_id for site_id in site_ids if site_id not in inventory.sites]
+    if unknown:
+        parser.error(f"unknown site: {', '.join(unknown)}")
+    args.sites = [inventory.get_site(site_id) for site_id in site_ids]
+    command, _ = COMMANDS[args.command]
+    start = time.perf_counter()
+    status = command(args, inventory, ShardedStore(args.data_dir))
+    print(f"{args.command} finished in {time.perf_counter() - start:.2f}s", file=args.log)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""Admission control for the expensive stages of a request.
+
+Each :class:`Stage` (PDF rendering, bill writes) runs at most ``limit``
+requests at a time.  Requests over the limit wait in a bounded queue; when
+the queue is full, a user already has ``per_user`` requests waiting, or a
+wait outlasts ``timeout``, the request is refused with :class:`Overloaded`,
+which the app answers with 429 and a Retry-After estimated from recent
+service times.  A burst at month start then queues briefly or is told to
+come back, instead of slowing every request down together.
+
+Waiting requests are queued per user and a freed slot goes to the users in
+turn, so an operator's bulk run waits behind its own requests and another
+operator's single bill is served at the next free slot.
+
+Long-lived requests such as event streams take a slot with
+``wait=False``: they are refused at once when the stage is full, since a
+slot may not come free for minutes.
+
+Limits apply per worker process; :meth:`Admission.stats` gives the running
+and waiting counts for monitoring.
+"""
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import math
+import threading
+import time
+
+# Weight of the latest request in the average service time
+SERVICE_TIME_WEIGHT = 0.2
+
+
+class Overloaded(Exception):
+    """A stage can't take the request now; retry after ``retry_after`` seconds"""
+
+    def __init__(self, stage, retry_after):
+        super().__init__(f"{stage} is busy")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class Stage:
+    """At most ``limit`` concurrent holders, up to ``max_waiting`` queued"""
+
+    def __init__(self, name, limit, max_waiting, per_user, timeout):
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_waiting = max_waiting
+        self.per_user = per_user
+        self.timeout = timeout
+        self.running = 0
+        self.waiting = 0
+        # user -> waiting events, in the order users are served
+        self._queues = OrderedDict()
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.service_seconds = 0.0
+
+    @contextmanager
+    def slot(self, user=None):
+        """Hold a slot of this stage; raises :class:`Overloaded` instead of waiting too long"""
+        self.acquire(user)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+    def retry_after(self):
+        """Seconds until the work ahead of a new request should be done"""
+        ahead = self.running + self.waiting
+        return max(1, math.ceil(self.service_seconds * ahead / self.limit))
+
+    def acquire(self, user=None, wait=True):
+        """Take a slot, for a later :meth:`release`; ``wait=False`` never queues"""
+        with self._lock:
+            if self.running < self.limit and not self.waiting:
+                self.running += 1
+                self.admitted += 1
+                return
+            queue = self._queues.get(user)
+            if (not wait or self.waiting >= self.max_waiting
+                    or (queue and len(queue) >= self.per_user)):
+                self.rejected += 1
+                raise Overloaded(self.name, self.retry_after())
+            if queue is None:
+                queue = self._queues[user] = deque()
+            granted = threading.Event()
+            queue.append(granted)
+            self.waiting += 1
+        if granted.wait(self.timeout):
+            return
+        with self._lock:
+            if granted.is_set():
+                return  # handed a slot just as the wait ran out
+            queue.remove(granted)
+            if not queue:
+                del self._queues[user]
+            self.waiting -= 1
+            self.timed_out += 1
+            raise Overloaded(self.name, self.retry_after())
+
+    def release(self, seconds=0.0):
+        with self._lock:
+            self.service_seconds += SERVICE_TIME_WEIGHT * (seconds - self.service_seconds)
+            if not self.waiting:
+                self.running -= 1
+                return
+            # The slot passes straight to the first waiting user, who then goes last
+            user, queue = next(iter(self._queues.items()))
+            granted = queue.popleft()
+            if queue:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            self.waiting -= 1
+            self.admitted += 1
+            granted.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'limit': self.limit,
+                'running': self.running,
+                'waiting': self.waiting,
+                'waiting_users': len(self._queues),
+                'max_waiting': self.max_waiting,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'service_seconds': round(self.service_seconds, 4),
+            }
+
+
+class Admission:
+    """Named stages with the same queue settings"""
+
+    def __init__(self, limits, max_waiting=64, per_user=8, timeout=15.0):
+        self.stages = {name: Stage(name, limit, max_waiting, per_user, timeout)
+                       for name, limit in limits.items()}
+
+    def slot(self, stage, user=None):
+        return self.stages[stage].slot(user)
+
+    def acquire(self, stage, user=None, wait=True):
+        self.stages[stage].acquire(user, wait)
+
+    def release(self, stage, seconds=0.0):
+        self.stages[stage].release(seconds)
+
+    def stats(self):
+        return {name: stage.stats() for name, stage in self.stages.items()}
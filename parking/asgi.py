@@ -0,0 +1,155 @@
+"""Serve the Flask (WSGI) app from an asyncio event loop.
+
+The event loop only does network I/O: reading request bodies and writing
+responses.  Each request's WSGI call, including its storage reads and
+writes, runs in a thread pool, and response chunks are handed back to the
+loop as they are produced, so streamed responses work and a slow request
+never blocks the others.  Regular files have no non-blocking API on Linux,
+so a thread pool is the standard way to keep file I/O off the loop.
+
+CPU-heavy PDF rendering should additionally go to a process pool (see
+``PDF_EXECUTOR`` in app.py), because threads cannot render in parallel.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import sys
+from tempfile import SpooledTemporaryFile
+
+MAX_IN_MEMORY_BODY = 1024 * 1024
+
+
+class WsgiToAsgi:
+    """ASGI application wrapping a WSGI application"""
+
+    def __init__(self, wsgi_app, threads=64, on_startup=None, on_shutdown=None):
+        self.wsgi_app = wsgi_app
+        self.threads = threads
+        self.executor = None
+        self.on_startup = on_startup
+        self.on_shutdown = on_shutdown
+
+    def _executor(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.threads, thread_name_prefix='wsgi')
+        return self.executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise RuntimeError(f"Unsupported ASGI scope type {scope['type']!r}")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.on_startup:
+                    self.on_startup()
+                self._executor()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.executor is not None:
+                    self.executor.shutdown(wait=False)
+                    self.executor = None
+                if self.on_shutdown:
+                    self.on_shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        body = SpooledTemporaryFile(max_size=MAX_IN_MEMORY_BODY)
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.write(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        body.seek(0)
+        environ = build_environ(scope, body)
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor(), self._run, environ, send, loop)
+        finally:
+            body.close()
+
+    def _run(self, environ, send, loop):
+        """Call the WSGI app in a worker thread, forwarding its output to the loop"""
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+
+        def forward(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def start():
+            forward({'type': 'http.response.start', 'status': response['status'],
+                     'headers': response['headers']})
+            response['sent'] = True
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in result:
+                if not chunk:
+                    continue
+                if not response.get('sent'):
+                    start()
+                forward({'type': 'http.response.body', 'body': bytes(chunk), 'more_body': True})
+            if not response.get('sent'):
+                start()
+            forward({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            close = getattr(result, 'close', None)
+            if close:
+                close()
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    path = scope.get('raw_path') or scope['path'].encode('utf-8')
+    if isinstance(path, bytes):
+        path = path.split(b'?', 1)[0]
+        # WSGI carries the raw URL bytes as latin-1; unquote like a server would
+        from urllib.parse import unquote_to_bytes
+        path = unquote_to_bytes(path).decode('latin-1')
+    root_path = scope.get('root_path', '')
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path,
+        'PATH_INFO': path,
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'CONTENT_LENGTH':
+            environ['CONTENT_LENGTH'] = value
+        else:
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
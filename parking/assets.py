@@ -0,0 +1,72 @@
+"""Fingerprinted static assets and HTTP validators for cached pages.
+
+Stylesheets live in ``static/`` and are served under a URL carrying a hash
+of their content, e.g. ``/assets/css/billed.3f9a1c2b.css``.  Such a URL
+never changes meaning, so browsers may keep it for a year without asking
+again; editing the file changes the hash and therefore the URL the pages
+link to.
+"""
+import hashlib
+import os
+
+FINGERPRINT_LENGTH = 10
+ONE_YEAR = 365 * 24 * 60 * 60
+
+
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:FINGERPRINT_LENGTH]
+
+
+def page_etag(*parts):
+    """Strong ETag for a page rendered from ``parts`` (store revision, user, ...)"""
+    return fingerprint('\x1f'.join(str(part) for part in parts).encode('utf-8'))
+
+
+def fingerprinted_name(name, digest):
+    root, ext = os.path.splitext(name)
+    return f"{root}.{digest}{ext}"
+
+
+class Assets:
+    """Content hashes of the files under a static directory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.digests = {}
+        self._by_url = {}
+        self.scan()
+
+    def scan(self):
+        """Hash every file once; called at startup"""
+        self.digests, self._by_url = {}, {}
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, self.directory).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    digest = fingerprint(f.read())
+                self.digests[name] = digest
+                self._by_url[fingerprinted_name(name, digest)] = name
+
+    @property
+    def version(self):
+        """One hash over all assets, for validators of pages that link them"""
+        return page_etag(*sorted(self.digests.items()))
+
+    def url_name(self, name):
+        """Fingerprinted file name of ``name``"""
+        return fingerprinted_name(name, self.digests[name])
+
+    def resolve(self, url_name):
+        """Return ``(name, current)`` for a requested fingerprinted name
+
+        Unknown fingerprints of a known file (a page rendered before a
+        deploy) still resolve, with ``current`` False so they aren't cached
+        for long; anything else returns ``(None, False)``.
+        """
+        name = self._by_url.get(url_name)
+        if name is not None:
+            return name, True
+        root, ext = os.path.splitext(url_name)
+        base = os.path.splitext(root)[0] + ext
+        return (base, False) if base in self.digests else (None, False)
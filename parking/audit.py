@@ -0,0 +1,201 @@
+"""Audit log: who issued, imported, paid, reset or restored what, and when.
+
+One hash-chained JSON Lines file for the whole storage root::
+
+    <root>/.audit/audit.jsonl
+
+Every line is an entry with ``seq``, ``at``, ``action``, ``site``, ``user``,
+the action's details and ``prev``: the SHA-256 of the line before it (of
+``GENESIS`` for the first line).  Editing, removing or reordering any line
+breaks the chain from there on, which :func:`verify_log` finds in a single
+streaming pass.  Lines cut off the end can only be noticed against a head
+hash kept somewhere else; ``python -m parking audit`` prints it.
+
+Appending costs a request next to nothing: :meth:`AuditLog.record` only
+queues the entry.  A background thread writes the queue at least every
+``FLUSH_INTERVAL`` seconds (sooner once ``FLUSH_ENTRIES`` are waiting) with
+one write and one fsync, chaining the entries under the file lock.  The
+writer remembers the size and last hash of the log as it left it, so it
+never reads earlier entries; only when another worker appended in between
+does it read back that worker's last line.  Actions that replace data are
+recorded with ``sync=True`` and are on disk before the request returns.
+"""
+import atexit
+import hashlib
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines
+    fcntl = None
+
+from parking.serialization import dumps, loads
+
+GENESIS = '0' * 64
+FLUSH_INTERVAL = 1.0
+FLUSH_ENTRIES = 256
+
+
+def audit_dir(data_dir):
+    """Where the audit log of a storage root lives"""
+    return os.path.join(data_dir, '.audit')
+
+
+def _digest(line):
+    return hashlib.sha256(line).hexdigest()
+
+
+def _last_entry(f, size):
+    """``(end, seq, hash)`` of the last complete line in the first ``size`` bytes
+
+    Reads backwards from ``size``, a block at a time, so the cost is the
+    length of that line and not of the log.
+    """
+    block = 4096
+    while True:
+        begin = max(0, size - block)
+        f.seek(begin)
+        data = f.read(size - begin)
+        end = data.rfind(b'\n')
+        start = data.rfind(b'\n', 0, max(end, 0)) + 1
+        if begin == 0 or start > 0:
+            if end < 0:
+                return 0, 0, GENESIS
+            line = data[start:end]
+            return begin + end + 1, loads(line)['seq'], _digest(line)
+        block *= 2
+
+
+class AuditLog:
+    """Queue audit entries and append them to the hash chain in batches"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, 'audit.jsonl')
+        self._pending = []
+        self._condition = threading.Condition()
+        # Serializes writers of this process, so batches keep their order
+        self._write_lock = threading.Lock()
+        # (size, seq, hash) of the log after this process's last write
+        self._head = None
+        self._thread = None
+        self._closed = False
+
+    def record(self, action, site=None, user=None, sync=False, **details):
+        """Add an entry; with ``sync`` it is written and fsynced before returning"""
+        entry = {'at': round(time.time(), 3), 'action': action, 'site': site, 'user': user}
+        entry.update(details)
+        with self._condition:
+            self._pending.append(entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='audit-log', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+            if len(self._pending) >= FLUSH_ENTRIES:
+                self._condition.notify()
+        if sync:
+            self.flush()
+
+    def flush(self):
+        """Write every queued entry"""
+        with self._write_lock:
+            with self._condition:
+                entries, self._pending = self._pending, []
+            if not entries:
+                return
+            try:
+                self._write(entries)
+            except BaseException:
+                with self._condition:
+                    self._pending[:0] = entries
+                raise
+
+    def close(self):
+        """Stop the background writer and write what is still queued"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(FLUSH_INTERVAL * 5)
+        self.flush()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._closed or len(self._pending) >= FLUSH_ENTRIES,
+                                         FLUSH_INTERVAL)
+                closed = self._closed
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error writing audit log: {e}")
+            if closed:
+                return
+
+    def _write(self, entries):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path, 'a+b') as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                size = os.fstat(f.fileno()).st_size
+                if self._head is not None and self._head[0] == size:
+                    _, seq, digest = self._head
+                else:
+                    # First write, or another worker appended since ours
+                    end, seq, digest = _last_entry(f, size)
+                    if end != size:
+                        # The tail of a writer that died mid-write; no entry was completed
+                        f.truncate(end)
+                        size = end
+                lines = []
+                for entry in entries:
+                    seq += 1
+                    line = dumps({'seq': seq, **entry, 'prev': digest})
+                    digest = _digest(line)
+                    lines.append(line)
+                    lines.append(b'\n')
+                data = b''.join(lines)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+                self._head = (size + len(data), seq, digest)
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def verify_log(path):
+    """Check the hash chain of an audit log in one pass
+
+    Returns ``{'entries': n, 'head': hash of the last line, 'problems': [...]}``.
+    """
+    problems = []
+    digest = GENESIS
+    expected_seq = 1
+    entries = 0
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return {'entries': 0, 'head': GENESIS, 'problems': []}
+    with f:
+        for number, raw in enumerate(f, 1):
+            line = raw.rstrip(b'\n')
+            try:
+                entry = loads(line)
+                prev, seq = entry['prev'], entry['seq']
+            except (ValueError, KeyError, TypeError) as e:
+                problems.append(f"line {number}: unreadable entry ({e})")
+                continue
+            if prev != digest:
+                problems.append(f"line {number}: chain broken (entry {seq} does not follow the line before it)")
+            if seq != expected_seq:
+                problems.append(f"line {number}: entry {seq} where {expected_seq} was expected")
+            if not raw.endswith(b'\n'):
+                problems.append(f"line {number}: incomplete entry")
+            digest = _digest(line)
+            expected_seq = seq + 1
+            entries += 1
+    return {'entries': entries, 'head': digest, 'problems': problems}
@@ -0,0 +1,363 @@
+"""Incremental backup of the billing store by shipping its segments.
+
+Segments of the store are only ever appended to, and sealed or archived
+segments never change again (see :mod:`parking.storage`), so a backup only
+has to send the bytes added to each segment since the last one.  Each run
+copies those bytes to a replica as new objects and adds a numbered backup
+*point*::
+
+    <replica>/<site>/HEAD.json                                  what was shipped
+    <replica>/<site>/points/00000042.json                       one per run
+    <replica>/<site>/segments/gen-000002/2025-11.000001.jsonl@000000081920
+
+A point holds the manifest and bill counters as they were and the pieces
+shipped in that run, so its size and the run's cost follow the new data,
+not the size of the store.  A segment that reappears in a new generation as
+a hard link (after a snapshot restore) is recorded as the same bytes instead
+of being sent again.
+
+The append-only logs beside the bills go the same way: the site's dues
+ledger and gate tickets and the storage root's audit log, each up to its
+last complete line, under ``<replica>/<site>/logs/``.  Their checkpoints
+are not shipped; they are rebuilt by replaying the logs.
+
+:func:`restore_records` rebuilds the records as of a point, a time or a
+bill: for a bill, everything issued before it and, in its own month, every
+bill saved before it.  They are written into an ordinary snapshot
+(:meth:`ShardedStore.write_snapshot`) to be looked at or restored.
+:func:`restore_logs` puts back the logs, as of a point, where they are
+missing; live logs are never rolled back, so no payment is lost.
+
+The replica is a :class:`DirectoryTarget`: objects are written whole, under
+a temporary name, fsynced and renamed into place, and never rewritten
+except ``HEAD.json`` and a point a crashed run left behind.  That is all an
+object store offers, so another target only needs the same five methods.
+"""
+from contextlib import contextmanager
+import os
+import re
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines
+    fcntl = None
+
+from parking.audit import audit_dir
+from parking.serialization import dumps, iter_lines, loads
+from parking.storage import decode_segment
+
+COPY_BLOCK = 1024 * 1024
+# Bill numbers carry their period: VP202501-0007
+_BILL_PERIOD = re.compile(r'(\d{4})(\d{2})-\d+$')
+
+
+class DirectoryTarget:
+    """Replica objects under a local directory, named by ``/``-separated keys"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def __str__(self):
+        return self.root
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def put(self, key, blocks):
+        """Store the object ``key`` from bytes or an iterable of bytes"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", 'wb') as f:
+            if isinstance(blocks, bytes):
+                blocks = [blocks]
+            for block in blocks:
+                f.write(block)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{path}.tmp", path)
+
+    def open(self, key):
+        """Binary file of the object ``key``; FileNotFoundError if there is none"""
+        return open(self._path(key), 'rb')
+
+    def get(self, key, default=None):
+        try:
+            with self.open(key) as f:
+                return f.read()
+        except FileNotFoundError:
+            return default
+
+    def list(self, prefix):
+        """Sorted keys of the objects directly under ``prefix``"""
+        try:
+            names = os.listdir(self._path(prefix))
+        except FileNotFoundError:
+            return []
+        return sorted(f"{prefix}/{name}" for name in names if not name.endswith('.tmp'))
+
+    @contextmanager
+    def locked(self):
+        """Keep two backup runs from shipping to this replica at once"""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, '.lock'), 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def log_paths(store, site_id):
+    """Append-only logs shipped with a site's bills, by name"""
+    site_dir = store.site_dir(site_id)
+    return {'ledger': os.path.join(site_dir, 'ledger', 'log.jsonl'),
+            'tickets': os.path.join(site_dir, 'tickets', 'log.jsonl'),
+            'audit': os.path.join(audit_dir(store.root), 'audit.jsonl')}
+
+
+def _capture_logs(store, site_id):
+    """``{name: (file, size)}`` of the logs, up to their last complete line"""
+    logs = {}
+    for name, path in log_paths(store, site_id).items():
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            continue
+        # A writer may be part way through a line; it is sent next time
+        size = os.fstat(f.fileno()).st_size
+        while size:
+            f.seek(max(0, size - COPY_BLOCK))
+            block = f.read(size - max(0, size - COPY_BLOCK))
+            end = block.rfind(b'\n')
+            if end >= 0:
+                size = size - len(block) + end + 1
+                break
+            size -= len(block)
+        logs[name] = (f, size)
+    return logs
+
+
+def _read_range(f, offset, length):
+    f.seek(offset)
+    while length > 0:
+        block = f.read(min(COPY_BLOCK, length))
+        if not block:
+            raise OSError(f"{f.name} is shorter than when it was captured")
+        length -= len(block)
+        yield block
+
+
+def ship(store, target, site_id):
+    """Send what changed in a site since the last backup; returns the new point
+
+    Returns None when nothing changed.  A run that fails part way leaves
+    ``HEAD.json`` as it was, so the next run sends the same pieces again.
+    """
+    with target.locked():
+        head = loads(target.get(f"{site_id}/HEAD.json", b'null')) or {
+            'seq': 0, 'generation': None, 'revision': None, 'files': {}}
+        captured = store.capture(site_id)
+        captured['logs'] = _capture_logs(store, site_id)
+        try:
+            return _ship(target, site_id, head, captured)
+        finally:
+            for f, _, _ in captured['segments'].values():
+                f.close()
+            for f, _ in captured['logs'].values():
+                f.close()
+
+
+def _ship(target, site_id, head, captured):
+    generation = captured['generation']
+    revision = captured['manifest'].get('revision')
+    if generation == head['generation']:
+        shipped, previous = head['files'], {}
+    else:
+        # Hard links of segments already shipped by the last generation
+        shipped = {}
+        previous = {entry['id']: (head['generation'], name, entry['size'])
+                    for name, entry in head['files'].items()}
+    pieces = []
+    files = {}
+    sent = 0
+    for name, (f, size, identity) in captured['segments'].items():
+        done = shipped.get(name, {}).get('size', 0)
+        if done > size:
+            done = 0  # rewritten under the same name: send it again
+        source = previous.get(identity)
+        if not done and source and source[2] == size:
+            pieces.append({'segment': name, 'length': size, 'same_as': list(source[:2])})
+        elif size > done:
+            key = f"{site_id}/segments/{generation}/{name}@{done:012d}"
+            target.put(key, _read_range(f, done, size - done))
+            pieces.append({'segment': name, 'offset': done, 'length': size - done, 'key': key})
+            sent += size - done
+        files[name] = {'id': identity, 'size': size}
+    logs = []
+    log_sizes = {}
+    for name, (f, size) in captured['logs'].items():
+        done = head.get('logs', {}).get(name, 0)
+        if done > size:
+            done = 0  # replaced by a shorter log: send it again
+        if size > done:
+            key = f"{site_id}/logs/{name}@{done:012d}"
+            target.put(key, _read_range(f, done, size - done))
+            logs.append({'log': name, 'offset': done, 'length': size - done, 'key': key})
+            sent += size - done
+        log_sizes[name] = size
+    if (not pieces and not logs and generation == head['generation']
+            and revision == head['revision']):
+        return None
+    point = {
+        'seq': head['seq'] + 1,
+        'created_at': time.time(),
+        'generation': generation,
+        'current_since': captured['current_since'],
+        'manifest': captured['manifest'],
+        'counters': captured['counters'],
+        'pieces': pieces,
+        'logs': logs,
+        'bytes': sent,
+    }
+    target.put(f"{site_id}/points/{point['seq']:08d}.json", dumps(point))
+    target.put(f"{site_id}/HEAD.json", dumps({'seq': point['seq'], 'generation': generation,
+                                              'revision': revision, 'files': files,
+                                              'logs': log_sizes}))
+    return point
+
+
+def list_points(target, site_id):
+    """Every backup point of a site, oldest first"""
+    points = []
+    for key in target.list(f"{site_id}/points"):
+        with target.open(key) as f:
+            points.append(loads(f.read()))
+    return points
+
+
+def _assemble(points):
+    """Pieces of every (generation, segment) and the last point of each generation"""
+    pieces = {}
+    latest = {}
+    for point in points:
+        generation = point['generation']
+        for piece in point['pieces']:
+            if 'same_as' in piece:
+                pieces[(generation, piece['segment'])] = list(pieces.get(tuple(piece['same_as']), []))
+            else:
+                pieces.setdefault((generation, piece['segment']), []).append(piece)
+        latest[generation] = point
+    return pieces, latest
+
+
+def _segment_lines(target, name, pieces):
+    for piece in pieces:
+        with target.open(piece['key']) as raw:
+            with decode_segment(raw, name) as f:
+                yield from f
+
+
+def _point_records(target, point, pieces, periods=None):
+    """``(period, record)`` of a point's generation, in period and write order"""
+    shards = point['manifest']['shards']
+    for period in sorted(shards) if periods is None else sorted(p for p in periods if p in shards):
+        for segment in shards[period]['segments']:
+            lines = _segment_lines(target, segment, pieces.get((point['generation'], segment), []))
+            for record in iter_lines(lines):
+                yield period, record
+
+
+def _find_bill(target, latest, pieces, bill_no):
+    """``(point, period, record)`` of the bill in the generation it was issued in"""
+    match = _BILL_PERIOD.search(bill_no)
+    periods = [f"{match.group(1)}-{match.group(2)}"] if match else None
+    found = []
+    for point in sorted(latest.values(), key=lambda point: point['current_since'], reverse=True):
+        for period, record in _point_records(target, point, pieces, periods):
+            if record.get('bill_no') == bill_no:
+                found.append((point, period, record))
+                break
+    for point, period, record in found:
+        # Issue times are whole seconds
+        if point['current_since'] <= (record.get('issued_at') or 0) + 1:
+            return point, period, record
+    if found:
+        return found[0]
+    raise KeyError(bill_no)
+
+
+def restore_records(target, site_id, bill_no=None, at=None, seq=None):
+    """Records of a site as of a backup point, a time or a bill
+
+    ``seq`` picks a point (default: the last one).  ``at`` (epoch seconds)
+    keeps the bills issued by then, from the generation that was live then.
+    ``bill_no`` keeps that bill and everything saved before it.  Returns
+    ``(point, records)``; records are streamed from the replica.  Raises
+    KeyError for an unknown point or bill.
+    """
+    points = [point for point in list_points(target, site_id) if seq is None or point['seq'] <= seq]
+    if not points or (seq is not None and points[-1]['seq'] != seq):
+        raise KeyError(seq)
+    pieces, latest = _assemble(points)
+    if bill_no:
+        point, bill_period, bill = _find_bill(target, latest, pieces, bill_no)
+        at = bill.get('issued_at')
+    elif at is not None:
+        live = [point for point in latest.values() if point['current_since'] <= at]
+        point = (max(live, key=lambda point: point['current_since']) if live
+                 else min(latest.values(), key=lambda point: point['current_since']))
+    else:
+        point = points[-1]
+
+    def records():
+        past_bill = False
+        for period, record in _point_records(target, point, pieces):
+            if bill_no and period == bill_period:
+                # Its own month is cut where it was written
+                if past_bill:
+                    continue
+                past_bill = record.get('bill_no') == bill_no
+            elif at is not None and (record.get('issued_at') or 0) > at:
+                continue
+            yield record
+
+    return point, records()
+
+
+def restore_logs(target, store, site_id, seq=None):
+    """Write the logs shipped up to point ``seq`` (default: the last) where they are missing
+
+    A log that exists and isn't empty is left alone: it has everything
+    shipped and maybe more.  Returns the names of the logs written.
+    """
+    pieces = {}
+    for point in list_points(target, site_id):
+        if seq is not None and point['seq'] > seq:
+            break
+        for piece in point.get('logs', []):
+            if piece['offset'] == 0:
+                pieces[piece['log']] = []
+            pieces.setdefault(piece['log'], []).append(piece)
+    restored = []
+    for name, path in log_paths(store, site_id).items():
+        if name not in pieces or (os.path.exists(path) and os.path.getsize(path)):
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.restore", 'wb') as f:
+            for piece in pieces[name]:
+                with target.open(piece['key']) as raw:
+                    for block in iter(lambda: raw.read(COPY_BLOCK), b''):
+                        f.write(block)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{path}.restore", path)
+        # A checkpoint left beside it would point into the lost log
+        try:
+            os.remove(os.path.join(os.path.dirname(path), 'checkpoint.json'))
+        except FileNotFoundError:
+            pass
+        restored.append(name)
+    return restored
@@ -0,0 +1,286 @@
+"""Bill rendering.
+
+Every format is rendered from the same :func:`bill_data` model of a billed
+record: an A4 PDF, a 40-column plain-text receipt, an ESC/POS byte stream
+for the thermal counter printer, and a printable HTML page.  Kept free of
+Flask and app state so rendering can also run in a worker process (see
+``PDF_EXECUTOR`` in parking/web.py and the ASGI entry point).
+"""
+import textwrap
+
+from fpdf import FPDF
+from jinja2 import Environment
+
+from parking.fonts import has_glyphs, install_fonts
+from parking.pdfoutput import pdf_bytes
+
+RECEIPT_WIDTH = 40
+
+TITLE = "MONTHLY PARKING BILL"
+FOOTER = ("CODE HIVE", "LEARN AND LEAD")
+
+# Labels of bilingual bills (sites with "bill_languages": ["en", "ta"])
+TAMIL_LABELS = {
+    TITLE: "மாதாந்திர வாகன நிறுத்தக் கட்டண ரசீது",
+    "Bill Number": "ரசீது எண்",
+    "Bill Date": "ரசீது தேதி",
+    "Customer Name": "வாடிக்கையாளர் பெயர்",
+    "Vehicle Number": "வாகன எண்",
+    "Vehicle Type": "வாகன வகை",
+    "Parking Slot": "நிறுத்துமிடம்",
+    "Parking Period": "கட்டணக் காலம்",
+    "Payment Mode": "செலுத்தும் முறை",
+    "Monthly Parking Charges": "மாதக் கட்டணம்",
+    "TOTAL AMOUNT": "மொத்தத் தொகை",
+}
+
+
+def bill_data(record, site):
+    """What a bill says, independent of the format it is printed in
+
+    ``site`` is the site header dict (name, address, contact, languages).
+    """
+    return {
+        'site': site['name'],
+        'address': site['address'],
+        'contact': site['contact'],
+        'title': TITLE,
+        'details': [
+            ("Bill Number", record.get('bill_no') or '-'),
+            ("Bill Date", record['bill_date'].split(' ')[0]),
+            ("Customer Name", record['name']),
+            ("Vehicle Number", record['vehicle_no']),
+            ("Vehicle Type", record['vehicle_type'].upper()),
+            ("Parking Slot", record['slot_number']),
+            ("Parking Period", f"{record['month']} {record['year']}"),
+            ("Payment Mode", record['payment_mode']),
+        ],
+        'charges': [("Monthly Parking Charges", record['bill_amount'])],
+        'total': record['bill_amount'],
+        'footer': FOOTER,
+        # Labels in the site's second language, if it has one
+        'translations': TAMIL_LABELS if 'ta' in site.get('languages', ()) else {},
+    }
+
+
+def _latin1(text):
+    """What the core PDF fonts can print of ``text``"""
+    return str(text).replace('\u20b9', 'Rs.').encode('latin-1', 'replace').decode('latin-1')
+
+
+def render_pdf(record, site):
+    """Render the monthly bill of ``record`` as A4 PDF bytes
+
+    Uses the Unicode fonts of parking/fonts.py when they are installed
+    (Tamil names, the rupee sign, bilingual labels) and the core Arial
+    font otherwise.
+    """
+    bill = bill_data(record, site)
+    pdf = FPDF()
+    family = install_fonts(pdf)
+    if family:
+        text = str
+        money = lambda amount: amount.replace('Rs. ', '\u20b9 ', 1)
+        translations = bill['translations']
+        if not has_glyphs(pdf, ''.join(translations.values())):
+            # No Tamil font installed
+            translations = {}
+    else:
+        family, text, money, translations = "Arial", _latin1, _latin1, {}
+    pdf.add_page()
+
+    def translated(label, width, height, size):
+        """The Tamil label under an English one, on bilingual bills"""
+        if label in translations:
+            pdf.set_font(family, size=size)
+            pdf.cell(width, height, txt=translations[label], ln=1)
+
+    # Header - Normal size
+    pdf.set_font(family, style="B", size=16)
+    pdf.cell(200, 10, txt=text(bill['site'].upper()), ln=1, align="C")
+    pdf.set_font(family, size=10)
+    pdf.cell(200, 8, txt=text(f"{bill['address']} | Contact: {bill['contact']}"), ln=1, align="C")
+    pdf.ln(10)
+
+    # Title - Normal size
+    pdf.set_font(family, style="B", size=18)
+    pdf.cell(200, 15, txt=bill['title'], ln=1, align="C")
+    if bill['title'] in translations:
+        pdf.set_font(family, size=12)
+        pdf.cell(200, 8, txt=translations[bill['title']], ln=1, align="C")
+    pdf.ln(5)
+
+    # Bill Details - Normal size
+    pdf.set_font(family, style="B", size=12)
+    pdf.cell(200, 10, txt="BILL DETAILS", ln=1)
+
+    for label, value in bill['details']:
+        pdf.set_font(family, size=11)
+        pdf.cell(60, 8, txt=label + ":", ln=0)
+        pdf.cell(130, 8, txt=text(value), ln=1)
+        translated(label, 60, 5, 8)
+
+    pdf.ln(10)
+
+    # Amount Section - Normal size
+    pdf.set_font(family, style="B", size=12)
+    pdf.cell(200, 10, txt="AMOUNT DETAILS", ln=1)
+
+    for label, amount in bill['charges']:
+        pdf.set_font(family, size=11)
+        pdf.cell(120, 10, txt=label + ":", ln=0)
+        pdf.cell(70, 10, txt=money(amount), ln=1)
+        translated(label, 120, 5, 8)
+
+    pdf.ln(8)
+
+    # Total Amount - Normal size
+    pdf.set_font(family, style="B", size=14)
+    pdf.cell(120, 12, txt="TOTAL AMOUNT:", ln=0)
+    pdf.cell(70, 12, txt=money(bill['total']), ln=1)
+    translated("TOTAL AMOUNT", 120, 6, 10)
+
+    pdf.ln(15)
+
+    # FOOTER SECTION
+    pdf.set_font(family, style="B", size=8)
+    pdf.cell(200, 4, txt="-" * 50, ln=1, align="C")
+    pdf.set_font(family, style="B", size=10)
+    pdf.cell(200, 6, txt=bill['footer'][0], ln=1, align="C")
+    pdf.set_font(family, style="I", size=8)
+    pdf.cell(200, 5, txt=bill['footer'][1], ln=1, align="C")
+
+    # Cached font subsets, serialized straight into the returned bytes
+    return pdf_bytes(pdf)
+
+
+# -- receipts -----------------------------------------------------------------
+
+def _pair(label, value, width):
+    """``label`` on the left and ``value`` on the right of one line (more if long)"""
+    value = str(value)
+    if len(label) + 1 + len(value) <= width:
+        return [label + value.rjust(width - len(label))]
+    return [label[:width]] + [line.rjust(width) for line in textwrap.wrap(value, width)]
+
+
+def _centered(text, width):
+    return [line.center(width).rstrip() for line in textwrap.wrap(text, width)]
+
+
+def receipt_lines(bill, width=RECEIPT_WIDTH):
+    """Lines of a fixed-width receipt as ``(text, style)``
+
+    ``style`` is ``None``, ``'bold'`` or ``'large'`` (bold, double height);
+    text is already padded to ``width`` so every printer lays it out alike.
+    """
+    lines = [(text, 'large') for text in _centered(bill['site'].upper(), width)]
+    lines += [(text, None) for text in _centered(f"{bill['address']} | Contact: {bill['contact']}", width)]
+    lines.append(('=' * width, None))
+    lines += [(text, 'bold') for text in _centered(bill['title'], width)]
+    lines.append(('-' * width, None))
+    for label, value in bill['details']:
+        lines += [(text, None) for text in _pair(label, value, width)]
+    lines.append(('-' * width, None))
+    for label, amount in bill['charges']:
+        lines += [(text, None) for text in _pair(label, amount, width)]
+    lines.append(('=' * width, None))
+    lines += [(text, 'large') for text in _pair("TOTAL", bill['total'], width)]
+    lines.append(('=' * width, None))
+    for text in bill['footer']:
+        lines += [(line, None) for line in _centered(text, width)]
+    return lines
+
+
+def render_text(record, site, width=RECEIPT_WIDTH):
+    """Plain-text receipt, ``width`` characters wide"""
+    return '\n'.join(text for text, _ in receipt_lines(bill_data(record, site), width)) + '\n'
+
+
+# ESC/POS commands understood by common 80mm thermal printers
+ESC_INIT = b'\x1b@'
+ESC_BOLD = (b'\x1bE\x00', b'\x1bE\x01')
+GS_SIZE = (b'\x1d!\x00', b'\x1d!\x01')      # normal, double height
+FEED_AND_CUT = b'\x1bd\x04' + b'\x1dVB\x00'
+
+
+def render_escpos(record, site, width=RECEIPT_WIDTH, encoding='cp437'):
+    """ESC/POS byte stream of the receipt, ready to send to the printer"""
+    out = [ESC_INIT]
+    for text, style in receipt_lines(bill_data(record, site), width):
+        line = text.encode(encoding, 'replace') + b'\n'
+        if style is None:
+            out.append(line)
+        else:
+            large = style == 'large'
+            out += [ESC_BOLD[1], GS_SIZE[large], line, GS_SIZE[0], ESC_BOLD[0]]
+    out.append(FEED_AND_CUT)
+    return b''.join(out)
+
+
+RECEIPT_HTML = '''<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>{{ bill.title|title }} {{ bill.details[0][1] }}</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 0; padding: 20px; color: #222; }
+        .bill { max-width: 420px; margin: 0 auto; }
+        h1 { font-size: 20px; text-align: center; margin: 0; }
+        h2 { font-size: 16px; text-align: center; margin: 16px 0 8px; }
+        .address, .footer { text-align: center; font-size: 12px; color: #555; }
+        small { color: #555; }
+        table { width: 100%; border-collapse: collapse; font-size: 14px; }
+        td { padding: 4px 0; border-bottom: 1px dotted #ccc; }
+        td:last-child { text-align: right; }
+        .total td { font-size: 17px; font-weight: bold; border-bottom: none; border-top: 2px solid #222; }
+        .footer { margin-top: 20px; }
+        .print { display: block; margin: 20px auto; padding: 8px 24px; }
+        @media print {
+            @page { margin: 8mm; }
+            body { padding: 0; }
+            .print { display: none; }
+        }
+    </style>
+</head>
+<body>
+    <div class="bill">
+        <h1>{{ bill.site|upper }}</h1>
+        <div class="address">{{ bill.address }} | Contact: {{ bill.contact }}</div>
+        <h2>{{ bill.title }}{% if bill.title in bill.translations %}<br><small>{{ bill.translations[bill.title] }}</small>{% endif %}</h2>
+        <table>
+            {% for label, value in bill.details + bill.charges %}
+            <tr><td>{{ label }}{% if label in bill.translations %}<br><small>{{ bill.translations[label] }}</small>{% endif %}</td><td>{{ value }}</td></tr>
+            {% endfor %}
+            <tr class="total"><td>TOTAL AMOUNT</td><td>{{ bill.total }}</td></tr>
+        </table>
+        <div class="footer">{% for line in bill.footer %}<div>{{ line }}</div>{% endfor %}</div>
+        <button class="print" onclick="window.print()">Print</button>
+    </div>
+</body>
+</html>
+'''
+_RECEIPT_TEMPLATE = Environment(autoescape=True).from_string(RECEIPT_HTML)
+
+
+def render_html(record, site):
+    """Printable HTML page of the bill"""
+    return _RECEIPT_TEMPLATE.render(bill=bill_data(record, site))
+
+
+class BillFormat:
+    def __init__(self, render, mimetype, extension, attachment):
+        self.render = render
+        self.mimetype = mimetype
+        self.extension = extension
+        # Downloaded rather than shown in the browser
+        self.attachment = attachment
+
+
+FORMATS = {
+    'pdf': BillFormat(render_pdf, 'application/pdf', 'pdf', True),
+    'html': BillFormat(render_html, 'text/html; charset=utf-8', 'html', False),
+    'text': BillFormat(render_text, 'text/plain; charset=utf-8', 'txt', False),
+    'escpos': BillFormat(render_escpos, 'application/octet-stream', 'bin', True),
+}
+DEFAULT_FORMAT = 'pdf'
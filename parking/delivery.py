@@ -0,0 +1,746 @@
+"""Outbound delivery of bills by email and messaging webhook.
+
+A bill issued with an email address or phone number is queued in a
+persistent outbox and sent by background threads, so saving a bill never
+waits on a mail server::
+
+    <root>/.outbox/outbox.jsonl    queued, sent, retried and given-up messages
+    <root>/.outbox/dead.jsonl      dead letters: messages given up on
+
+Every worker process appends to the outbox under ``.outbox/.lock`` and
+follows it from a byte offset, so all of them know what is pending.  One
+process at a time sends: the one holding ``sender.lock``.  Its dispatcher
+hands ready messages to ``workers`` threads in batches of up to
+``batch_size`` per channel.  A thread renders the batch's PDFs and sends
+them over connections it keeps open between batches: one SMTP session for
+many emails, one keep-alive HTTP connection for a webhook request that
+carries the whole batch.  The results of a batch go back into the outbox
+in one append.
+
+A failed send is retried after ``BACKOFF_BASE * 2 ** (attempts - 1)``
+seconds (jittered, at most ``BACKOFF_MAX``).  After ``max_attempts``, or at
+once when the server refuses the message outright, it moves to the dead
+letters, which :meth:`Outbox.requeue_dead` queues again.  Delivery is at
+least once: a batch the sender was sending when it died is sent again by
+the next sender, with the same Message-ID / message id for receivers to
+drop duplicates.
+
+Once the outbox passes ``COMPACT_BYTES`` the sender rewrites it with only
+the unsent messages.
+
+:class:`DirectoryTransport` writes messages to files instead of sending
+them, for development; ``benchmarks/delivery_bench.py`` runs local SMTP and
+HTTP stand-ins.
+"""
+import atexit
+import base64
+from contextlib import contextmanager
+import heapq
+import http.client
+import os
+import queue
+import random
+import re
+import smtplib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from email.header import Header
+from email.utils import formatdate
+from urllib.parse import urlsplit
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines
+    fcntl = None
+
+from parking.bills import render_text
+from parking.serialization import dumps, loads
+
+CHANNELS = ('email', 'message')
+POLL_INTERVAL = 0.5
+BACKOFF_BASE = 30
+BACKOFF_MAX = 3600
+COMPACT_BYTES = 4 * 1024 * 1024
+# Connections of a worker left unused this long are closed
+IDLE_SECONDS = 60
+# Recently rendered PDFs kept for the bill's other channel
+RENDER_CACHE = 256
+_EMAIL = re.compile(r'[^@\s<>(),;:"\[\]\\]+@[A-Za-z0-9](?:[A-Za-z0-9-]*[A-Za-z0-9])?'
+                    r'(?:\.[A-Za-z0-9](?:[A-Za-z0-9-]*[A-Za-z0-9])?)+')
+_PHONE = re.compile(r'\+?[0-9 ()-]+')
+
+
+def outbox_dir(data_dir):
+    """Where the delivery outbox of a storage root lives"""
+    return os.path.join(data_dir, '.outbox')
+
+
+class DeliveryError(Exception):
+    """A message wasn't delivered; ``permanent`` ones are not retried"""
+
+    def __init__(self, message, permanent=False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+def valid_email(address):
+    """Whether ``address`` is a plain ``user@example.com`` address"""
+    return len(address) <= 254 and _EMAIL.fullmatch(address) is not None
+
+
+def valid_phone(number):
+    """Whether ``number`` is a phone number: 7 to 15 digits, spaces, dashes, brackets, a leading +"""
+    return _PHONE.fullmatch(number) is not None and 7 <= sum(c.isdigit() for c in number) <= 15
+
+
+def backoff(attempts):
+    """Seconds to wait before sending again after ``attempts`` failed sends"""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def bill_filename(record):
+    return f"Parking_Bill_{record.get('bill_no', '')}.pdf"
+
+
+def compose_email(message, pdf, sender):
+    """The bill email of a message, as bytes: the text receipt with the PDF attached
+
+    Written out directly: composing it with :class:`email.message.EmailMessage`
+    took longer than rendering the PDF.
+    """
+    record = message['record']
+    subject = (f"{message['header']['name']} parking bill {record.get('bill_no', '')} "
+               f"for {record.get('month', '')} {record.get('year', '')}")
+    for value in (sender, message['to'], subject):
+        # A line break would start a header of its own (Bcc: ...)
+        if '\r' in value or '\n' in value:
+            raise DeliveryError(f"line break in email header {value!r}", permanent=True)
+    if not subject.isascii():
+        subject = Header(subject, 'utf-8').encode(linesep='\r\n')
+    boundary = f"=_bill_{message['id']}"
+    filename = bill_filename(record)
+    lines = [
+        f"From: {sender}",
+        f"To: {message['to']}",
+        f"Subject: {subject}",
+        f"Date: {formatdate(localtime=True)}",
+        f"Message-ID: <{message['id']}@{sender.rpartition('@')[2] or 'localhost'}>",
+        "MIME-Version: 1.0",
+        f'Content-Type: multipart/mixed; boundary="{boundary}"',
+        "",
+        f"--{boundary}",
+        'Content-Type: text/plain; charset="utf-8"',
+        "Content-Transfer-Encoding: base64",
+        "",
+    ]
+    return b''.join([
+        '\r\n'.join(lines).encode('utf-8'), b'\r\n',
+        _base64_lines(render_text(record, message['header']).encode('utf-8')),
+        '\r\n'.join([
+            f"--{boundary}",
+            f'Content-Type: application/pdf; name="{filename}"',
+            "Content-Transfer-Encoding: base64",
+            f'Content-Disposition: attachment; filename="{filename}"',
+            "", ""]).encode('ascii'),
+        _base64_lines(pdf),
+        f"--{boundary}--\r\n".encode('ascii'),
+    ])
+
+
+def _base64_lines(data):
+    return base64.encodebytes(data).replace(b'\n', b'\r\n')
+
+
+def webhook_message(message, pdf):
+    """A message as it is posted to the messaging webhook"""
+    record = message['record']
+    return {
+        'id': message['id'],
+        'to': message['to'],
+        'site': message['site'],
+        'bill_no': record.get('bill_no'),
+        'name': record.get('name'),
+        'month': record.get('month'),
+        'year': record.get('year'),
+        'amount': record.get('bill_amount'),
+        'filename': bill_filename(record),
+        'pdf': base64.b64encode(pdf).decode('ascii'),
+    }
+
+
+class SmtpTransport:
+    """Emails bills over one SMTP session, kept open across batches"""
+
+    def __init__(self, host, port=25, sender='bills@localhost', username=None, password=None,
+                 starttls=False, timeout=30):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self._smtp = None
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password)
+        return smtp
+
+    def send(self, batch):
+        """Send ``(message, pdf)`` pairs; returns None or a DeliveryError for each"""
+        results = []
+        for message, pdf in batch:
+            try:
+                email = compose_email(message, pdf, self.sender)
+            except DeliveryError as e:
+                results.append(e)
+                continue
+            try:
+                results.append(self._send(message['to'], email))
+            except (smtplib.SMTPException, OSError) as e:
+                # The server can't be reached: the rest of the batch would fail the same way
+                self.close()
+                error = DeliveryError(f"{type(e).__name__}: {e}")
+                results.extend([error] * (len(batch) - len(results)))
+                break
+        return results
+
+    def _send(self, to, email):
+        if self._smtp is not None:
+            try:
+                return self._deliver(to, email)
+            except smtplib.SMTPServerDisconnected:
+                # The server closed the idle session; open a new one
+                self.close()
+        self._smtp = self._connect()
+        return self._deliver(to, email)
+
+    def _deliver(self, to, email):
+        try:
+            self._smtp.sendmail(self.sender, [to], email)
+        except smtplib.SMTPRecipientsRefused as e:
+            return DeliveryError(f"recipient refused: {e.recipients}", permanent=True)
+        except smtplib.SMTPDataError as e:
+            return DeliveryError(f"{e.smtp_code} {e.smtp_error!r}", permanent=e.smtp_code >= 500)
+        return None
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                self._smtp.close()
+            self._smtp = None
+
+
+class WebhookTransport:
+    """Posts each batch as one JSON request over a keep-alive HTTP connection
+
+    The body is ``{"messages": [...]}`` (see :func:`webhook_message`); any 2xx
+    answer delivers the whole batch.  4xx answers other than 408 and 429
+    are permanent failures.
+    """
+
+    def __init__(self, url, token=None, timeout=30):
+        parts = urlsplit(url)
+        self.connection_class = (http.client.HTTPSConnection if parts.scheme == 'https'
+                                 else http.client.HTTPConnection)
+        self.netloc = parts.netloc
+        self.path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+        self.headers = {'Content-Type': 'application/json'}
+        if token:
+            self.headers['Authorization'] = f"Bearer {token}"
+        self.timeout = timeout
+        self._connection = None
+
+    def send(self, batch):
+        body = dumps({'messages': [webhook_message(message, pdf) for message, pdf in batch]})
+        try:
+            status, data = self._post(body)
+        except (http.client.HTTPException, OSError) as e:
+            self.close()
+            return [DeliveryError(f"{type(e).__name__}: {e}")] * len(batch)
+        if 200 <= status < 300:
+            return [None] * len(batch)
+        error = DeliveryError(f"HTTP {status}: {data[:200].decode('utf-8', 'replace')}",
+                              permanent=400 <= status < 500 and status not in (408, 429))
+        return [error] * len(batch)
+
+    def _post(self, body):
+        reused = self._connection is not None
+        for attempt in (1, 2):
+            if self._connection is None:
+                self._connection = self.connection_class(self.netloc, timeout=self.timeout)
+            try:
+                self._connection.request('POST', self.path, body, self.headers)
+                response = self._connection.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # A kept-alive connection the server had already closed
+                self.close()
+                if not reused or attempt == 2:
+                    raise
+                continue
+            if response.will_close:
+                self.close()
+            return response.status, data
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class DirectoryTransport:
+    """Writes each message into ``directory`` instead of sending it
+
+    Emails become ``.eml`` files and webhook messages ``.json`` files: a
+    local stand-in for development.
+    """
+
+    def __init__(self, directory, sender='bills@localhost'):
+        self.directory = directory
+        self.sender = sender
+
+    def send(self, batch):
+        os.makedirs(self.directory, exist_ok=True)
+        results = []
+        for message, pdf in batch:
+            try:
+                if message['channel'] == 'email':
+                    data, suffix = compose_email(message, pdf, self.sender), '.eml'
+                else:
+                    data, suffix = dumps(webhook_message(message, pdf)), '.json'
+            except DeliveryError as e:
+                results.append(e)
+                continue
+            path = os.path.join(self.directory, message['id'] + suffix)
+            with open(f"{path}.tmp", 'wb') as f:
+                f.write(data)
+            os.replace(f"{path}.tmp", path)
+            results.append(None)
+        return results
+
+    def close(self):
+        pass
+
+
+class Outbox:
+    """Persistent queue of bill messages and the threads that send them
+
+    ``transports()`` returns a new ``{channel: transport}`` for each worker
+    thread, so connections are never shared between threads; ``channels``
+    are the channels it covers.  ``render(record, header)`` returns a bill's
+    PDF.
+    """
+
+    def __init__(self, directory, transports, channels, render, workers=2, batch_size=50,
+                 max_attempts=8):
+        self.directory = directory
+        self.path = os.path.join(directory, 'outbox.jsonl')
+        self.dead_path = os.path.join(directory, 'dead.jsonl')
+        self.transports = transports
+        self.channels = tuple(channels)
+        self.render = render
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._condition = threading.Condition()
+        self._reset()
+        self._pid = None
+        self._threads = []
+        self._batches = None
+        self._sender_file = None
+        self._closed = False
+        self._synced = 0
+        # Size of the outbox after the last compaction
+        self._compacted = 0
+        # site:bill -> Future of its PDF, so a bill sent by email and message is rendered once
+        self._rendered = OrderedDict()
+        self._rendered_lock = threading.Lock()
+
+    def _reset(self):
+        # id -> queue entry with 'attempts', 'next_at' and 'error'
+        self.pending = {}
+        # site:bill:channel -> id of the pending message
+        self._keys = {}
+        # (next_at, order queued, id) of pending messages, including stale ones
+        self._ready = []
+        self._order = 0
+        self._in_flight = set()
+        self.counts = {'queued': 0, 'sent': 0, 'retried': 0, 'dead': 0}
+        self._inode = None
+        self._offset = 0
+
+    # -- the outbox file ---------------------------------------------------
+
+    def _apply(self, entry):
+        op = entry['op']
+        if op == 'queue':
+            message = dict(entry, attempts=0, next_at=entry['at'], error=None)
+            del message['op']
+            self.pending[message['id']] = message
+            self._keys[message['key']] = message['id']
+            self._schedule(message)
+            self.counts['queued'] += 1
+        elif op == 'retry':
+            message = self.pending.get(entry['id'])
+            if message is not None:
+                message.update(attempts=entry['attempts'], next_at=entry['next_at'], error=entry['error'])
+                self._schedule(message)
+            self.counts['retried'] += 1
+        elif op in ('sent', 'dead'):
+            message = self.pending.pop(entry['id'], None)
+            if message is not None and self._keys.get(message['key']) == message['id']:
+                del self._keys[message['key']]
+            self.counts[op] += 1
+        elif op == 'counts':
+            self.counts.update(entry['counts'])
+
+    def _schedule(self, message):
+        # Ties go in queue order, which keeps a bill's channels close together
+        heapq.heappush(self._ready, (message['next_at'], self._order, message['id']))
+        self._order += 1
+
+    def _refresh(self):
+        """Apply what was appended since the last look; caller holds the condition"""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            if st.st_ino != self._inode:
+                # New, or compacted by the sender: read it from the start
+                in_flight = self._in_flight
+                self._reset()
+                self._in_flight = in_flight
+                self._inode = st.st_ino
+            if st.st_size <= self._offset:
+                return
+            f.seek(self._offset)
+            data = f.read(st.st_size - self._offset)
+        # A line still being written is read on the next look
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            if line.strip():
+                self._apply(loads(line))
+        self._offset += end
+
+    @contextmanager
+    def _locked(self):
+        """Serialize writers of the outbox across processes, and its state in this one"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with self._condition:
+                    self._refresh()
+                    yield
+                    self._condition.notify_all()
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _append(self, entries, dead=(), finished=()):
+        """Write entries (and dead letters) and apply them; returns the entries
+
+        ``entries`` may be a function of the outbox, called once it is up to
+        date.  ``finished`` ids stop being in flight as the entries apply.
+        """
+        with self._locked():
+            self._in_flight.difference_update(finished)
+            if dead:
+                with open(self.dead_path, 'ab') as f:
+                    f.write(b''.join(dumps(letter) + b'\n' for letter in dead))
+            entries = entries(self) if callable(entries) else entries
+            if entries:
+                with open(self.path, 'ab') as f:
+                    if f.tell() > self._offset:
+                        # The tail of a writer that died mid-line
+                        f.truncate(self._offset)
+                    f.write(b''.join(dumps(entry) + b'\n' for entry in entries))
+                self._refresh()
+        return entries
+
+    def _compact(self):
+        """Rewrite the outbox with only the pending messages; caller is the sender"""
+        with self._locked():
+            # Replaying the lines below counts their messages again
+            retrying = sum(1 for message in self.pending.values() if message['attempts'])
+            lines = [{'op': 'counts', 'counts': dict(self.counts, queued=self.counts['queued'] - len(self.pending),
+                                                     retried=self.counts['retried'] - retrying)}]
+            for message in self.pending.values():
+                entry = {key: value for key, value in message.items()
+                         if key not in ('attempts', 'next_at', 'error')}
+                lines.append(dict(entry, op='queue'))
+                if message['attempts']:
+                    lines.append({'op': 'retry', 'id': message['id'], 'attempts': message['attempts'],
+                                  'next_at': message['next_at'], 'error': message['error']})
+            tmp = f"{self.path}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(b''.join(dumps(line) + b'\n' for line in lines))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            st = os.stat(self.path)
+            self._inode, self._offset, self._synced = st.st_ino, st.st_size, st.st_size
+            self._compacted = st.st_size
+
+    def _sync(self):
+        """fsync the outbox if it grew since the last time"""
+        try:
+            with open(self.path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size != self._synced:
+                    os.fsync(f.fileno())
+                    self._synced = size
+        except FileNotFoundError:
+            pass
+
+    # -- queueing ----------------------------------------------------------
+
+    def enqueue(self, messages):
+        """Queue ``{'channel', 'to', 'site', 'record', 'header'}`` messages
+
+        A bill already waiting to go out on a channel isn't queued twice.
+        Returns the number queued.
+        """
+        now = round(time.time(), 3)
+
+        def entries(outbox):
+            fresh = {}
+            for message in messages:
+                key = f"{message['site']}:{message['record'].get('bill_no')}:{message['channel']}"
+                if key not in outbox._keys and key not in fresh:
+                    fresh[key] = dict(message, op='queue', id=uuid.uuid4().hex, key=key, at=now)
+            return list(fresh.values())
+
+        queued = self._append(entries)
+        self.start()
+        return len(queued)
+
+    def requeue_dead(self):
+        """Queue every dead letter again, with its attempts reset; returns how many"""
+        with self._locked():
+            letters = self.dead_letters(None)
+            if letters:
+                os.truncate(self.dead_path, 0)
+        fields = ('channel', 'to', 'site', 'record', 'header')
+        return self.enqueue([{field: letter[field] for field in fields} for letter in letters])
+
+    def dead_letters(self, limit=20):
+        """The latest ``limit`` dead letters (all with None), oldest first"""
+        try:
+            with open(self.dead_path, 'rb') as f:
+                letters = [loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+        return letters if limit is None else letters[-limit:]
+
+    def stats(self):
+        with self._condition:
+            self._refresh()
+            return {
+                'pending': len(self.pending),
+                'retrying': sum(1 for message in self.pending.values() if message['attempts']),
+                'sending': len(self._in_flight),
+                'oldest': min((message['at'] for message in self.pending.values()), default=None),
+                'sender': self._sender_file is not None,
+                **self.counts,
+            }
+
+    def wait_idle(self, timeout=None):
+        """Wait until nothing is pending; returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                self._refresh()
+                if not self.pending:
+                    return True
+                remaining = POLL_INTERVAL if deadline is None else min(POLL_INTERVAL, deadline - time.monotonic())
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+
+    # -- sending -----------------------------------------------------------
+
+    def start(self):
+        """Start the dispatcher and workers of this process, if not running"""
+        if not self.channels:
+            return
+        with self._condition:
+            if self._pid == os.getpid() or self._closed:
+                return
+            # Threads and the sender lock don't survive a fork
+            self._pid = os.getpid()
+            self._sender_file = None
+            self._batches = queue.Queue()
+            self._threads = [threading.Thread(target=self._dispatch, name='outbox-dispatcher', daemon=True)]
+            self._threads += [threading.Thread(target=self._work, name=f"outbox-worker-{number}", daemon=True)
+                              for number in range(self.workers)]
+            for thread in self._threads:
+                thread.start()
+        atexit.register(self.close)
+
+    def close(self):
+        """Stop sending; batches being sent are finished first"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._batches is not None:
+            for _ in range(self.workers):
+                self._batches.put(None)
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(5)
+        if self._sender_file is not None:
+            self._sender_file.close()
+            self._sender_file = None
+
+    def _become_sender(self):
+        os.makedirs(self.directory, exist_ok=True)
+        f = open(os.path.join(self.directory, 'sender.lock'), 'a')
+        if fcntl:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                return False
+        self._sender_file = f
+        return True
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                if self._closed:
+                    return
+            try:
+                if self._sender_file is None and not self._become_sender():
+                    with self._condition:
+                        self._condition.wait(POLL_INTERVAL)
+                    continue
+                self._sync()
+                if self._offset > max(COMPACT_BYTES, 2 * self._compacted):
+                    self._compact()
+                with self._condition:
+                    self._refresh()
+                    wait = self._hand_out()
+                    if wait > 0:
+                        self._condition.wait(wait)
+            except Exception as e:
+                print(f"Error dispatching bill deliveries: {e}")
+                time.sleep(POLL_INTERVAL)
+
+    def _hand_out(self):
+        """Queue batches of ready messages for the workers; returns seconds to wait"""
+        now = time.time()
+        # Enough queued to keep every worker busy, the rest stays in the heap
+        room = self.workers * self.batch_size * 2 - len(self._in_flight)
+        if room < self.batch_size and self._in_flight:
+            # Wait for a whole batch worth of room rather than send small batches
+            return POLL_INTERVAL
+        batches = {}
+        while self._ready and room > 0 and self._ready[0][0] <= now:
+            next_at, _, message_id = heapq.heappop(self._ready)
+            message = self.pending.get(message_id)
+            if message is None or message['next_at'] != next_at or message_id in self._in_flight:
+                continue  # sent, rescheduled or already on its way
+            self._in_flight.add(message_id)
+            room -= 1
+            batch = batches.setdefault(message['channel'], [])
+            batch.append(message)
+            if len(batch) == self.batch_size:
+                self._batches.put(batches.pop(message['channel']))
+        for batch in batches.values():
+            self._batches.put(batch)
+        if room <= 0:
+            return POLL_INTERVAL
+        return min(POLL_INTERVAL, self._ready[0][0] - now) if self._ready else POLL_INTERVAL
+
+    def _work(self):
+        transports = self.transports()
+        try:
+            while True:
+                try:
+                    batch = self._batches.get(timeout=IDLE_SECONDS)
+                except queue.Empty:
+                    for transport in transports.values():
+                        transport.close()
+                    continue
+                if batch is None:
+                    return
+                try:
+                    results = self._send(transports, batch)
+                except Exception as e:
+                    results = [DeliveryError(f"{type(e).__name__}: {e}")] * len(batch)
+                try:
+                    self._finish(batch, results)
+                except Exception as e:
+                    print(f"Error recording bill deliveries: {e}")
+                    with self._condition:
+                        self._in_flight.difference_update(message['id'] for message in batch)
+        finally:
+            for transport in transports.values():
+                transport.close()
+
+    def _send(self, transports, batch):
+        transport = transports.get(batch[0]['channel'])
+        if transport is None:
+            return [DeliveryError(f"no transport for {batch[0]['channel']}")] * len(batch)
+        results = [None] * len(batch)
+        rendered = []
+        for index, message in enumerate(batch):
+            try:
+                rendered.append((index, message, self._render(message)))
+            except Exception as e:
+                results[index] = DeliveryError(f"rendering failed: {e}", permanent=True)
+        sent = transport.send([(message, pdf) for _, message, pdf in rendered])
+        for (index, _, _), result in zip(rendered, sent):
+            results[index] = result
+        return results
+
+    def _render(self, message):
+        """A bill's PDF; a worker wanting one another is rendering waits for it"""
+        bill = message['key'].rpartition(':')[0]
+        with self._rendered_lock:
+            future = self._rendered.get(bill)
+            rendering = future is None
+            if rendering:
+                future = self._rendered[bill] = Future()
+                while len(self._rendered) > RENDER_CACHE:
+                    self._rendered.popitem(last=False)
+        if rendering:
+            try:
+                future.set_result(self.render(message['record'], message['header']))
+            except Exception as e:
+                future.set_exception(e)
+                with self._rendered_lock:
+                    self._rendered.pop(bill, None)
+        return future.result()
+
+    def _finish(self, batch, results):
+        """Record a batch's results in one append"""
+        now = time.time()
+        entries, dead = [], []
+        for message, result in zip(batch, results):
+            if result is None:
+                entries.append({'op': 'sent', 'id': message['id'], 'at': round(now, 3)})
+                continue
+            attempts = message['attempts'] + 1
+            if result.permanent or attempts >= self.max_attempts:
+                entries.append({'op': 'dead', 'id': message['id'], 'at': round(now, 3)})
+                dead.append(dict(message, attempts=attempts, error=str(result), dead_at=round(now, 3)))
+            else:
+                entries.append({'op': 'retry', 'id': message['id'], 'attempts': attempts,
+                                'next_at': round(now + backoff(attempts), 3), 'error': str(result)})
+        self._append(entries, dead, [message['id'] for message in batch])
@@ -0,0 +1,159 @@
+"""Bill events for live dashboards.
+
+Events of a site are appended as JSON Lines to ``<directory>/<site>.jsonl``,
+which every worker process can see.  Listeners follow that file from a
+byte offset.  Publishing wakes the listeners of the same process at once,
+and listeners in other workers notice the new line on their next poll.
+Each log file starts with a header carrying its number, and an event's id
+is ``<file number>:<offset after it>``, so a reconnecting EventSource
+(``Last-Event-ID``) resumes exactly where it stopped.
+
+The log is rotated to ``<site>.jsonl.old`` once it passes
+``MAX_LOG_BYTES`` and the next file gets the next number.  Listeners finish
+the old file before switching, and answer with a ``resync`` event (the page
+reloads) when they skipped a whole file or get an id from an older one.
+"""
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines
+    fcntl = None
+
+from parking.serialization import dumps, loads
+
+POLL_INTERVAL = 0.5
+KEEPALIVE_INTERVAL = 15
+MAX_LOG_BYTES = 1024 * 1024
+
+
+def events_dir(data_dir):
+    """Where the event logs of a storage root live"""
+    return os.path.join(data_dir, '.events')
+
+
+def _inode(path):
+    try:
+        return os.stat(path).st_ino
+    except OSError:
+        return None
+
+
+def _header(number):
+    return dumps({'type': 'log', 'file': number}) + b'\n'
+
+
+def _open_log(path):
+    """Open a log file and return ``(stream, file number)`` or ``(None, 0)``"""
+    try:
+        stream = open(path, 'rb')
+    except FileNotFoundError:
+        return None, 0
+    header = stream.readline()
+    if not header.endswith(b'\n'):
+        # Created but the header isn't written yet
+        stream.close()
+        return None, 0
+    return stream, loads(header)['file']
+
+
+class EventBus:
+    """Publish events per site and follow them from any worker"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._condition = threading.Condition()
+        self._sequence = 0
+
+    def _path(self, site_id):
+        return os.path.join(self.directory, f"{site_id}.jsonl")
+
+    def publish(self, site_id, event):
+        """Append ``event`` (a dict with a ``type``) to the site's log"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(site_id)
+        with open(f"{path}.lock", 'a') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            with open(path, 'ab') as f:
+                if f.tell() == 0:
+                    f.write(_header(1))
+                f.write(dumps(event) + b'\n')
+                size = f.tell()
+            if size > MAX_LOG_BYTES:
+                with open(path, 'rb') as f:
+                    number = loads(f.readline())['file']
+                os.replace(path, f"{path}.old")
+                with open(path, 'wb') as f:
+                    f.write(_header(number + 1))
+        with self._condition:
+            self._sequence += 1
+            self._condition.notify_all()
+
+    def listen(self, site_id, last_id=None, timeout=None):
+        """Yield ``(event_id, event)`` as events arrive, ``None`` as a keep-alive
+
+        Without ``last_id`` only events published from now on are yielded:
+        from this call, not from the first iteration, so nothing published
+        while a response starts streaming is lost.  Stops after ``timeout``
+        seconds so streaming workers are recycled; clients reconnect with
+        the last id they saw.
+        """
+        path = self._path(site_id)
+        stream, number = _open_log(path)
+        if stream is not None:
+            stream.seek(0, os.SEEK_END)
+        resync = False
+        if last_id:
+            try:
+                last_number, offset = (int(part) for part in last_id.split(':'))
+            except ValueError:
+                last_number, offset = None, 0
+            if stream is not None and last_number == number and offset <= stream.tell():
+                stream.seek(offset)
+            else:
+                resync = True
+        return self._follow(path, stream, number, resync, timeout)
+
+    def _follow(self, path, stream, number, resync, timeout):
+        if resync:
+            yield None, {'type': 'resync'}
+        deadline = time.monotonic() + timeout if timeout else None
+        quiet_since = time.monotonic()
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                with self._condition:
+                    seen = self._sequence
+                delivered = False
+                if stream is not None:
+                    for line in iter(stream.readline, b''):
+                        if not line.endswith(b'\n'):
+                            # A line still being written; read it next time
+                            stream.seek(-len(line), os.SEEK_CUR)
+                            break
+                        delivered = True
+                        yield f"{number}:{stream.tell()}", loads(line)
+                # An open file keeps its inode, so a different one means rotation
+                current = _inode(path)
+                if current is not None and (stream is None or current != os.fstat(stream.fileno()).st_ino):
+                    new_stream, new_number = _open_log(path)
+                    if new_stream is not None:
+                        if stream is not None:
+                            stream.close()
+                        if new_number != number + 1:
+                            yield None, {'type': 'resync'}
+                        stream, number = new_stream, new_number
+                        continue
+                if delivered:
+                    quiet_since = time.monotonic()
+                    continue
+                if time.monotonic() - quiet_since >= KEEPALIVE_INTERVAL:
+                    quiet_since = time.monotonic()
+                    yield None
+                with self._condition:
+                    self._condition.wait_for(lambda: self._sequence != seen, POLL_INTERVAL)
+        finally:
+            if stream is not None:
+                stream.close()
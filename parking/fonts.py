@@ -0,0 +1,315 @@
+"""Unicode TrueType fonts for bill PDFs, parsed and subset once per process.
+
+The core PDF fonts only cover Latin-1, so Tamil names or the rupee sign
+can't be printed with them.  Embedding a TrueType font with plain fpdf2
+costs about 20x a core-font bill: every document parses the font file
+again, and on output re-subsets it and re-serializes the subset with
+fontTools.  Here instead:
+
+* metrics and glyph tables of each font file are parsed once per process
+  (:func:`font_template`) and copied into each new document
+  (:func:`install_fonts`);
+* each document starts its subset with a fixed glyph set (printable ASCII,
+  the rupee sign and, for the Tamil font, the Tamil block), so almost every
+  bill uses the same subset;
+* the subset font, its CID-to-glyph map and width table are built once per
+  glyph set and reused by :class:`CachedFontOutputProducer`.
+
+Fonts are looked up by file name in ``PARKING_FONT_DIR`` and the usual
+system font directories: Noto Sans (or DejaVu Sans) for text and Noto
+Sans Tamil (or Lohit Tamil / Latha) as fallback for Tamil characters.
+Without them bills use the core Arial font and unprintable characters are
+replaced.
+
+Written against the fpdf2 internals of the version in requirements.txt.
+"""
+from collections import OrderedDict
+import copy
+import functools
+import io
+import os
+import re
+import threading
+import zlib
+
+from fontTools import subset as ftsubset
+from fontTools import ttLib
+from fpdf import FPDF
+from fpdf.fpdf import SubsetMap
+from fpdf.output import CIDSystemInfo, OutputProducer, PDFFont, _tt_font_widths
+from fpdf.syntax import Name, PDFArray, PDFContentStream, PDFObject
+
+FONT_DIRS = [
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fonts'),
+    '/usr/share/fonts',
+    '/usr/local/share/fonts',
+    os.path.expanduser('~/.fonts'),
+    '/Library/Fonts',
+    'C:\\Windows\\Fonts',
+]
+
+# Family used in the PDF -> candidate files per style, best first
+FONT_FILES = {
+    'billsans': [
+        {'': 'NotoSans-Regular.ttf', 'B': 'NotoSans-Bold.ttf', 'I': 'NotoSans-Italic.ttf'},
+        {'': 'DejaVuSans.ttf', 'B': 'DejaVuSans-Bold.ttf', 'I': 'DejaVuSans-Oblique.ttf'},
+    ],
+    'billtamil': [
+        {'': 'NotoSansTamil-Regular.ttf', 'B': 'NotoSansTamil-Bold.ttf'},
+        {'': 'Lohit-Tamil.ttf'},
+        {'': 'latha.ttf', 'B': 'lathab.ttf'},
+    ],
+}
+TEXT_FAMILY = 'billsans'
+FALLBACK_FAMILIES = ['billtamil']
+
+# Glyphs every document's subset starts with, so bills share subsets
+BASE_CHARS = {
+    'billsans': ''.join(chr(code) for code in range(0x20, 0x7F)) + '\u20b9\u2013\u2014\u2018\u2019\u201c\u201d',
+    'billtamil': ''.join(chr(code) for code in range(0x0B80, 0x0C00)),
+}
+
+MAX_SUBSETS = 256
+# Subsets are deflated once and reused, so the slowest level costs nothing per bill
+COMPRESSION_LEVEL = 9
+
+_FONT_SELECTION = re.compile(rb'/F(\d+) [\d.]+ Tf')
+
+_lock = threading.Lock()
+_templates = {}
+_base_subsets = {}
+_subsets = OrderedDict()
+
+
+def font_dirs():
+    extra = os.environ.get('PARKING_FONT_DIR')
+    return ([extra] if extra else []) + FONT_DIRS
+
+
+@functools.lru_cache(maxsize=None)
+def _files_by_name(directories):
+    found = {}
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            for name in files:
+                found.setdefault(name.lower(), os.path.join(root, name))
+    return found
+
+
+def find_fonts():
+    """``{family: {style: path}}`` of the font families available here"""
+    files = _files_by_name(tuple(font_dirs()))
+    fonts = {}
+    for family, candidates in FONT_FILES.items():
+        for styles in candidates:
+            paths = {style: files.get(name.lower()) for style, name in styles.items()}
+            if paths['']:
+                fonts[family] = {style: path for style, path in paths.items() if path}
+                break
+    return fonts
+
+
+def font_template(path, style=''):
+    """fpdf2 font entry of ``path``, parsed on first use only"""
+    key = (path, style)
+    template = _templates.get(key)
+    if template is None:
+        with _lock:
+            template = _templates.get(key)
+            if template is None:
+                pdf = FPDF()
+                pdf.add_font('template', style, path)
+                template = pdf.fonts[f'template{style}']
+                # Reserved codes of a fresh subset (before anything is picked)
+                template['identities'] = list(template['subset'].dict())
+                # Only ever used for membership tests
+                template['cmap'] = frozenset(template['cmap'])
+                _templates[key] = template
+    return template
+
+
+def _base_subset(family, path, style):
+    """A new document's subset of a font, with the family's base glyphs picked"""
+    key = (family, path, style)
+    base = _base_subsets.get(key)
+    if base is None:
+        template = font_template(path, style)
+        base = SubsetMap(template['identities'])
+        for char in BASE_CHARS.get(family, ''):
+            if ord(char) in template['cmap']:
+                base.pick(ord(char))
+        _base_subsets[key] = base
+    subset = copy.copy(base)
+    subset._map = dict(base._map)
+    subset._reserved = list(base._reserved)
+    return subset
+
+
+def install_fonts(pdf, fonts=None):
+    """Add the Unicode fonts to ``pdf``; returns the text family or None
+
+    Characters the text font lacks (Tamil) fall back to the Tamil font.
+    """
+    fonts = find_fonts() if fonts is None else fonts
+    if TEXT_FAMILY not in fonts:
+        return None
+    for family, styles in fonts.items():
+        for style in ('', 'B', 'I'):
+            path = styles.get(style)
+            if path is None:
+                if family == TEXT_FAMILY:
+                    # Bills use bold and italic text; print it with the regular font
+                    pdf.fonts[f"{family}{style}"] = pdf.fonts[family]
+                continue
+            template = font_template(path, style)
+            entry = dict(template)
+            entry['i'] = len(pdf.fonts) + 1
+            entry['fontkey'] = f"{family}{style}"
+            # Both are changed while a document is written
+            entry['desc'] = copy.copy(template['desc'])
+            entry['subset'] = _base_subset(family, path, style)
+            pdf.fonts[entry['fontkey']] = entry
+    fallbacks = [family for family in FALLBACK_FAMILIES if family in fonts]
+    if fallbacks:
+        pdf.set_fallback_fonts(fallbacks, exact_match=False)
+    return TEXT_FAMILY
+
+
+def has_glyphs(pdf, text):
+    """Whether the TrueType fonts of ``pdf`` can draw every character of ``text``"""
+    cmaps = [font['cmap'] for font in pdf.fonts.values() if font['type'] == 'TTF']
+    return all(any(ord(char) in cmap for cmap in cmaps) for char in set(text) if not char.isspace())
+
+
+class _CompressedStream(PDFContentStream):
+    """A stream whose (cached) contents are already deflated"""
+
+    def __init__(self, compressed, length1=None):
+        PDFObject.__init__(self)
+        self._contents = compressed
+        self.filter = Name('FlateDecode')
+        self.length = len(compressed)
+        if length1 is not None:
+            self.length1 = length1
+
+
+def _build_subset(font, codes):
+    """Subset font file, CIDToGIDMap, widths and ToUnicode of one glyph set"""
+    fonttools_font = ttLib.TTFont(file=font['ttffile'], recalcTimestamp=False, fontNumber=0, lazy=True)
+    cmap = fonttools_font['cmap'].getBestCmap()
+    used = {code: mapped for code, mapped in codes if code}
+    options = ftsubset.Options(notdef_outline=True, recommended_glyphs=True)
+    options.drop_tables += ['FFTM', 'GDEF', 'GPOS', 'GSUB', 'MATH', 'hdmx']
+    subsetter = ftsubset.Subsetter(options)
+    subsetter.populate(glyphs=[cmap[code] for code in used if code in cmap])
+    subsetter.subset(fonttools_font)
+    cid_to_gid = bytearray(256 * 256 * 2)
+    for code, mapped in used.items():
+        glyph = fonttools_font.getGlyphID(cmap.get(code, '.notdef'))
+        cid_to_gid[mapped * 2] = glyph >> 8
+        cid_to_gid[mapped * 2 + 1] = glyph & 0xFF
+    output = io.BytesIO()
+    fonttools_font.save(output)
+    font_file = output.getvalue()
+
+    bf_chars = []
+    for code, mapped in codes:
+        if code > 0xFFFF:
+            high = 0xD800 | (code - 0x10000) >> 10
+            low = 0xDC00 | (code & 0x3FF)
+            bf_chars.append(f"<{mapped:04X}> <{high:04X}{low:04X}>\n")
+        else:
+            bf_chars.append(f"<{mapped:04X}> <{code:04X}>\n")
+    to_unicode = (
+        "/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n"
+        "/CIDSystemInfo\n<</Registry (Adobe)\n/Ordering (UCS)\n/Supplement 0\n>> def\n"
+        "/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n"
+        "1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n"
+        f"{len(bf_chars)} beginbfchar\n{''.join(bf_chars)}endbfchar\n"
+        "endcmap\nCMapName currentdict /CMap defineresource pop\nend\nend"
+    )
+    return {
+        'font_file': zlib.compress(font_file, COMPRESSION_LEVEL),
+        'font_file_length': len(font_file),
+        'cid_to_gid': zlib.compress(bytes(cid_to_gid), COMPRESSION_LEVEL),
+        'widths': _tt_font_widths(font, max(used)),
+        'to_unicode': zlib.compress(to_unicode.encode('latin-1'), COMPRESSION_LEVEL),
+    }
+
+
+def cached_subset(font):
+    """Subset data of ``font`` for the glyphs its document used"""
+    codes = tuple(sorted(font['subset'].dict().items()))
+    key = (font['ttffile'], codes)
+    with _lock:
+        data = _subsets.get(key)
+        if data is not None:
+            _subsets.move_to_end(key)
+            return data
+    data = _build_subset(font, codes)
+    with _lock:
+        _subsets[key] = data
+        while len(_subsets) > MAX_SUBSETS:
+            _subsets.popitem(last=False)
+    return data
+
+
+class CachedFontOutputProducer(OutputProducer):
+    """fpdf2 output that embeds TrueType subsets from :func:`cached_subset`
+
+    Pass as ``pdf.output(output_producer_class=CachedFontOutputProducer)``.
+    The PDF objects are the ones fpdf2 writes itself, but only fonts the
+    pages select are embedded, not every style :func:`install_fonts` added.
+    """
+
+    def _add_pages(self, *args, **kwargs):
+        self._used_fonts = set()
+        for page in self.fpdf.pages.values():
+            self._used_fonts.update(int(index) for index in _FONT_SELECTION.findall(page.contents))
+        return super()._add_pages(*args, **kwargs)
+
+    def _add_fonts(self):
+        font_objs_per_index = {}
+        # Styles without a file of their own share the regular font's entry
+        fonts = {font['i']: font for font in self.fpdf.fonts.values()}
+        for _, font in sorted(fonts.items()):
+            if font['i'] not in self._used_fonts:
+                continue
+            if font['type'] == 'core':
+                encoding = 'WinAnsiEncoding' if font['name'] not in ('Symbol', 'ZapfDingbats') else None
+                core_font_obj = PDFFont(subtype='Type1', base_font=font['name'], encoding=encoding)
+                self._add_pdf_obj(core_font_obj, 'fonts')
+                font_objs_per_index[font['i']] = core_font_obj
+                continue
+            data = cached_subset(font)
+            fontname = f"MPDFAA+{font['name']}"
+            composite_font_obj = PDFFont(subtype='Type0', base_font=fontname, encoding='Identity-H')
+            self._add_pdf_obj(composite_font_obj, 'fonts')
+            font_objs_per_index[font['i']] = composite_font_obj
+
+            cid_font_obj = PDFFont(subtype='CIDFontType2', base_font=fontname,
+                                   d_w=font['desc'].missing_width, w=data['widths'])
+            self._add_pdf_obj(cid_font_obj, 'fonts')
+            composite_font_obj.descendant_fonts = PDFArray([cid_font_obj])
+
+            to_unicode_obj = _CompressedStream(data['to_unicode'])
+            self._add_pdf_obj(to_unicode_obj, 'fonts')
+            composite_font_obj.to_unicode = to_unicode_obj
+
+            cid_system_info_obj = CIDSystemInfo()
+            self._add_pdf_obj(cid_system_info_obj, 'fonts')
+            cid_font_obj.c_i_d_system_info = cid_system_info_obj
+
+            font_descriptor_obj = font['desc']
+            font_descriptor_obj.font_name = Name(fontname)
+            self._add_pdf_obj(font_descriptor_obj, 'fonts')
+            cid_font_obj.font_descriptor = font_descriptor_obj
+
+            cid_to_gid_map_obj = _CompressedStream(data['cid_to_gid'])
+            self._add_pdf_obj(cid_to_gid_map_obj, 'fonts')
+            cid_font_obj.c_i_d_to_g_i_d_map = cid_to_gid_map_obj
+
+            font_file_cs_obj = _CompressedStream(data['font_file'], length1=data['font_file_length'])
+            self._add_pdf_obj(font_file_cs_obj, 'fonts')
+            font_descriptor_obj.font_file2 = font_file_cs_obj
+        return font_objs_per_index
@@ -0,0 +1,46 @@
+"""Cache of rendered HTML fragments.
+
+Keys describe exactly the data a fragment was rendered from, e.g.
+``(site, generation, slot, period, record count)`` for the records of one
+slot card.  Shards are append-only within a generation, so a key never goes
+stale: a new bill changes the count of its own slot and period only, which
+makes every other fragment of the page a cache hit.  Old keys simply age
+out of the LRU.
+"""
+from collections import OrderedDict
+import threading
+
+
+class FragmentCache:
+    """Thread-safe LRU of rendered fragments"""
+
+    def __init__(self, max_entries=20000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            html = self._entries.get(key)
+            if html is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return html
+
+    def put(self, key, html):
+        with self._lock:
+            self._entries[key] = html
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,181 @@
+"""Bulk import of historical bills from CSV.
+
+Rows are read one at a time from the CSV stream, validated against the
+site's slots, the known vehicle types, years and payment modes, checked
+against bills already in the site's search index, and written in large
+batches with :meth:`ShardedStore.append_many`.  Memory stays bounded by the
+batch size plus one dedupe key per bill, and every batch costs one locked
+write per period, so importing n rows takes O(n) time.
+
+Expected columns (header names are case-insensitive)::
+
+    name,vehicle_no,vehicle_type,slot_number,month,year,payment_mode
+    bill_amount,bill_date,created_by,bill_no            (optional)
+
+``month`` is a month name or number.  Imported bills are numbered like new
+ones; a ``bill_no`` column from an older system is kept as ``legacy_bill_no``.
+
+Command line (see ``cmd_import`` in parking/__main__.py)::
+
+    python -m parking --site main import history.csv
+"""
+import csv
+import io
+import time
+from datetime import datetime
+
+from parking.inventory import PAYMENT_MODES, VEHICLE_TYPES, YEARS, normalize_key
+from parking.storage import MONTHS, record_amount
+
+REQUIRED_COLUMNS = ('name', 'vehicle_no', 'vehicle_type', 'slot_number', 'month', 'year',
+                    'payment_mode')
+BATCH_SIZE = 10000
+MAX_REPORTED_ERRORS = 100
+DEFAULT_AMOUNT = 'Rs. 1000.00'
+
+_MONTHS = {month.lower(): month for month in MONTHS}
+_MONTHS.update({month[:3].lower(): month for month in MONTHS})
+_MONTHS.update({str(number): month for number, month in enumerate(MONTHS, 1)})
+_MONTHS.update({f"{number:02d}": month for number, month in enumerate(MONTHS, 1)})
+_PAYMENT_MODES = {mode.lower(): mode for mode in PAYMENT_MODES}
+_YEARS = set(YEARS)
+
+
+class CsvFormatError(ValueError):
+    """The CSV as a whole can't be imported (e.g. missing columns)"""
+
+
+def dedupe_key(record):
+    """One monthly bill per vehicle, slot and period"""
+    month = str(record.get('month', ''))
+    return (normalize_key(record.get('vehicle_no', '')), _MONTHS.get(month.strip().lower(), month),
+            str(record.get('year', '')), record.get('slot_number', ''))
+
+
+def validate_row(row, site, created_by=None):
+    """Return ``(record, None)`` for a valid row or ``(None, error message)``"""
+    name = (row.get('name') or '').strip()
+    vehicle_no = (row.get('vehicle_no') or '').strip()
+    if not name or not vehicle_no:
+        return None, "name and vehicle_no are required"
+    vehicle_type = (row.get('vehicle_type') or '').strip().lower()
+    if vehicle_type not in VEHICLE_TYPES:
+        return None, f"unknown vehicle type {row.get('vehicle_type')!r}"
+    slot_number = (row.get('slot_number') or '').strip()
+    if site.get_slot(slot_number) is None:
+        return None, f"unknown parking slot {slot_number!r}"
+    if not site.slot_allows(slot_number, vehicle_type):
+        return None, f"slot {slot_number} does not accept {vehicle_type}"
+    month = _MONTHS.get((row.get('month') or '').strip().lower())
+    if month is None:
+        return None, f"unknown month {row.get('month')!r}"
+    year = (row.get('year') or '').strip()
+    if year not in _YEARS:
+        return None, f"year {year!r} outside {YEARS[0]}-{YEARS[-1]}"
+    payment_mode = _PAYMENT_MODES.get((row.get('payment_mode') or '').strip().lower())
+    if payment_mode is None:
+        return None, f"unknown payment mode {row.get('payment_mode')!r}"
+
+    amount = (row.get('bill_amount') or '').strip()
+    if amount:
+        if not record_amount({'bill_amount': amount}):
+            return None, f"invalid bill amount {amount!r}"
+        amount = f"Rs. {record_amount({'bill_amount': amount}):.2f}"
+    bill_date = (row.get('bill_date') or '').strip()
+    if bill_date:
+        for pattern in ("%d-%m-%Y %H:%M:%S", "%d-%m-%Y", "%Y-%m-%d"):
+            try:
+                bill_date = datetime.strptime(bill_date, pattern).strftime("%d-%m-%Y %H:%M:%S")
+                break
+            except ValueError:
+                continue
+        else:
+            return None, f"invalid bill date {bill_date!r}"
+    else:
+        # Paper history rarely has the issue date; use the start of the period
+        bill_date = f"01-{MONTHS.index(month) + 1:02d}-{year} 00:00:00"
+
+    record = {
+        'name': name,
+        'vehicle_no': vehicle_no,
+        'vehicle_type': vehicle_type,
+        'site': site.id,
+        'slot_number': slot_number,
+        'month': month,
+        'year': year,
+        'payment_mode': payment_mode,
+        'bill_date': bill_date,
+        'bill_amount': amount or DEFAULT_AMOUNT,
+        'created_by': (row.get('created_by') or '').strip() or created_by or 'import',
+    }
+    if (row.get('bill_no') or '').strip():
+        record['legacy_bill_no'] = row['bill_no'].strip()
+    return record, None
+
+
+def import_csv(stream, store, site, search=None, created_by=None, batch_size=BATCH_SIZE, ledger=None):
+    """Import bills from a text ``stream``; yields progress after every batch
+
+    Imported bills are history, so they go on the ``ledger`` as settled.
+
+    Each progress dict has ``rows``, ``imported``, ``duplicates``,
+    ``invalid``, the first ``errors`` as ``(line, message)`` and
+    ``seconds``.  The last one yielded is the final report.
+    """
+    started = time.perf_counter()
+    reader = csv.DictReader(stream)
+    if reader.fieldnames is None:
+        raise CsvFormatError("the CSV file is empty")
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    missing = [column for column in REQUIRED_COLUMNS if column not in reader.fieldnames]
+    if missing:
+        raise CsvFormatError(f"missing columns: {', '.join(missing)}")
+
+    index = search.get(site.id) if search is not None else None
+    existing = store.iter_records(site.id) if index is None else index.records()
+    seen = {dedupe_key(record) for record in existing}
+
+    stats = {'rows': 0, 'imported': 0, 'duplicates': 0, 'invalid': 0, 'errors': [], 'seconds': 0.0}
+    batch = []
+
+    def commit():
+        if batch:
+            store.append_many(site.id, batch, bill_prefix=site.bill_prefix)
+            if search is not None:
+                search.add_many(site.id, batch)
+            if ledger is not None:
+                ledger.add_bills(site.id, batch, settled=True)
+        stats['imported'] += len(batch)
+        batch.clear()
+        stats['seconds'] = time.perf_counter() - started
+        return dict(stats, errors=list(stats['errors']))
+
+    for row in reader:
+        stats['rows'] += 1
+        record, error = validate_row(row, site, created_by)
+        if error:
+            stats['invalid'] += 1
+            if len(stats['errors']) < MAX_REPORTED_ERRORS:
+                stats['errors'].append((reader.line_num, error))
+            continue
+        key = dedupe_key(record)
+        if key in seen:
+            stats['duplicates'] += 1
+            continue
+        seen.add(key)
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield commit()
+    yield commit()
+
+
+def format_progress(stats):
+    return (f"{stats['rows']:,d} rows: {stats['imported']:,d} imported, "
+            f"{stats['duplicates']:,d} duplicates, {stats['invalid']:,d} invalid "
+            f"({stats['seconds']:.1f}s)")
+
+
+def open_csv(binary):
+    """Text view of an uploaded or opened binary CSV (BOM tolerant)"""
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+
@@ -0,0 +1,219 @@
+"""Parking site, zone and slot inventory.
+
+The inventory is read once from a JSON file (``PARKING_SITES_FILE``) and kept
+in memory with per-site indexes, so slot lookups and as-you-type slot search
+stay cheap even for sites with thousands of slots.  Without a sites file the
+inventory falls back to the original single lot with 14 slots.
+
+Example sites file::
+
+    {
+      "sites": [
+        {
+          "id": "main",
+          "name": "Vengatesan Car Parking",
+          "address": "Tittagudi",
+          "contact": "9791365506",
+          "bill_prefix": "VP",
+          "bill_languages": ["en", "ta"],
+          "tariffs": {"car": {"hourly": 40, "daily": 300}},
+          "zones": [
+            {"id": "A", "prefix": "SLOT-", "start": 1, "count": 14},
+            {"id": "B", "prefix": "B-", "count": 200, "vehicle_types": ["bike"]},
+            {"id": "C", "slots": ["C-01", {"id": "C-02", "vehicle_types": ["car"]}]}
+          ]
+        }
+      ]
+    }
+"""
+from bisect import bisect_left
+from itertools import chain
+import json
+import os
+import re
+
+DEFAULT_SITE = 'main'
+VEHICLE_TYPES = ['bike', 'car', 'auto', 'other']
+# Offered by the billing and dues forms and accepted by the CSV importer
+PAYMENT_MODES = ['Cash', 'Online', 'Card', 'UPI']
+YEARS = [str(year) for year in range(2020, 2050)]
+
+# Pay-and-park rates in rupees (see parking/tickets.py); a site's "tariffs"
+# override them per vehicle type and field
+DEFAULT_TARIFFS = {
+    'bike': {'grace_minutes': 10, 'hourly': 10, 'daily': 60},
+    'car': {'grace_minutes': 10, 'hourly': 30, 'daily': 250},
+    'auto': {'grace_minutes': 10, 'hourly': 20, 'daily': 150},
+    'other': {'grace_minutes': 10, 'hourly': 30, 'daily': 250},
+}
+
+DEFAULT_SITES = {
+    'sites': [
+        {
+            'id': DEFAULT_SITE,
+            'name': 'Vengatesan Car Parking',
+            'address': 'Tittagudi',
+            'contact': '9791365506',
+            'bill_prefix': 'VP',
+            'zones': [
+                {'id': 'A', 'name': 'Main', 'prefix': 'SLOT-', 'start': 1, 'count': 14},
+            ],
+        }
+    ]
+}
+
+_NON_ALNUM = re.compile(r'[^0-9A-Z]+')
+_SITE_ID = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+def normalize_key(text):
+    """Upper-case ``text`` and drop everything but letters and digits"""
+    return _NON_ALNUM.sub('', str(text).upper())
+
+
+def _expand_zone(site_id, zone):
+    """Yield slot dicts for a zone given as a range or an explicit list"""
+    zone_types = zone.get('vehicle_types') or list(VEHICLE_TYPES)
+    if 'slots' in zone:
+        for entry in zone['slots']:
+            if isinstance(entry, str):
+                entry = {'id': entry}
+            yield {
+                'id': entry['id'],
+                'site': site_id,
+                'zone': zone['id'],
+                'vehicle_types': entry.get('vehicle_types') or zone_types,
+            }
+        return
+    start = int(zone.get('start', 1))
+    count = int(zone['count'])
+    width = max(2, len(str(start + count - 1)))
+    prefix = zone.get('prefix', f"{zone['id']}-")
+    for number in range(start, start + count):
+        yield {
+            'id': f"{prefix}{number:0{width}d}",
+            'site': site_id,
+            'zone': zone['id'],
+            'vehicle_types': zone_types,
+        }
+
+
+class Site:
+    """One parking site with its zones, slots and slot search indexes"""
+
+    def __init__(self, config):
+        self.id = config['id']
+        if not _SITE_ID.match(self.id):
+            raise ValueError(f"Invalid site id: {self.id!r}")
+        self.name = config.get('name', self.id)
+        self.address = config.get('address', '')
+        self.contact = config.get('contact', '')
+        # Bill numbers look like VP202501-0007 (prefix, period, sequence)
+        self.bill_prefix = config.get('bill_prefix', 'VP')
+        # "ta" adds Tamil labels to bills (needs the fonts of parking/fonts.py)
+        self.bill_languages = list(config.get('bill_languages', ['en']))
+        self.tariffs = {vehicle_type: dict(tariff, **config.get('tariffs', {}).get(vehicle_type, {}))
+                        for vehicle_type, tariff in DEFAULT_TARIFFS.items()}
+        self.zones = [
+            {'id': zone['id'], 'name': zone.get('name', zone['id'])}
+            for zone in config.get('zones', [])
+        ]
+        self.slots = {}
+        for zone in config.get('zones', []):
+            for slot in _expand_zone(self.id, zone):
+                if slot['id'] in self.slots:
+                    raise ValueError(f"Duplicate slot {slot['id']!r} in site {self.id!r}")
+                self.slots[slot['id']] = slot
+        self.slot_ids = list(self.slots)
+
+        # Sorted (key, slot_id) pairs for prefix search on the full slot id
+        # and on its number alone, so both "SLOT-0" and "7" find SLOT-07.
+        keys = []
+        for slot_id in self.slot_ids:
+            keys.append((normalize_key(slot_id), slot_id))
+            digits = re.search(r'(\d+)$', slot_id)
+            if digits:
+                keys.append((digits.group(1).lstrip('0') or '0', slot_id))
+        keys.sort()
+        self._search_keys = [key for key, _ in keys]
+        self._search_ids = [slot_id for _, slot_id in keys]
+
+    def __len__(self):
+        return len(self.slots)
+
+    def header(self):
+        """Business details printed on bills and page headers"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'address': self.address,
+            'contact': self.contact,
+            'languages': self.bill_languages,
+        }
+
+    def get_slot(self, slot_id):
+        return self.slots.get(slot_id)
+
+    def slot_allows(self, slot_id, vehicle_type):
+        """Return True if ``slot_id`` exists and accepts ``vehicle_type``"""
+        slot = self.slots.get(slot_id)
+        return slot is not None and vehicle_type in slot['vehicle_types']
+
+    def search_slots(self, query='', vehicle_type=None, limit=20):
+        """Return up to ``limit`` slots whose id or number starts with ``query``"""
+        key = normalize_key(query)
+        if not key:
+            candidates = iter(self.slot_ids)
+        else:
+            stripped = key.lstrip('0') or key
+            candidates = self._prefix_ids(key)
+            if stripped != key:
+                candidates = chain(candidates, self._prefix_ids(stripped))
+        results = []
+        seen = set()
+        for slot_id in candidates:
+            if slot_id in seen:
+                continue
+            seen.add(slot_id)
+            slot = self.slots[slot_id]
+            if vehicle_type and vehicle_type not in slot['vehicle_types']:
+                continue
+            results.append(slot)
+            if len(results) >= limit:
+                break
+        return results
+
+    def _prefix_ids(self, key):
+        index = bisect_left(self._search_keys, key)
+        while index < len(self._search_keys) and self._search_keys[index].startswith(key):
+            yield self._search_ids[index]
+            index += 1
+
+
+class Inventory:
+    """All configured sites, indexed by site id"""
+
+    def __init__(self, config):
+        self.sites = {}
+        for site_config in config.get('sites', []):
+            site = Site(site_config)
+            self.sites[site.id] = site
+        if not self.sites:
+            raise ValueError("Inventory must define at least one site")
+        self.default_site = DEFAULT_SITE if DEFAULT_SITE in self.sites else next(iter(self.sites))
+
+    def get_site(self, site_id=None):
+        """Return the site for ``site_id``, or the default site if missing"""
+        return self.sites.get(site_id) or self.sites[self.default_site]
+
+    def site_list(self):
+        return [site.header() for site in self.sites.values()]
+
+
+def load_inventory(path=None):
+    """Load the inventory from ``path`` or ``PARKING_SITES_FILE``"""
+    path = path or os.environ.get('PARKING_SITES_FILE')
+    if path and os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return Inventory(json.load(f))
+    return Inventory(DEFAULT_SITES)
@@ -0,0 +1,349 @@
+"""Dues ledger: what every bill is owed, what was paid, what is still due.
+
+Bills and payments are entries of an append-only log per site, kept beside
+the generations like the bill counters, so resets and restores never lose a
+payment (bill numbers are never reused)::
+
+    <root>/<site>/ledger/checkpoint.json   state up to ``log_offset``
+    <root>/<site>/ledger/log.jsonl         entries since
+
+Each entry updates the maintained state in place: the bill's paid amount
+and the running balances of its vehicle and slot.  Bills with a balance are
+kept in ``outstanding``, sorted by due time, so the overdue report only
+reads the bills that are overdue.  Other workers catch up by replaying the
+log tail, as with the search index.
+
+Amounts are integer paise.  Bills on record before the ledger existed, and
+imported history, enter it as settled.
+"""
+from bisect import bisect_left, bisect_right, insort
+import math
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines
+    fcntl = None
+
+from parking.inventory import normalize_key
+from parking.serialization import dump_file, dump_lines, load_file, loads
+from parking.storage import record_amount
+
+# Bills are due this long after they are issued
+DUE_DAYS = 7
+CHECKPOINT_EVERY = 10000
+BATCH_SIZE = 10000
+
+
+def paise(rupees):
+    return round(float(rupees) * 100)
+
+
+def bill_entry(record, settled=False):
+    """Ledger entry of a saved bill record"""
+    issued_at = record.get('issued_at') or int(time.time())
+    return {
+        'type': 'bill',
+        'bill_no': record['bill_no'],
+        'name': record.get('name', ''),
+        'vehicle_no': record.get('vehicle_no', ''),
+        'slot_number': record.get('slot_number', ''),
+        'period': record.get('period'),
+        'amount': paise(record_amount(record)),
+        'due_at': int(issued_at) + DUE_DAYS * 86400,
+        'settled': settled,
+    }
+
+
+def payment_entry(bill_no, amount, mode=None, by=None):
+    """Ledger entry of a payment of ``amount`` paise"""
+    return {'type': 'payment', 'bill_no': bill_no, 'amount': amount,
+            'mode': mode, 'by': by, 'at': int(time.time())}
+
+
+def bill_status(bill):
+    if bill['paid'] >= bill['amount']:
+        return 'paid'
+    return 'partial' if bill['paid'] else 'unpaid'
+
+
+class Ledger:
+    """Bills, payments and running balances of one site"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.bills = {}
+        self.vehicles = {}
+        self.slots = {}
+        self.outstanding = []
+        self.log_offset = 0
+        self.checkpoint_entries = 0
+        self.entries = 0
+        self._lock = threading.Lock()
+
+    @property
+    def _checkpoint_path(self):
+        return os.path.join(self.directory, 'checkpoint.json')
+
+    @property
+    def _log_path(self):
+        return os.path.join(self.directory, 'log.jsonl')
+
+    def exists(self):
+        return os.path.exists(self._log_path) or os.path.exists(self._checkpoint_path)
+
+    # -- applying entries --------------------------------------------------
+
+    def _apply(self, entry):
+        self.entries += 1
+        bill = self.bills.get(entry['bill_no'])
+        if entry['type'] == 'bill':
+            if bill is not None:
+                return  # already on the ledger
+            bill = {field: entry[field] for field in
+                    ('bill_no', 'name', 'vehicle_no', 'slot_number', 'period', 'amount', 'due_at')}
+            bill['paid'] = 0
+            self.bills[bill['bill_no']] = bill
+            self._add_balance(bill, bill['amount'])
+            if bill['amount'] > 0:
+                insort(self.outstanding, (bill['due_at'], bill['bill_no']))
+            if entry.get('settled'):
+                self._apply_payment(bill, bill['amount'])
+        elif entry['type'] == 'payment' and bill is not None:
+            self._apply_payment(bill, entry['amount'])
+
+    def _apply_payment(self, bill, amount):
+        was_due = bill['paid'] < bill['amount']
+        bill['paid'] += amount
+        self._add_balance(bill, -amount)
+        if was_due and bill['paid'] >= bill['amount']:
+            position = bisect_left(self.outstanding, (bill['due_at'], bill['bill_no']))
+            del self.outstanding[position]
+
+    def _add_balance(self, bill, amount):
+        for balances, key in ((self.vehicles, normalize_key(bill['vehicle_no'])),
+                              (self.slots, bill['slot_number'])):
+            balance = balances.get(key, 0) + amount
+            if balance:
+                balances[key] = balance
+            else:
+                balances.pop(key, None)
+
+    # -- persistence -------------------------------------------------------
+
+    def load(self):
+        """Load the checkpoint and replay the log"""
+        with self._lock:
+            try:
+                state = load_file(self._checkpoint_path)
+            except (OSError, ValueError):
+                state = None
+            if state is not None:
+                self.bills = state['bills']
+                self.vehicles = state['vehicles']
+                self.slots = state['slots']
+                self.outstanding = [tuple(item) for item in state['outstanding']]
+                self.log_offset = state['log_offset']
+                self.entries = self.checkpoint_entries = state['entries']
+        self.refresh()
+
+    def refresh(self):
+        """Apply entries other workers appended to the log"""
+        try:
+            size = os.path.getsize(self._log_path)
+        except OSError:
+            return
+        if size <= self.log_offset:
+            return
+        with self._lock:
+            with open(self._log_path, 'rb') as f:
+                f.seek(self.log_offset)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # a write still in progress
+                    self.log_offset += len(line)
+                    if line.strip():
+                        self._apply(loads(line))
+            if self.entries - self.checkpoint_entries >= max(CHECKPOINT_EVERY, self.checkpoint_entries):
+                self._write_checkpoint()
+
+    def _write_checkpoint(self):
+        dump_file({
+            'log_offset': self.log_offset,
+            'entries': self.entries,
+            'bills': self.bills,
+            'vehicles': self.vehicles,
+            'slots': self.slots,
+            'outstanding': self.outstanding,
+        }, self._checkpoint_path)
+        self.checkpoint_entries = self.entries
+
+    def _append(self, entries, check=None):
+        """Append entries under the log's file lock, after ``check()`` passes
+
+        ``check`` runs once the ledger has caught up with every worker's
+        entries, so two payments for the same bill can't both be accepted.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._log_path, 'ab') as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                self.refresh()
+                if check is not None:
+                    with self._lock:
+                        check()
+                f.write(dump_lines(entries))
+                f.flush()
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        self.refresh()
+
+    # -- changes -----------------------------------------------------------
+
+    def add_bills(self, records, settled=False, payment=None):
+        """Put saved bills on the ledger; bills it already has are skipped
+
+        ``payment`` (``{'mode': ..., 'by': ...}``) records each bill as paid
+        in full when it was issued, in the same append as the bill itself.
+        """
+        count = 0
+        batch = []
+        for record in records:
+            if record.get('bill_no') and record['bill_no'] not in self.bills:
+                entry = bill_entry(record, settled)
+                batch.append(entry)
+                if payment is not None and entry['amount'] > 0:
+                    batch.append(payment_entry(entry['bill_no'], entry['amount'], **payment))
+                if len(batch) >= BATCH_SIZE:
+                    self._append(batch)
+                    count += len(batch)
+                    batch = []
+        if batch:
+            self._append(batch)
+            count += len(batch)
+        return count
+
+    def pay(self, bill_no, amount, mode=None, by=None):
+        """Record a payment of ``amount`` rupees against a bill
+
+        Raises KeyError for an unknown bill and ValueError for an amount
+        that isn't positive or is more than the bill's balance.
+        """
+        if not math.isfinite(amount):
+            raise ValueError("payment amount must be a number")
+        entry = payment_entry(bill_no, paise(amount), mode, by)
+
+        def check():
+            bill = self.bills.get(bill_no)
+            if bill is None:
+                raise KeyError(bill_no)
+            if entry['amount'] <= 0:
+                raise ValueError("payment amount must be positive")
+            if entry['amount'] > bill['amount'] - bill['paid']:
+                raise ValueError(f"bill {bill_no} has only "
+                                 f"{(bill['amount'] - bill['paid']) / 100:.2f} due")
+
+        self._append([entry], check)
+        return self.bill(bill_no)
+
+    # -- queries -----------------------------------------------------------
+
+    def bill(self, bill_no):
+        """A bill's amount, paid, balance (rupees) and status, or None"""
+        with self._lock:
+            bill = self.bills.get(bill_no)
+            return None if bill is None else _bill_view(bill)
+
+    def balance(self, vehicle_no=None, slot_number=None):
+        """Rupees still due for a vehicle or a slot"""
+        with self._lock:
+            if vehicle_no is not None:
+                return self.vehicles.get(normalize_key(vehicle_no), 0) / 100
+            return self.slots.get(slot_number, 0) / 100
+
+    def overdue(self, now=None):
+        """Vehicles with bills past their due time, oldest debt first
+
+        Only the overdue bills are read: they are the front of
+        ``outstanding``.  Each vehicle lists those bills, its overdue amount
+        and its whole running balance.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            end = bisect_right(self.outstanding, (now, '\U0010ffff'))
+            tenants = {}
+            for _, bill_no in self.outstanding[:end]:
+                bill = self.bills[bill_no]
+                key = normalize_key(bill['vehicle_no'])
+                tenant = tenants.get(key)
+                if tenant is None:
+                    tenant = tenants[key] = {
+                        'vehicle_no': bill['vehicle_no'],
+                        'name': bill['name'],
+                        'balance': self.vehicles.get(key, 0) / 100,
+                        'overdue': 0.0,
+                        'oldest_due_at': bill['due_at'],
+                        'bills': [],
+                    }
+                tenant['overdue'] += (bill['amount'] - bill['paid']) / 100
+                tenant['bills'].append(_bill_view(bill))
+            return list(tenants.values())
+
+    def totals(self):
+        """Outstanding bill count and amount (rupees)"""
+        with self._lock:
+            return {'bills': len(self.outstanding),
+                    'amount': sum(self.vehicles.values()) / 100}
+
+
+def _bill_view(bill):
+    view = dict(bill, amount=bill['amount'] / 100, paid=bill['paid'] / 100,
+                balance=(bill['amount'] - bill['paid']) / 100)
+    view['status'] = bill_status(bill)
+    return view
+
+
+class Ledgers:
+    """Ledger of each site, loaded on first use
+
+    A site's first ledger starts from the bills already on record, as
+    settled history.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._ledgers = {}
+        self._lock = threading.Lock()
+
+    def get(self, site_id):
+        with self._lock:
+            ledger = self._ledgers.get(site_id)
+            if ledger is not None:
+                ledger.refresh()
+                return ledger
+            ledger = Ledger(os.path.join(self.store.site_dir(site_id), 'ledger'))
+            existed = ledger.exists()
+            ledger.load()
+            if not existed:
+                ledger.add_bills(self.store.iter_records(site_id), settled=True)
+            self._ledgers[site_id] = ledger
+            return ledger
+
+    def add_bills(self, site_id, records, settled=False, payment=None):
+        return self.get(site_id).add_bills(records, settled, payment)
+
+    def pay(self, site_id, bill_no, amount, mode=None, by=None):
+        return self.get(site_id).pay(bill_no, amount, mode, by)
+
+    def bill(self, site_id, bill_no):
+        return self.get(site_id).bill(bill_no)
+
+    def overdue(self, site_id, now=None):
+        return self.get(site_id).overdue(now)
+
+    def totals(self, site_id):
+        return self.get(site_id).totals()
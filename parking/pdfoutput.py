@@ -0,0 +1,104 @@
+"""PDF output for bills: serialized once, into the bytes that are sent.
+
+fpdf2 appends every serialized object to a growing ``bytearray`` (copying
+each one once more to add its newline), and the caller then copies the
+whole buffer into ``bytes`` and wraps it in a file object for
+``send_file``, which copies it again in 8 KiB reads.  :func:`pdf_bytes`
+instead collects the serialized objects as they are written and joins
+them once into the ``bytes`` object that becomes the response body.  The
+``/ID`` fpdf2 derives from the finished buffer is hashed on the way.
+
+Page contents are deflated with a window sized to the page (:func:`deflate`)
+rather than zlib's defaults, whose 256 KiB of compressor state used to be
+most of the memory a bill's output took; embedded font files, CID maps and
+ToUnicode maps are deflated once per glyph set by parking/fonts.py.
+"""
+import hashlib
+import zlib
+
+from fpdf.syntax import Name
+
+from parking.fonts import COMPRESSION_LEVEL, CachedFontOutputProducer
+
+# zlib memLevel of page streams: 4 KiB hash chains instead of 128 KiB
+MEM_LEVEL = 4
+
+
+def deflate(data, level=COMPRESSION_LEVEL):
+    """zlib stream of ``data``, with the smallest window that covers it"""
+    wbits = min(15, max(9, (len(data) - 1).bit_length()))
+    compressor = zlib.compressobj(level, zlib.DEFLATED, wbits, MEM_LEVEL)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _md5():
+    """MD5 for the PDF file identifier, not for security"""
+    try:
+        return hashlib.md5(usedforsecurity=False)
+    except TypeError:
+        # Python < 3.9 has no usedforsecurity argument
+        return hashlib.md5()
+
+
+class _Chunks(list):
+    """Serialized PDF objects in output order; ``len()`` is the size in bytes"""
+
+    def __init__(self):
+        super().__init__()
+        self.size = 0
+        self.digest = _md5()
+
+    def __len__(self):
+        return self.size
+
+    def __iadd__(self, data):
+        self.append(data)
+        self.size += len(data)
+        self.digest.update(data)
+        return self
+
+
+class BillOutputProducer(CachedFontOutputProducer):
+    """:class:`CachedFontOutputProducer` writing into :class:`_Chunks`
+
+    Not for signed documents (fpdf2 signs the buffer as a whole).
+    """
+
+    def __init__(self, fpdf):
+        super().__init__(fpdf)
+        self.buffer = _Chunks()
+        if fpdf.file_id() == -1:
+            # The default /ID: the hash of everything before the trailer
+            fpdf.file_id = self._file_id
+
+    def _file_id(self):
+        digest = self.buffer.digest.copy()
+        if self.fpdf.creation_date:
+            digest.update(self.fpdf.creation_date.strftime("%Y%m%d%H%M%S").encode("utf8"))
+        hash_hex = digest.hexdigest().upper()
+        return f"<{hash_hex}><{hash_hex}>"
+
+    def _out(self, data):
+        if not isinstance(data, bytes):
+            data = str(data).encode("latin1")
+        self.buffer += data
+        self.buffer += b"\n"
+
+    def _add_pages(self, *args, **kwargs):
+        compress, self.fpdf.compress = self.fpdf.compress, False
+        try:
+            page_objs = super()._add_pages(*args, **kwargs)
+        finally:
+            self.fpdf.compress = compress
+        if compress:
+            for page_obj in page_objs:
+                stream = page_obj.contents
+                stream._contents = deflate(stream._contents)
+                stream.filter = Name("FlateDecode")
+                stream.length = len(stream._contents)
+        return page_objs
+
+
+def pdf_bytes(pdf):
+    """The finished document ``pdf`` as ``bytes``, its only full copy"""
+    return b''.join(pdf.output(output_producer_class=BillOutputProducer))
@@ -0,0 +1,442 @@
+"""In-memory search over customer names and vehicle numbers.
+
+Every indexed bill becomes a compact document.  Its name words and vehicle
+number (whole and per part, so "TN 31 AB 1234" is found by "tn31ab", "ab"
+or "1234") are normalized to upper-case alphanumerics and stored in an
+inverted index ``term -> [doc ids]``.  The distinct terms are also kept in a
+sorted list, which acts as the prefix trie: every term starting with a prefix
+lies in one contiguous run found with :func:`bisect.bisect_left`, so
+as-you-type queries only touch the terms they match.
+
+The index of a site lives in its current generation directory::
+
+    <generation>/search/checkpoint.json   full index up to ``log_offset``
+    <generation>/search/log.jsonl         documents added since
+
+Bill numbers map straight to their document (``bills``), so looking up a
+bill by number is a dict lookup.  Issue times (``issued_at``) are kept
+sorted in ``times`` with the matching doc ids in ``time_docs``, so bills
+issued between two instants are found with two bisections, O(log n + k).
+
+Saving a bill appends one line to the log.  Startup loads the checkpoint and
+replays the log tail, and other workers catch up the same way, so the shards
+are only scanned when no index exists yet (e.g. right after a restore).
+"""
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
+from heapq import merge
+from itertools import chain
+import gc
+import os
+import threading
+
+from parking.inventory import normalize_key
+from parking.serialization import dump_file, dumps, load_file, loads
+from parking.storage import parse_bill_date, period_key, period_number
+
+# New fields go at the end so documents of older checkpoints still line up
+DOC_FIELDS = ('name', 'vehicle_no', 'vehicle_type', 'slot_number', 'month', 'year',
+              'bill_date', 'created_by', 'bill_no', 'bill_amount', 'payment_mode', 'issued_at')
+_BILL_NO = DOC_FIELDS.index('bill_no')
+_BILL_DATE = DOC_FIELDS.index('bill_date')
+_ISSUED_AT = DOC_FIELDS.index('issued_at')
+SEPARATOR = '\x1f'
+CHECKPOINT_EVERY = 50000
+# Work caps that keep a keystroke cheap however common its prefix is
+MAX_PREFIX_TERMS = 2000
+MAX_CANDIDATES = 2000
+MAX_FILTER_SET = 10000
+_AFTER_ALL = '\U0010ffff'
+
+
+def record_doc(record):
+    """One string per document keeps a million-bill index to a million objects"""
+    return SEPARATOR.join(str(record.get(field, '')).replace(SEPARATOR, ' ') for field in DOC_FIELDS)
+
+
+def doc_fields(doc):
+    """Fields of a document, with ``issued_at`` and ``period`` numbers as in records"""
+    fields = dict(zip(DOC_FIELDS, doc.split(SEPARATOR)))
+    issued_at = fields.get('issued_at')
+    fields['issued_at'] = int(issued_at) if issued_at else parse_bill_date(fields['bill_date'])
+    try:
+        fields['period'] = period_number(period_key(fields['month'], fields['year']))
+    except ValueError:
+        fields['period'] = None
+    return fields
+
+
+def doc_time(doc):
+    """Issue time of a document in epoch seconds, or None"""
+    fields = doc.split(SEPARATOR)
+    if len(fields) > _ISSUED_AT and fields[_ISSUED_AT]:
+        return int(fields[_ISSUED_AT])
+    # Bills saved before records carried issued_at
+    return parse_bill_date(fields[_BILL_DATE])
+
+
+def _key(word):
+    # Plain ASCII words skip the regex; they are the vast majority
+    return word.upper() if word.isascii() and word.isalnum() else normalize_key(word)
+
+
+def doc_terms(doc):
+    """Normalized terms of a document: name words and vehicle number parts"""
+    name, vehicle = doc.split(SEPARATOR, 2)[:2]
+    terms = set()
+    for word in name.split():
+        key = _key(word)
+        if key:
+            terms.add(key)
+    key = normalize_key(vehicle)
+    if key:
+        terms.add(key)
+        for part in vehicle.replace('-', ' ').split():
+            part = _key(part)
+            if part:
+                terms.add(part)
+    return terms
+
+
+def query_tokens(query):
+    return [key for key in (normalize_key(word) for word in str(query).split()) if key]
+
+
+@contextmanager
+def _gc_paused():
+    """Build big indexes without the cyclic GC rescanning them on every allocation"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class SearchIndex:
+    """Inverted index plus sorted-term prefix lookup for one site generation"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.docs = []
+        self.postings = {}
+        self.terms = []
+        self.bills = {}
+        self.times = array('q')
+        self.time_docs = array('q')
+        self.log_offset = 0
+        self.checkpoint_docs = 0
+        self._lock = threading.Lock()
+
+    @property
+    def _checkpoint_path(self):
+        return os.path.join(self.directory, 'checkpoint.json')
+
+    @property
+    def _log_path(self):
+        return os.path.join(self.directory, 'log.jsonl')
+
+    def __len__(self):
+        return len(self.docs)
+
+    # -- building ----------------------------------------------------------
+
+    def _index_doc(self, doc, new_terms=None, new_times=None):
+        """Index one document
+
+        New terms and ``(issued_at, doc_id)`` pairs are collected in
+        ``new_terms`` and ``new_times`` if given, for one merge per batch.
+        """
+        doc_id = len(self.docs)
+        self.docs.append(doc)
+        bill_no = _bill_no(doc)
+        if bill_no:
+            self.bills[bill_no] = doc_id
+        issued_at = doc_time(doc)
+        if issued_at is not None:
+            if new_times is None:
+                self._add_times([(issued_at, doc_id)])
+            else:
+                new_times.append((issued_at, doc_id))
+        for term in doc_terms(doc):
+            postings = self.postings.get(term)
+            if postings is None:
+                self.postings[term] = [doc_id]
+                if new_terms is None:
+                    insort(self.terms, term)
+                else:
+                    new_terms.append(term)
+            else:
+                postings.append(doc_id)
+
+    def _add_times(self, entries):
+        """Merge ``(issued_at, doc_id)`` pairs into the sorted time index"""
+        if not entries:
+            return
+        entries.sort()
+        if not self.times or entries[0][0] >= self.times[-1]:
+            # New bills: the usual case, and a plain append
+            self.times.extend(issued_at for issued_at, _ in entries)
+            self.time_docs.extend(doc_id for _, doc_id in entries)
+        elif len(entries) <= 32:
+            for issued_at, doc_id in entries:
+                position = bisect_right(self.times, issued_at)
+                self.times.insert(position, issued_at)
+                self.time_docs.insert(position, doc_id)
+        else:
+            # Imported history: one merge instead of an insert per bill
+            merged = list(merge(zip(self.times, self.time_docs), entries))
+            self.times = array('q', (issued_at for issued_at, _ in merged))
+            self.time_docs = array('q', (doc_id for _, doc_id in merged))
+
+    def build(self, records):
+        """Index ``records`` from scratch and persist a checkpoint"""
+        with self._lock, _gc_paused():
+            self.docs, self.postings, self.terms, self.bills = [], {}, [], {}
+            self.times, self.time_docs = array('q'), array('q')
+            new_times = []
+            for record in records:
+                self._index_doc(record_doc(record), new_terms=[], new_times=new_times)
+            self.terms = sorted(self.postings)
+            self._add_times(new_times)
+            os.makedirs(self.directory, exist_ok=True)
+            try:
+                self.log_offset = os.path.getsize(self._log_path)
+            except OSError:
+                self.log_offset = 0
+            self._write_checkpoint()
+
+    def load(self):
+        """Load the checkpoint and replay the log; False if there is none"""
+        with self._lock, _gc_paused():
+            try:
+                state = load_file(self._checkpoint_path)
+            except (OSError, ValueError):
+                return False
+            self.docs = state['docs']
+            self.terms = state['terms']
+            self.postings = dict(zip(self.terms, state['postings']))
+            if 'bills' in state:
+                self.bills = state['bills']
+            else:
+                # Checkpoint written before bills were numbered
+                self.bills = {}
+                for doc_id, doc in enumerate(self.docs):
+                    bill_no = _bill_no(doc)
+                    if bill_no:
+                        self.bills[bill_no] = doc_id
+            if 'times' in state:
+                self.times = array('q', state['times'])
+                self.time_docs = array('q', state['time_docs'])
+            else:
+                # Checkpoint written before the time index
+                self.times, self.time_docs = array('q'), array('q')
+                self._add_times([(issued_at, doc_id) for doc_id, issued_at in
+                                 enumerate(map(doc_time, self.docs)) if issued_at is not None])
+            self.log_offset = state['log_offset']
+            self.checkpoint_docs = len(self.docs)
+        self.refresh()
+        return True
+
+    def refresh(self):
+        """Index documents other workers appended to the log"""
+        try:
+            size = os.path.getsize(self._log_path)
+        except OSError:
+            return
+        if size <= self.log_offset:
+            return
+        with self._lock:
+            new_terms, new_times = [], []
+            with open(self._log_path, 'rb') as f:
+                f.seek(self.log_offset)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # a write still in progress
+                    self.log_offset += len(line)
+                    if line.strip():
+                        self._index_doc(loads(line), new_terms, new_times)
+            self._add_times(new_times)
+            new_terms.sort()
+            if len(new_terms) > 32:
+                # One merge instead of an insort per term keeps bulk imports linear
+                self.terms = list(merge(self.terms, new_terms))
+            else:
+                for term in new_terms:
+                    insort(self.terms, term)
+            # Checkpoints get rarer as the index grows, so rewriting them stays linear overall
+            if len(self.docs) - self.checkpoint_docs >= max(CHECKPOINT_EVERY, self.checkpoint_docs):
+                self._write_checkpoint()
+
+    def add(self, record):
+        """Append a saved bill to the log and index it"""
+        self.add_many([record])
+
+    def add_many(self, records):
+        """Append bills to the log in one write and index them"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._log_path, 'ab') as f:
+            f.write(b''.join(dumps(record_doc(record)) + b'\n' for record in records))
+        self.refresh()
+
+    def records(self):
+        """Fields of every indexed bill"""
+        with self._lock:
+            docs = list(self.docs)
+        return (doc_fields(doc) for doc in docs)
+
+    def _write_checkpoint(self):
+        dump_file({
+            'log_offset': self.log_offset,
+            'docs': self.docs,
+            'terms': self.terms,
+            'postings': [self.postings[term] for term in self.terms],
+            'bills': self.bills,
+            'times': self.times.tolist(),
+            'time_docs': self.time_docs.tolist(),
+        }, self._checkpoint_path)
+        self.checkpoint_docs = len(self.docs)
+
+    # -- queries -----------------------------------------------------------
+
+    def find_bill(self, bill_no):
+        """Fields of the bill numbered ``bill_no``, or None"""
+        with self._lock:
+            doc_id = self.bills.get(bill_no)
+            return None if doc_id is None else doc_fields(self.docs[doc_id])
+
+    def between(self, start, end, limit=None, newest_first=False):
+        """Fields of bills issued in ``[start, end)`` (epoch seconds)
+
+        Oldest first, or newest first with ``newest_first``; ``limit`` keeps
+        the first ``limit`` of that order.
+        """
+        with self._lock:
+            low = bisect_left(self.times, start)
+            high = bisect_left(self.times, end)
+            if limit is not None:
+                if newest_first:
+                    low = max(low, high - limit)
+                else:
+                    high = min(high, low + limit)
+            doc_ids = self.time_docs[low:high]
+            if newest_first:
+                doc_ids.reverse()
+            return [doc_fields(self.docs[doc_id]) for doc_id in doc_ids]
+
+    def _term_range(self, prefix):
+        """Slice bounds of the sorted terms that start with ``prefix``"""
+        return (bisect_left(self.terms, prefix),
+                bisect_left(self.terms, prefix + _AFTER_ALL))
+
+    def _prefix_terms(self, prefix):
+        low, high = self._term_range(prefix)
+        return iter(self.terms[low:high]) if high - low <= MAX_PREFIX_TERMS else (
+            self.terms[index] for index in range(low, high))
+
+    def _estimate(self, token):
+        """Number of documents ``token`` matches, or infinity for very common prefixes"""
+        low, high = self._term_range(token)
+        if high - low > MAX_PREFIX_TERMS:
+            return float('inf')
+        return sum(len(self.postings[term]) for term in self.terms[low:high])
+
+    def _candidates(self, token):
+        """Doc ids of ``token``: exact term first, then longer terms, newest first"""
+        exact = self.postings.get(token, [])
+        longer = (self.postings[term] for term in self._prefix_terms(token) if term != token)
+        for doc_ids in chain([exact], longer):
+            yield from reversed(doc_ids)
+
+    def search(self, query, limit=20):
+        """Return up to ``limit`` documents matching every query word"""
+        tokens = query_tokens(query)
+        if not tokens:
+            return []
+        with self._lock:
+            if len(tokens) > 1:
+                # "TN 31 AB 12" is usually a spaced-out vehicle number prefix
+                joined = ''.join(tokens)
+                low, high = self._term_range(joined)
+                if high > low:
+                    tokens = [joined]
+            estimates = {token: self._estimate(token) for token in tokens}
+            # Walk the candidates of the most selective word and check the rest
+            tokens.sort(key=estimates.get)
+            first, rest = tokens[0], tokens[1:]
+            # Other words become doc id sets where that is cheap, or are
+            # checked against each candidate's terms otherwise
+            filters, slow = [], []
+            for token in rest:
+                if estimates[token] <= MAX_FILTER_SET:
+                    filters.append(set(self._candidates(token)))
+                else:
+                    slow.append(token)
+            seen = set()
+            results = []
+            for doc_id in self._candidates(first):
+                if doc_id in seen:
+                    continue
+                seen.add(doc_id)
+                doc = self.docs[doc_id]
+                if (any(doc_id not in ids for ids in filters)
+                        or (slow and not _matches_all(doc, slow))):
+                    if len(seen) >= MAX_CANDIDATES:
+                        break
+                    continue
+                results.append(doc_fields(doc))
+                if len(results) >= limit:
+                    break
+            return results
+
+
+def _bill_no(doc):
+    fields = doc.split(SEPARATOR)
+    return fields[_BILL_NO] if len(fields) > _BILL_NO else ''
+
+
+def _matches_all(doc, tokens):
+    text = doc.upper()
+    if not all(token in text for token in tokens):
+        return False
+    terms = doc_terms(doc)
+    return all(any(term.startswith(token) for term in terms) for token in tokens)
+
+
+class SearchIndexes:
+    """Search index of each site's current generation, loaded on first use"""
+
+    def __init__(self, store):
+        self.store = store
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def get(self, site_id):
+        directory = os.path.join(self.store.data_dir(site_id), 'search')
+        with self._lock:
+            index = self._indexes.get(site_id)
+            if index is not None and index.directory == directory:
+                index.refresh()
+                return index
+            index = SearchIndex(directory)
+            if not index.load():
+                index.build(self.store.iter_records(site_id))
+            self._indexes[site_id] = index
+            return index
+
+    def add(self, site_id, record):
+        self.get(site_id).add(record)
+
+    def add_many(self, site_id, records):
+        self.get(site_id).add_many(records)
+
+    def search(self, site_id, query, limit=20):
+        return self.get(site_id).search(query, limit)
+
+    def find_bill(self, site_id, bill_no):
+        return self.get(site_id).find_bill(bill_no)
+
+    def between(self, site_id, start, end, limit=None, newest_first=False):
+        return self.get(site_id).between(start, end, limit, newest_first)
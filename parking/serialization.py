@@ -0,0 +1,164 @@
+"""Compact JSON encoding with an optional fast backend.
+
+Everything the app persists goes through :func:`dumps` / :func:`loads`.  The
+wire format is compact JSON (no indentation, no spaces, UTF-8), identical
+whichever backend produced it, so files written by one backend are readable
+by any other.  The fastest installed backend is picked at import time:
+``orjson``, then ``msgspec``, then the standard library.  Set
+``PARKING_JSON_BACKEND`` to ``orjson``, ``msgspec`` or ``json`` to force one.
+"""
+import json
+import os
+import threading
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def _stdlib_backend():
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+    def dumps(obj):
+        return encoder.encode(obj).encode('utf-8')
+
+    return 'json', dumps, json.loads
+
+
+def _orjson_backend():
+    return 'orjson', orjson.dumps, orjson.loads
+
+
+def _msgspec_backend():
+    encoder = msgspec.json.Encoder()
+    decoder = msgspec.json.Decoder()
+    return 'msgspec', encoder.encode, decoder.decode
+
+
+_BACKENDS = {
+    'orjson': (lambda: orjson is not None, _orjson_backend),
+    'msgspec': (lambda: msgspec is not None, _msgspec_backend),
+    'json': (lambda: True, _stdlib_backend),
+}
+
+
+def available_backends():
+    return [name for name, (available, _) in _BACKENDS.items() if available()]
+
+
+def get_backend(name=None):
+    """Return ``(name, dumps, loads)`` for ``name`` or the fastest available backend"""
+    if name:
+        available, factory = _BACKENDS[name]
+        if not available():
+            raise RuntimeError(f"JSON backend {name!r} is not installed")
+        return factory()
+    return _BACKENDS[available_backends()[0]][1]()
+
+
+BACKEND, _dumps, _loads = get_backend(os.environ.get('PARKING_JSON_BACKEND') or None)
+
+
+def dumps(obj):
+    """Encode ``obj`` as compact UTF-8 JSON bytes"""
+    return _dumps(obj)
+
+
+def loads(data):
+    """Decode JSON from bytes or str"""
+    return _loads(data)
+
+
+def dump_lines(records):
+    """Encode records as one JSON Lines block"""
+    return b''.join(_dumps(record) + b'\n' for record in records)
+
+
+def iter_lines(stream):
+    """Decode records from a binary JSON Lines stream, skipping blank lines"""
+    for line in stream:
+        if line.strip():
+            yield _loads(line)
+
+
+def dump_file(obj, path):
+    """Write ``obj`` to ``path`` atomically
+
+    The temporary file is named per process and thread: checkpoints and
+    session files can be written by several workers at once, unlocked.
+    """
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(_dumps(obj))
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def load_file(path):
+    with open(path, 'rb') as f:
+        return _loads(f.read())
+
+
+def iter_json_array(stream, chunk_size=1 << 16):
+    """Yield the items of a JSON array read from a text stream, chunk by chunk
+
+    Old single-file record stores are one big array; this reads them in
+    constant memory instead of decoding the whole file at once.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = '', 0, False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer, pos = buffer[pos:] + chunk, 0
+        return not eof
+
+    def skip_space():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer) or not fill():
+                return
+
+    skip_space()
+    if buffer[pos:pos + 1] != '[':
+        raise ValueError("expected a JSON array")
+    pos += 1
+    skip_space()
+    if buffer[pos:pos + 1] == ']':
+        return
+    while True:
+        skip_space()
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+            # A number or literal cut by the chunk boundary may continue
+            if end == len(buffer) and not eof and fill():
+                continue
+        except json.JSONDecodeError:
+            if eof or not fill():
+                raise
+            continue
+        yield item
+        pos = end
+        skip_space()
+        separator = buffer[pos:pos + 1]
+        pos += 1
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError(f"expected ',' or ']' in JSON array, got {separator!r}")
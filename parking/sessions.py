@@ -0,0 +1,93 @@
+"""Server-side sessions.
+
+Flask's default session lives in a signed cookie, so it only survives as
+long as ``SECRET_KEY`` does and every worker must share that key.  With
+:class:`FileSessionInterface` the cookie carries a random id only and the
+session data is a small JSON file per session, shared by every worker
+that sees the directory.  Files untouched for longer than the session
+lifetime are treated as expired and removed on the next cleanup.
+"""
+import os
+import secrets
+import time
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from parking.serialization import dump_file, load_file
+
+CLEANUP_EVERY = 1000
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class FileSessionInterface(SessionInterface):
+    """Sessions stored as ``<directory>/<id>.json``"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._saves = 0
+
+    def _path(self, sid):
+        return os.path.join(self.directory, f"{sid}.json")
+
+    def _lifetime(self, app):
+        return app.permanent_session_lifetime.total_seconds()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and sid.isalnum():
+            path = self._path(sid)
+            try:
+                if time.time() - os.path.getmtime(path) < self._lifetime(app):
+                    return ServerSession(load_file(path), sid=sid)
+            except (OSError, ValueError):
+                pass
+        return ServerSession(sid=secrets.token_hex(16), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.modified:
+                try:
+                    os.remove(self._path(session.sid))
+                except OSError:
+                    pass
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if not self.should_set_cookie(app, session):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        dump_file(dict(session), self._path(session.sid))
+        response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                            httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                            secure=self.get_cookie_secure(app),
+                            samesite=self.get_cookie_samesite(app))
+        self._saves += 1
+        if self._saves % CLEANUP_EVERY == 0:
+            self.cleanup(self._lifetime(app))
+
+    def cleanup(self, max_age):
+        """Remove session files idle for more than ``max_age`` seconds"""
+        cutoff = time.time() - max_age
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.name.endswith('.json') and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
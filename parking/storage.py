@@ -0,0 +1,958 @@
+"""Billed record storage partitioned by site and billing period.
+
+Each site gets its own directory.  Records are appended as JSON Lines to a
+shard per (year, month) billing period, so saving a bill only touches the
+shard of its period and reading one period only opens that shard::
+
+    <root>/<site>/CURRENT                         -> "gen-000002"
+    <root>/<site>/gen-000002/manifest.json
+    <root>/<site>/gen-000002/2025-10.000001.jsonl
+    <root>/<site>/gen-000002/2025-11.000001.jsonl
+    <root>/<site>/snapshots/20251101-093000-reset/...
+
+A shard is a list of segments.  The last segment of a shard is appended to;
+sealing a period closes its segments and marks them read-only so they can
+be compressed or copied safely.  A bill for a sealed period simply starts a
+new segment.  The manifest keeps per-shard counts, amounts and slot usage so
+dashboard totals never need to open the shards themselves.
+
+A period being billed keeps its part of the manifest in a file of its own
+(``2025-11.shard.json``), listed by the manifest, so saving a bill rewrites
+that file and never the whole manifest.  Anything else that changes the
+manifest (sealing, archiving, snapshots) rewrites it whole and folds those
+files back in; the next bill of a period lists its file again.
+
+Archiving a closed period merges its segments into a single compressed
+JSON Lines segment (zstd when the ``zstandard`` package is installed, gzip
+otherwise).  Reads pick the decoder from the segment's file extension, so
+archived and live periods are read the same way.  Encoding goes through
+:mod:`parking.serialization`.
+
+The live data of a site is one *generation* directory named by ``CURRENT``.
+Resetting a site starts a new empty generation and renames the old one into
+``snapshots/``, so a reset is O(1) and loses nothing.  Manual snapshots seal
+the active segments and hard-link every (now immutable) segment into the
+snapshot, and restoring links a snapshot's segments into a new generation.
+Both only cost one directory entry per segment, never a copy of the data.
+The same immutability lets :mod:`parking.backup` ship only new bytes.
+
+Records carry ``issued_at`` (epoch seconds of ``bill_date``) and ``period``
+(``YYYYMM`` as a number) so they sort and compare without parsing strings.
+:meth:`ShardedStore.add_timestamps` rewrites shards written before that.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+import gzip
+import io
+import os
+import re
+import shutil
+import stat
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines
+    fcntl = None
+
+from parking.serialization import dump_file, dump_lines, dumps, iter_json_array, iter_lines, load_file, loads
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BILL_DATE_FORMAT = "%d-%m-%Y %H:%M:%S"
+
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+          'August', 'September', 'October', 'November', 'December']
+
+DEFAULT_DATA_DIR = '/tmp/parking_data'
+# Where the app kept all records of the default site before sharding
+LEGACY_BILLED_FILE = '/tmp/billed_records.json'
+IMPORT_BATCH = 10000
+MANIFEST = 'manifest.json'
+BILL_COUNTERS = 'bill_numbers.json'
+CURRENT = 'CURRENT'
+SNAPSHOTS = 'snapshots'
+SNAPSHOT_META = 'snapshot.json'
+SHARD_FILE = '.shard.json'
+_GENERATION = re.compile(r'^gen-(\d+)$')
+_AMOUNT = re.compile(r'\d+(?:\.\d+)?')
+
+
+def data_dir_from_env():
+    """Storage root of the app: ``PARKING_DATA_DIR`` or the default"""
+    return os.environ.get('PARKING_DATA_DIR', DEFAULT_DATA_DIR)
+
+
+def legacy_file(site_id, default_site):
+    """Path of a site's records in the old single-file JSON format"""
+    if site_id == default_site:
+        return LEGACY_BILLED_FILE
+    root, ext = os.path.splitext(LEGACY_BILLED_FILE)
+    return f"{root}_{site_id}{ext}"
+
+
+def period_key(month, year):
+    """Return the ``YYYY-MM`` shard key for a record's month name and year"""
+    try:
+        number = MONTHS.index(month) + 1
+    except ValueError:
+        number = int(month)
+    return f"{int(year):04d}-{number:02d}"
+
+
+def record_period(record):
+    return period_key(record['month'], record['year'])
+
+
+def bill_number(prefix, period, sequence):
+    """Bill number such as ``VP202501-0007`` for the 7th bill of January 2025"""
+    return f"{prefix}{period.replace('-', '')}-{sequence:04d}"
+
+
+def period_number(period):
+    """Numeric ``YYYYMM`` of a ``YYYY-MM`` period key, which sorts the same way"""
+    return int(period.replace('-', ''))
+
+
+def parse_bill_date(bill_date):
+    """Epoch seconds of a ``bill_date`` string (local time), or None if it isn't one"""
+    try:
+        return int(datetime.strptime(bill_date, BILL_DATE_FORMAT).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+
+def add_timestamps(record):
+    """Give ``record`` its ``issued_at`` and ``period`` numbers; returns it"""
+    if record.get('issued_at') is None:
+        issued_at = parse_bill_date(record.get('bill_date'))
+        if issued_at is not None:
+            record['issued_at'] = issued_at
+    record['period'] = period_number(record_period(record))
+    return record
+
+
+def record_amount(record):
+    """Numeric amount of a record's ``bill_amount`` string (e.g. 'Rs. 1000.00')"""
+    match = _AMOUNT.search(str(record.get('bill_amount', '')).replace(',', ''))
+    return float(match.group(0)) if match else 0.0
+
+
+def default_archive_codec():
+    return 'zstd' if zstandard else 'gzip'
+
+
+_CODEC_SUFFIX = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+def open_segment(path):
+    """Open a plain, gzip or zstd JSON Lines segment for binary line reading"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is required to read {path}")
+        raw = open(path, 'rb')
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True))
+    return open(path, 'rb')
+
+
+def decode_segment(raw, name):
+    """Decoded lines of segment ``name`` read from the open binary file ``raw``
+
+    ``raw`` is left open for the caller to close.
+    """
+    if name.endswith('.gz'):
+        return gzip.GzipFile(fileobj=raw, mode='rb')
+    if name.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is required to read {name}")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, closefd=False))
+    return raw
+
+
+def _segment_codec(name):
+    """Codec of a compressed segment file name, or None for plain JSON Lines"""
+    for codec, suffix in _CODEC_SUFFIX.items():
+        if name.endswith(suffix):
+            return codec
+    return None
+
+
+def _write_compressed(path, lines, codec):
+    """Stream ``lines`` into a compressed file; returns the uncompressed size"""
+    raw_bytes = 0
+    with open(path, 'wb') as f:
+        if codec == 'zstd':
+            writer = zstandard.ZstdCompressor(level=10).stream_writer(f, closefd=False)
+        else:
+            writer = gzip.GzipFile(fileobj=f, mode='wb', compresslevel=9)
+        with writer:
+            for line in lines:
+                writer.write(line)
+                raw_bytes += len(line)
+    return raw_bytes
+
+
+def _empty_manifest():
+    return {'version': 1, 'shards': {}}
+
+
+def _empty_shard():
+    # 'timestamps': every record of the shard has issued_at and period
+    return {'segments': [], 'sealed': False, 'count': 0, 'amount': 0.0, 'slots': {},
+            'timestamps': True}
+
+
+def _new_segment(shard, period, suffix='.jsonl'):
+    """Name the next segment of a shard; numbers are never reused"""
+    number = shard.get('next_segment', len(shard['segments']) + 1)
+    shard['next_segment'] = number + 1
+    return f"{period}.{number:06d}{suffix}"
+
+
+def _make_read_only(path):
+    os.chmod(path, os.stat(path).st_mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+def _shard_path(directory, period):
+    return os.path.join(directory, f"{period}{SHARD_FILE}")
+
+
+def _load_manifest(directory):
+    """The manifest with its listed shard files merged in
+
+    Returns ``(manifest, revisions)``, the latter being the revision of each
+    shard file that was merged.  A listed file that is missing is simply not
+    written yet, and the manifest's own copy of that shard is current.  The
+    manifest's revision counts the writes of every shard file too.
+    """
+    try:
+        manifest = load_file(os.path.join(directory, MANIFEST))
+    except (OSError, ValueError):
+        return _empty_manifest(), {}
+    revisions = {}
+    for period in manifest.pop('live', ()):
+        try:
+            shard = load_file(_shard_path(directory, period))
+        except (OSError, ValueError):
+            continue
+        revisions[period] = shard.pop('revision', 0)
+        shard.pop('folded', None)
+        manifest['shards'][period] = shard
+    if revisions:
+        manifest['revision'] = manifest.get('revision', 0) + sum(revisions.values())
+    return manifest, revisions
+
+
+def _read_manifest(directory):
+    return _load_manifest(directory)[0]
+
+
+def _read_shard(directory, period):
+    """A period's own shard file, or None if appends must go through the manifest"""
+    try:
+        shard = load_file(_shard_path(directory, period))
+    except (OSError, ValueError):
+        return None
+    return None if shard.get('folded') else shard
+
+
+def _manifest_totals(manifest):
+    shards = manifest['shards'].values()
+    return {
+        'count': sum(shard['count'] for shard in shards),
+        'amount': sum(shard['amount'] for shard in shards),
+    }
+
+
+class ShardedStore:
+    """Per-site, per-period sharded JSON Lines store for billed records"""
+
+    def __init__(self, root):
+        self.root = root
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    # -- paths and locking -------------------------------------------------
+
+    def site_dir(self, site_id):
+        return os.path.join(self.root, site_id)
+
+    def data_dir(self, site_id):
+        """Directory of the site's current generation"""
+        site_dir = self.site_dir(site_id)
+        try:
+            with open(os.path.join(site_dir, CURRENT), 'r') as f:
+                return os.path.join(site_dir, f.read().strip())
+        except OSError:
+            return os.path.join(site_dir, 'gen-000001')
+
+    def _path(self, site_id, name):
+        return os.path.join(self.data_dir(site_id), name)
+
+    @contextmanager
+    def _locked(self, site_id):
+        """Serialize writers of one site across threads and processes"""
+        with self._locks_guard:
+            lock = self._locks.setdefault(site_id, threading.Lock())
+        with lock:
+            os.makedirs(self.site_dir(site_id), exist_ok=True)
+            with open(os.path.join(self.site_dir(site_id), '.lock'), 'a') as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # -- manifest ----------------------------------------------------------
+
+    def manifest(self, site_id):
+        """Return the site's manifest, or an empty one"""
+        return _read_manifest(self.data_dir(site_id))
+
+    def _write_manifest(self, site_id, manifest, live=()):
+        """Write the whole manifest; ``live`` periods keep a shard file of their own
+
+        Every other shard file is folded into the manifest.  Files are marked
+        folded before the manifest stops listing them and removed after, and
+        files that are already listed are written before the manifest and new
+        ones after it, so a crash never leaves a listed file out of date or
+        an unlisted one that appends would still use.
+        """
+        data_dir = self.data_dir(site_id)
+        listed = _load_manifest(data_dir)[1]
+        for period, revision in listed.items():
+            shard = manifest['shards'].get(period)
+            if period in live:
+                dump_file(dict(shard, revision=revision + 1), _shard_path(data_dir, period))
+            elif shard is not None:
+                dump_file(dict(shard, revision=revision, folded=True), _shard_path(data_dir, period))
+        # Every change bumps the revision, which pages use as their validator
+        manifest['revision'] = manifest.get('revision', 0) + 1
+        dump_file(dict(manifest, live=sorted(live)) if live else manifest, os.path.join(data_dir, MANIFEST))
+        for period in live:
+            if period not in listed:
+                dump_file(dict(manifest['shards'][period], revision=0), _shard_path(data_dir, period))
+        for period in listed:
+            if period not in live:
+                try:
+                    os.remove(_shard_path(data_dir, period))
+                except OSError:
+                    pass
+
+    def revision(self, site_id):
+        """Return ``(token, mtime)`` identifying the current state of a site
+
+        The token names the generation and its manifest revision, so it
+        changes on every saved bill, seal, reset, restore and snapshot change.
+        """
+        data_dir = self.data_dir(site_id)
+        manifest, listed = _load_manifest(data_dir)
+        mtime = 0
+        for path in [os.path.join(data_dir, MANIFEST)] + [_shard_path(data_dir, period) for period in listed]:
+            try:
+                mtime = max(mtime, os.stat(path).st_mtime)
+            except OSError:
+                pass
+        return f"{os.path.basename(data_dir)}.{manifest.get('revision', 0)}", mtime
+
+    def initialize(self, site_id):
+        """Create the site's current generation if it doesn't exist"""
+        with self._locked(site_id):
+            site_dir = self.site_dir(site_id)
+            if os.path.exists(os.path.join(site_dir, CURRENT)):
+                return
+            generation = os.path.join(site_dir, 'gen-000001')
+            os.makedirs(generation, exist_ok=True)
+            # Sites written before generations kept their files in site_dir
+            for name in os.listdir(site_dir):
+                if name == MANIFEST or '.jsonl' in name:
+                    os.replace(os.path.join(site_dir, name), os.path.join(generation, name))
+            if not os.path.exists(os.path.join(generation, MANIFEST)):
+                dump_file(_empty_manifest(), os.path.join(generation, MANIFEST))
+            self._set_current(site_id, 'gen-000001')
+
+    def periods(self, site_id):
+        """Sorted period keys that have records"""
+        return sorted(self.manifest(site_id)['shards'])
+
+    def summary(self, site_id):
+        """Record count, amount and slot usage from the manifest alone"""
+        shards = self.manifest(site_id)['shards']
+        slots = {}
+        for shard in shards.values():
+            for slot, count in shard['slots'].items():
+                slots[slot] = slots.get(slot, 0) + count
+        return {
+            'count': sum(shard['count'] for shard in shards.values()),
+            'amount': sum(shard['amount'] for shard in shards.values()),
+            'slots': slots,
+            'periods': sorted(shards),
+        }
+
+    # -- writes ------------------------------------------------------------
+
+    def append(self, site_id, record, bill_prefix=None):
+        """Append one record to the shard of its billing period"""
+        self.append_many(site_id, [record], bill_prefix)
+
+    def append_many(self, site_id, records, bill_prefix=None):
+        """Append records, touching only the shards of their periods
+
+        With ``bill_prefix``, records without a ``bill_no`` are numbered in
+        the same critical section that writes them (see :meth:`_number_bills`).
+        A period that already has its own shard file only rewrites that file;
+        the first bill of any other period lists a file for it, which is the
+        only time a bill rewrites the whole manifest.
+        """
+        by_period = {}
+        for record in records:
+            add_timestamps(record)
+            by_period.setdefault(record_period(record), []).append(record)
+        with self._locked(site_id):
+            if bill_prefix is not None:
+                self._number_bills(site_id, records, bill_prefix)
+            data_dir = self.data_dir(site_id)
+            shards = {period: _read_shard(data_dir, period) for period in by_period}
+            manifest = None
+            if None in shards.values():
+                manifest, listed = _load_manifest(data_dir)
+                shards = {period: manifest['shards'].setdefault(period, _empty_shard()) for period in by_period}
+            for period, batch in by_period.items():
+                shard = shards[period]
+                if shard['sealed'] or not shard['segments']:
+                    shard['segments'].append(_new_segment(shard, period))
+                    shard['sealed'] = False
+                with open(os.path.join(data_dir, shard['segments'][-1]), 'ab') as f:
+                    f.write(dump_lines(batch))
+                for record in batch:
+                    _count_record(shard, record)
+            if manifest is None:
+                for period, shard in shards.items():
+                    shard['revision'] = shard.get('revision', 0) + 1
+                    dump_file(shard, _shard_path(data_dir, period))
+            else:
+                self._write_manifest(site_id, manifest, live=set(listed) | set(by_period))
+
+    def _number_bills(self, site_id, records, prefix):
+        """Give records consecutive per-period bill numbers; caller holds the lock
+
+        Counters live beside the generations, so resets and restores never
+        hand out a number twice.  A number is only taken by a record that is
+        being written, which keeps each period's sequence free of gaps.
+        """
+        path = os.path.join(self.site_dir(site_id), BILL_COUNTERS)
+        try:
+            counters = load_file(path)
+        except (OSError, ValueError):
+            counters = {}
+        for record in records:
+            if record.get('bill_no'):
+                continue
+            period = record_period(record)
+            counters[period] = counters.get(period, 0) + 1
+            record['bill_no'] = bill_number(prefix, period, counters[period])
+        dump_file(counters, path)
+
+    def merge_bill_counters(self, site_id, counters):
+        """Raise the site's bill counters to at least ``counters`` (after a restore)"""
+        with self._locked(site_id):
+            path = os.path.join(self.site_dir(site_id), BILL_COUNTERS)
+            try:
+                current = load_file(path)
+            except (OSError, ValueError):
+                current = {}
+            for period, sequence in counters.items():
+                current[period] = max(current.get(period, 0), sequence)
+            dump_file(current, path)
+
+    def seal(self, site_id, period):
+        """Close a period's segments and make them read-only"""
+        with self._locked(site_id):
+            manifest = self.manifest(site_id)
+            shard = manifest['shards'].get(period)
+            if shard is None or shard['sealed']:
+                return False
+            for segment in shard['segments']:
+                _make_read_only(self._path(site_id, segment))
+            shard['sealed'] = True
+            self._write_manifest(site_id, manifest)
+            return True
+
+    def seal_before(self, site_id, period):
+        """Seal every period older than ``period`` (a ``YYYY-MM`` key)"""
+        return [p for p in self.periods(site_id) if p < period and self.seal(site_id, p)]
+
+    def archive(self, site_id, period, codec=None):
+        """Merge a period's segments into one compressed read-only segment"""
+        codec = codec or default_archive_codec()
+        if codec == 'zstd' and zstandard is None:
+            raise RuntimeError("zstandard is not installed")
+        with self._locked(site_id):
+            manifest = self.manifest(site_id)
+            shard = manifest['shards'].get(period)
+            if shard is None or (shard.get('archived') and len(shard['segments']) == 1):
+                return False
+            def lines():
+                for segment in shard['segments']:
+                    with open_segment(self._path(site_id, segment)) as f:
+                        for line in f:
+                            if line.strip():
+                                yield line if line.endswith(b'\n') else line + b'\n'
+
+            name = _new_segment(shard, period, f".jsonl{_CODEC_SUFFIX[codec]}")
+            path = self._path(site_id, name)
+            raw_bytes = _write_compressed(f"{path}.tmp", lines(), codec)
+            os.replace(f"{path}.tmp", path)
+            os.chmod(path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            old_segments = shard['segments']
+            shard.update({
+                'segments': [name],
+                'sealed': True,
+                'archived': True,
+                'raw_bytes': raw_bytes,
+                'stored_bytes': os.path.getsize(path),
+            })
+            self._write_manifest(site_id, manifest)
+            for segment in old_segments:
+                try:
+                    os.remove(self._path(site_id, segment))
+                except OSError:
+                    pass
+            return True
+
+    def add_timestamps(self, site_id, progress=None):
+        """Rewrite shards written before records had ``issued_at`` and ``period``
+
+        Each such shard is streamed into one new segment of the same kind
+        (compressed if it was archived, read-only if it was sealed) and its
+        old segments are removed; snapshots keep theirs through their own
+        links.  ``progress(period, count)`` is called after each shard.
+        Returns the number of records rewritten.
+        """
+        total = 0
+        with self._locked(site_id):
+            manifest = self.manifest(site_id)
+            for period, shard in sorted(manifest['shards'].items()):
+                if shard.get('timestamps'):
+                    continue
+                old_segments = shard['segments']
+
+                def lines():
+                    for segment in old_segments:
+                        try:
+                            with open_segment(self._path(site_id, segment)) as f:
+                                for record in iter_lines(f):
+                                    yield dumps(add_timestamps(record)) + b'\n'
+                        except FileNotFoundError:
+                            continue
+
+                codec = _segment_codec(old_segments[-1]) if old_segments else None
+                name = _new_segment(shard, period, f".jsonl{_CODEC_SUFFIX[codec]}" if codec else '.jsonl')
+                path = self._path(site_id, name)
+                if codec:
+                    shard['raw_bytes'] = _write_compressed(f"{path}.tmp", lines(), codec)
+                else:
+                    with open(f"{path}.tmp", 'wb') as f:
+                        f.writelines(lines())
+                os.replace(f"{path}.tmp", path)
+                if codec:
+                    shard['stored_bytes'] = os.path.getsize(path)
+                if shard['sealed']:
+                    _make_read_only(path)
+                shard['segments'] = [name]
+                shard['timestamps'] = True
+                self._write_manifest(site_id, manifest)
+                for segment in old_segments:
+                    try:
+                        os.remove(self._path(site_id, segment))
+                    except OSError:
+                        pass
+                total += shard['count']
+                if progress:
+                    progress(period, shard['count'])
+        return total
+
+    def archive_before(self, site_id, period, codec=None):
+        """Archive every period older than ``period``; returns the archived keys"""
+        return [p for p in self.periods(site_id) if p < period and self.archive(site_id, p, codec)]
+
+    def footprint(self, site_id):
+        """Bytes on disk per period, with raw sizes for archived periods"""
+        report = {}
+        for period, shard in sorted(self.manifest(site_id)['shards'].items()):
+            on_disk = 0
+            for segment in shard['segments']:
+                try:
+                    on_disk += os.path.getsize(self._path(site_id, segment))
+                except OSError:
+                    pass
+            report[period] = {
+                'records': shard['count'],
+                'archived': shard.get('archived', False),
+                'bytes': on_disk,
+                'raw_bytes': shard.get('raw_bytes', on_disk),
+            }
+        return report
+
+    # -- generations and snapshots -----------------------------------------
+
+    def _set_current(self, site_id, generation):
+        path = os.path.join(self.site_dir(site_id), CURRENT)
+        with open(f"{path}.tmp", 'w') as f:
+            f.write(generation)
+        os.replace(f"{path}.tmp", path)
+
+    def _next_generation(self, site_id):
+        """Create and return the name of a new, empty generation directory"""
+        match = _GENERATION.match(os.path.basename(self.data_dir(site_id)))
+        number = int(match.group(1)) + 1 if match else 1
+        while os.path.exists(os.path.join(self.site_dir(site_id), f"gen-{number:06d}")):
+            number += 1
+        name = f"gen-{number:06d}"
+        os.makedirs(os.path.join(self.site_dir(site_id), name))
+        return name
+
+    def _snapshot_dir(self, site_id, snapshot_id=None):
+        return os.path.join(self.site_dir(site_id), SNAPSHOTS, *([snapshot_id] if snapshot_id else []))
+
+    def _new_snapshot_id(self, site_id, reason):
+        base = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{reason}"
+        snapshot_id, suffix = base, 1
+        while os.path.exists(self._snapshot_dir(site_id, snapshot_id)):
+            suffix += 1
+            snapshot_id = f"{base}-{suffix}"
+        return snapshot_id
+
+    def _write_snapshot_meta(self, site_id, snapshot_id, directory, reason, created_by, manifest):
+        meta = {
+            'id': snapshot_id,
+            'reason': reason,
+            'created_by': created_by,
+            'created_at': datetime.now().strftime("%d-%m-%Y %H:%M:%S"),
+            'periods': sorted(manifest['shards']),
+        }
+        meta.update(_manifest_totals(manifest))
+        dump_file(meta, os.path.join(directory, SNAPSHOT_META))
+        return meta
+
+    def reset(self, site_id, created_by=None):
+        """Start an empty generation; the old one is kept as a snapshot"""
+        with self._locked(site_id):
+            old_dir = self.data_dir(site_id)
+            generation = self._next_generation(site_id)
+            dump_file(_empty_manifest(), os.path.join(self.site_dir(site_id), generation, MANIFEST))
+            self._set_current(site_id, generation)
+            if not os.path.isdir(old_dir):
+                return None
+            snapshot_id = self._new_snapshot_id(site_id, 'reset')
+            os.makedirs(self._snapshot_dir(site_id), exist_ok=True)
+            os.rename(old_dir, self._snapshot_dir(site_id, snapshot_id))
+        directory = self._snapshot_dir(site_id, snapshot_id)
+        self._write_snapshot_meta(site_id, snapshot_id, directory, 'reset', created_by, _read_manifest(directory))
+        return snapshot_id
+
+    def create_snapshot(self, site_id, created_by=None, reason='manual'):
+        """Snapshot the current generation by hard-linking its segments"""
+        with self._locked(site_id):
+            return self._create_snapshot(site_id, created_by, reason)
+
+    def _create_snapshot(self, site_id, created_by, reason):
+        data_dir = self.data_dir(site_id)
+        manifest = self.manifest(site_id)
+        # Seal active segments so every linked segment is immutable;
+        # the next bill of each period simply starts a new segment.
+        _seal_all(manifest, data_dir)
+        self._write_manifest(site_id, manifest)
+        snapshot_id = self._new_snapshot_id(site_id, reason)
+        directory = self._snapshot_dir(site_id, snapshot_id)
+        os.makedirs(directory)
+        _link_segments(manifest, data_dir, directory)
+        dump_file(manifest, os.path.join(directory, MANIFEST))
+        self._write_snapshot_meta(site_id, snapshot_id, directory, reason, created_by, manifest)
+        return snapshot_id
+
+    def write_snapshot(self, site_id, records, created_by=None, reason='backup'):
+        """Write ``records`` into a new snapshot, one sealed segment per period
+
+        For data coming from outside the store, such as a backup: it can be
+        looked at and restored like any other snapshot.  Returns its id.
+        """
+        with self._locked(site_id):
+            snapshot_id = self._new_snapshot_id(site_id, reason)
+            directory = self._snapshot_dir(site_id, snapshot_id)
+            os.makedirs(directory)
+        manifest = _empty_manifest()
+        files = {}
+        try:
+            for record in records:
+                add_timestamps(record)
+                period = record_period(record)
+                shard = manifest['shards'].get(period)
+                if shard is None:
+                    shard = manifest['shards'][period] = _empty_shard()
+                    shard['segments'].append(_new_segment(shard, period))
+                    files[period] = open(os.path.join(directory, shard['segments'][0]), 'wb')
+                files[period].write(dumps(record) + b'\n')
+                _count_record(shard, record)
+        finally:
+            for f in files.values():
+                f.close()
+        _seal_all(manifest, directory)
+        dump_file(manifest, os.path.join(directory, MANIFEST))
+        # Written last: until then the directory isn't listed as a snapshot
+        self._write_snapshot_meta(site_id, snapshot_id, directory, reason, created_by, manifest)
+        with self._locked(site_id):
+            # Snapshot lists are part of the pages, so they need a new revision
+            self._write_manifest(site_id, self.manifest(site_id))
+        return snapshot_id
+
+    def list_snapshots(self, site_id):
+        """Snapshot metadata, newest first"""
+        root = self._snapshot_dir(site_id)
+        snapshots = []
+        if os.path.isdir(root):
+            for snapshot_id in os.listdir(root):
+                try:
+                    snapshots.append(load_file(os.path.join(root, snapshot_id, SNAPSHOT_META)))
+                except (OSError, ValueError):
+                    continue
+        return sorted(snapshots, key=lambda meta: meta['id'], reverse=True)
+
+    def restore_snapshot(self, site_id, snapshot_id, created_by=None):
+        """Make a snapshot the live data; the replaced data is snapshotted first"""
+        directory = self._snapshot_dir(site_id, snapshot_id)
+        if not os.path.exists(os.path.join(directory, SNAPSHOT_META)):
+            raise KeyError(snapshot_id)
+        with self._locked(site_id):
+            backup_id = self._create_snapshot(site_id, created_by, 'before-restore')
+            manifest = _read_manifest(directory)
+            # Links are shared with the snapshot, so they must never be appended to
+            _seal_all(manifest, directory)
+            generation = self._next_generation(site_id)
+            target = os.path.join(self.site_dir(site_id), generation)
+            _link_segments(manifest, directory, target)
+            dump_file(manifest, os.path.join(target, MANIFEST))
+            old_dir = self.data_dir(site_id)
+            self._set_current(site_id, generation)
+        # The replaced generation lives on through the backup snapshot's links
+        shutil.rmtree(old_dir, ignore_errors=True)
+        return backup_id
+
+    def delete_snapshot(self, site_id, snapshot_id):
+        directory = self._snapshot_dir(site_id, snapshot_id)
+        if not os.path.exists(os.path.join(directory, SNAPSHOT_META)):
+            return False
+        with self._locked(site_id):
+            shutil.rmtree(directory)
+            self._write_manifest(site_id, self.manifest(site_id))
+        return True
+
+    def capture(self, site_id):
+        """Open the current generation's segments at one consistent point
+
+        Returns ``{'generation', 'current_since', 'manifest', 'counters',
+        'segments': {name: (file, size, identity)}}``.  Segments are only
+        appended to and only removed after their replacement is in the
+        manifest, so the first ``size`` bytes of each open file stay as they
+        were captured while the caller copies them.  ``identity`` is the same
+        for hard links of an unchanged file.  The caller closes the files.
+        """
+        segments = {}
+        with self._locked(site_id):
+            data_dir = self.data_dir(site_id)
+            manifest = _read_manifest(data_dir)
+            try:
+                current_since = os.stat(os.path.join(self.site_dir(site_id), CURRENT)).st_mtime
+            except OSError:
+                current_since = 0
+            try:
+                counters = load_file(os.path.join(self.site_dir(site_id), BILL_COUNTERS))
+            except (OSError, ValueError):
+                counters = {}
+            for shard in manifest['shards'].values():
+                for segment in shard['segments']:
+                    try:
+                        f = open(os.path.join(data_dir, segment), 'rb')
+                    except FileNotFoundError:
+                        continue
+                    st = os.fstat(f.fileno())
+                    segments[segment] = (f, st.st_size, f"{st.st_dev}:{st.st_ino}:{st.st_mtime_ns}")
+        return {'generation': os.path.basename(data_dir), 'current_since': current_since,
+                'manifest': manifest, 'counters': counters, 'segments': segments}
+
+    # -- reads -------------------------------------------------------------
+
+    def slot_periods(self, site_id, periods=None):
+        """Record counts per slot and period, from the manifest alone
+
+        Returns ``(generation, {slot: [(period, count), ...]})`` with slots in
+        the order they were first billed and periods in order.
+        """
+        data_dir = self.data_dir(site_id)
+        shards = _read_manifest(data_dir)['shards']
+        wanted = sorted(shards) if periods is None else sorted(p for p in set(periods) if p in shards)
+        usage = {}
+        for period in wanted:
+            for slot, count in shards[period]['slots'].items():
+                usage.setdefault(slot, []).append((period, count))
+        return os.path.basename(data_dir), usage
+
+    def iter_records(self, site_id, periods=None, generation=None):
+        """Yield records in period order, opening only the requested shards
+
+        ``generation`` reads a given generation instead of the current one.
+        """
+        data_dir = (os.path.join(self.site_dir(site_id), generation) if generation
+                    else self.data_dir(site_id))
+        shards = _read_manifest(data_dir)['shards']
+        wanted = sorted(shards) if periods is None else sorted(p for p in set(periods) if p in shards)
+        for period in wanted:
+            for segment in shards[period]['segments']:
+                try:
+                    with open_segment(os.path.join(data_dir, segment)) as f:
+                        yield from iter_lines(f)
+                except FileNotFoundError:
+                    continue
+
+    def load_records(self, site_id, periods=None):
+        return list(self.iter_records(site_id, periods))
+
+    def find_record(self, site_id, period, bill_no):
+        """The stored record of bill ``bill_no``, read from the shard of ``period``"""
+        for record in self.iter_records(site_id, [period]):
+            if record.get('bill_no') == bill_no:
+                return record
+        return None
+
+    # -- migration ---------------------------------------------------------
+
+    def import_legacy_file(self, site_id, path, bill_prefix=None, progress=None):
+        """Move records from an old single-file JSON list into shards
+
+        The file is streamed twice: once to check that it parses, so a
+        corrupt file never leaves a half-migrated site, then to append the
+        records in batches.  ``progress(count)`` is called after each batch.
+        """
+        if not os.path.exists(path) or self.periods(site_id):
+            return 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for _ in iter_json_array(f):
+                    pass
+        except (OSError, ValueError):
+            return 0
+        count = 0
+        batch = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for record in iter_json_array(f):
+                batch.append(record)
+                if len(batch) >= IMPORT_BATCH:
+                    self.append_many(site_id, batch, bill_prefix)
+                    count += len(batch)
+                    batch = []
+                    if progress:
+                        progress(count)
+        if batch:
+            self.append_many(site_id, batch, bill_prefix)
+            count += len(batch)
+        os.replace(path, f"{path}.migrated")
+        return count
+
+    # -- integrity ---------------------------------------------------------
+
+    def verify(self, site_id):
+        """Scan every record of the current generation against the manifest
+
+        Returns ``{'records': n, 'problems': [...]}``.  Records are streamed
+        one segment at a time; only bill numbers are kept to find duplicates.
+        """
+        data_dir = self.data_dir(site_id)
+        manifest = _read_manifest(data_dir)
+        problems = []
+        bill_numbers = set()
+        referenced = {MANIFEST}
+        total = 0
+        for period, shard in sorted(manifest['shards'].items()):
+            count, amount, slots = 0, 0.0, {}
+            for segment in shard['segments']:
+                referenced.add(segment)
+                path = os.path.join(data_dir, segment)
+                if not os.path.exists(path):
+                    problems.append(f"{period}: missing segment {segment}")
+                    continue
+                if shard['sealed'] and os.stat(path).st_mode & stat.S_IWUSR:
+                    problems.append(f"{period}: sealed segment {segment} is writable")
+                with open_segment(path) as f:
+                    for number, line in enumerate(f, 1):
+                        if not line.strip():
+                            continue
+                        try:
+                            record = loads(line)
+                            record_period_key = record_period(record)
+                        except (ValueError, KeyError, TypeError) as e:
+                            problems.append(f"{segment}:{number}: unreadable record ({e})")
+                            continue
+                        if record_period_key != period:
+                            problems.append(f"{segment}:{number}: record of {record_period_key} in {period}")
+                        elif shard.get('timestamps') and record.get('period') != period_number(period):
+                            problems.append(f"{segment}:{number}: record without timestamps")
+                        count += 1
+                        amount += record_amount(record)
+                        slot = record.get('slot_number', '')
+                        slots[slot] = slots.get(slot, 0) + 1
+                        bill_no = record.get('bill_no')
+                        if bill_no:
+                            if bill_no in bill_numbers:
+                                problems.append(f"{segment}:{number}: duplicate bill number {bill_no}")
+                            bill_numbers.add(bill_no)
+            total += count
+            if count != shard['count']:
+                problems.append(f"{period}: {count} records, manifest says {shard['count']}")
+            if abs(amount - shard['amount']) > 0.005:
+                problems.append(f"{period}: amount {amount:.2f}, manifest says {shard['amount']:.2f}")
+            if slots != shard['slots']:
+                problems.append(f"{period}: slot usage differs from the manifest")
+        for name in sorted(os.listdir(data_dir)) if os.path.isdir(data_dir) else []:
+            if '.jsonl' in name and name not in referenced and not name.endswith('.tmp'):
+                problems.append(f"unreferenced segment {name}")
+        return {'records': total, 'problems': problems}
+
+
+def _count_record(shard, record):
+    """Add a written record to its shard's counts, amount and slot usage"""
+    shard['count'] += 1
+    shard['amount'] += record_amount(record)
+    slot = record.get('slot_number', '')
+    shard['slots'][slot] = shard['slots'].get(slot, 0) + 1
+
+
+def _seal_all(manifest, directory):
+    """Mark every shard sealed and its segment files read-only"""
+    for shard in manifest['shards'].values():
+        if not shard['sealed']:
+            for segment in shard['segments']:
+                path = os.path.join(directory, segment)
+                if os.path.exists(path):
+                    _make_read_only(path)
+            shard['sealed'] = True
+
+
+def _link_segments(manifest, source, target):
+    """Hard-link (or copy, where links are unsupported) every segment"""
+    os.makedirs(target, exist_ok=True)
+    for shard in manifest['shards'].values():
+        for segment in shard['segments']:
+            src = os.path.join(source, segment)
+            if not os.path.exists(src):
+                continue
+            try:
+                os.link(src, os.path.join(target, segment))
+            except OSError:
+                shutil.copy2(src, os.path.join(target, segment))
@@ -0,0 +1,390 @@
+"""Pay-and-park tickets: gate check-ins and check-outs priced by duration.
+
+Gate events of a site are entries of an append-only log, kept beside the
+site's ledger::
+
+    <root>/<site>/tickets/checkpoint.json   vehicles inside at ``log_offset``
+    <root>/<site>/tickets/log.jsonl         gate events since
+
+Vehicles currently inside are kept in ``parked``, a dict from the
+normalized vehicle number to a compact tuple, so checking a vehicle out is
+one dict lookup however long the history.  Closed tickets live only in the
+log; the state keeps the number issued and closed and the takings per day.
+
+Events are checked and written under the log's file lock, after catching up
+with other workers' events, so a vehicle can't be inside twice.  Writes go
+to the OS page cache and a background thread fsyncs the log at most every
+``SYNC_INTERVAL`` seconds, so a gate event costs one small write, and a
+gate controller posting a batch (:meth:`TicketOffice.record`) writes the
+whole batch at once.  Checkpoints are written every ``CHECKPOINT_EVERY``
+events, as with the ledger.
+
+Event times (``at``) default to the server's clock; times a gate sends
+must lie within the last ``MAX_EVENT_AGE`` seconds, give or take
+``MAX_CLOCK_SKEW``.
+
+Each check-out stores its duration and price, so changing a site's tariffs
+never reprices closed tickets.
+"""
+from datetime import datetime
+import atexit
+import math
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines
+    fcntl = None
+
+from parking.inventory import normalize_key
+from parking.ledger import paise
+from parking.serialization import dump_file, dump_lines, load_file, loads
+
+CHECKPOINT_EVERY = 50000
+SYNC_INTERVAL = 0.5
+# Gate controllers may post events they buffered while offline, but not
+# from further back than this, nor ahead of the server's clock by more
+MAX_EVENT_AGE = 7 * 86400
+MAX_CLOCK_SKEW = 300
+# Fields of the tuples in ``parked``
+_TICKET_NO, _VEHICLE_NO, _VEHICLE_TYPE, _ENTERED_AT, _GATE = range(5)
+
+
+class AlreadyInside(ValueError):
+    """Check-in of a vehicle that has an open ticket"""
+
+
+class NotInside(KeyError):
+    """Check-out of a vehicle without an open ticket"""
+
+
+def ticket_price(tariff, seconds):
+    """Rupees for parking ``seconds`` under ``tariff``
+
+    Free within the grace period; otherwise every started hour at the
+    hourly rate, with each 24 hours capped at the daily rate.
+    """
+    if seconds <= tariff['grace_minutes'] * 60:
+        return 0
+    days, rest = divmod(seconds, 86400)
+    return days * tariff['daily'] + min(math.ceil(rest / 3600) * tariff['hourly'], tariff['daily'])
+
+
+def _day(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d')
+
+
+class TicketOffice:
+    """Gate events, vehicles inside and takings of one site"""
+
+    def __init__(self, directory, tariffs, prefix='T'):
+        self.directory = directory
+        self.tariffs = tariffs
+        self.prefix = prefix
+        self.parked = {}
+        self.issued = 0
+        self.closed = 0
+        self.takings = {}
+        self.log_offset = 0
+        self.checkpoint_entries = 0
+        self.entries = 0
+        self._lock = threading.Lock()
+        self._unsynced = threading.Event()
+        self._syncer = None
+
+    @property
+    def _checkpoint_path(self):
+        return os.path.join(self.directory, 'checkpoint.json')
+
+    @property
+    def _log_path(self):
+        return os.path.join(self.directory, 'log.jsonl')
+
+    # -- applying events ---------------------------------------------------
+
+    def _apply(self, event):
+        self.entries += 1
+        key = normalize_key(event['vehicle_no'])
+        if event['type'] == 'in':
+            self.issued += 1
+            # Two workers can't both check a vehicle in; keep the first ticket if they did
+            self.parked.setdefault(key, (event['ticket_no'], event['vehicle_no'], event['vehicle_type'],
+                                         event['at'], event.get('gate')))
+        elif event['type'] == 'out':
+            ticket = self.parked.get(key)
+            if ticket is not None and ticket[_TICKET_NO] == event['ticket_no']:
+                del self.parked[key]
+                self.closed += 1
+                day = _day(event['at'])
+                self.takings[day] = self.takings.get(day, 0) + event['amount']
+
+    def _check(self, event):
+        """Log entry for a gate event; raises ValueError (or a subclass) or NotInside"""
+        vehicle_no = str(event.get('vehicle_no') or '').strip()
+        key = normalize_key(vehicle_no)
+        if not key:
+            raise ValueError("vehicle number is required")
+        now = time.time()
+        at = event.get('at')
+        at = round(now if at is None else float(at), 3)
+        # Also refuses inf and nan, which float() accepts
+        if not now - MAX_EVENT_AGE <= at <= now + MAX_CLOCK_SKEW:
+            raise ValueError(f"event time {event.get('at')} is not within the last "
+                             f"{MAX_EVENT_AGE // 86400} days")
+        if event.get('type') == 'in':
+            vehicle_type = event.get('vehicle_type') or 'car'
+            if vehicle_type not in self.tariffs:
+                raise ValueError(f"unknown vehicle type {vehicle_type}")
+            ticket = self.parked.get(key)
+            if ticket is not None:
+                raise AlreadyInside(f"{vehicle_no} is already inside on ticket {ticket[_TICKET_NO]}")
+            return {'type': 'in', 'ticket_no': f"{self.prefix}{self.issued + 1:07d}",
+                    'vehicle_no': vehicle_no, 'vehicle_type': vehicle_type, 'at': at,
+                    'gate': event.get('gate'), 'by': event.get('by')}
+        if event.get('type') == 'out':
+            ticket = self.parked.get(key)
+            if ticket is None:
+                raise NotInside(vehicle_no)
+            if at < ticket[_ENTERED_AT]:
+                raise ValueError(f"{vehicle_no} can't leave before it entered")
+            seconds = max(0, int(at - ticket[_ENTERED_AT]))
+            amount = paise(ticket_price(self.tariffs[ticket[_VEHICLE_TYPE]], seconds))
+            return {'type': 'out', 'ticket_no': ticket[_TICKET_NO], 'vehicle_no': ticket[_VEHICLE_NO],
+                    'at': at, 'seconds': seconds, 'amount': amount,
+                    'gate': event.get('gate'), 'by': event.get('by')}
+        raise ValueError(f"unknown gate event type {event.get('type')!r}")
+
+    # -- persistence -------------------------------------------------------
+
+    def load(self):
+        """Load the checkpoint and replay the log"""
+        with self._lock:
+            self._load()
+        self.refresh()
+
+    def _load(self):
+        try:
+            state = load_file(self._checkpoint_path)
+        except (OSError, ValueError):
+            state = {'parked': {}, 'issued': 0, 'closed': 0, 'takings': {}, 'log_offset': 0, 'entries': 0}
+        self.parked = {key: tuple(ticket) for key, ticket in state['parked'].items()}
+        self.issued = state['issued']
+        self.closed = state['closed']
+        self.takings = state['takings']
+        self.log_offset = state['log_offset']
+        self.entries = self.checkpoint_entries = state['entries']
+
+    def refresh(self):
+        """Apply events other workers appended to the log"""
+        try:
+            size = os.path.getsize(self._log_path)
+        except OSError:
+            return
+        if size <= self.log_offset:
+            return
+        with self._lock:
+            self._replay()
+
+    def _replay(self):
+        with open(self._log_path, 'rb') as f:
+            f.seek(self.log_offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # a write still in progress
+                self.log_offset += len(line)
+                if line.strip():
+                    self._apply(loads(line))
+        self._maybe_checkpoint()
+
+    def _maybe_checkpoint(self):
+        if self.entries - self.checkpoint_entries >= CHECKPOINT_EVERY:
+            dump_file({
+                'log_offset': self.log_offset,
+                'entries': self.entries,
+                'issued': self.issued,
+                'closed': self.closed,
+                'takings': self.takings,
+                'parked': self.parked,
+            }, self._checkpoint_path)
+            self.checkpoint_entries = self.entries
+
+    def _sync_loop(self):
+        while True:
+            self._unsynced.wait()
+            time.sleep(SYNC_INTERVAL)
+            self.sync()
+
+    def sync(self):
+        """fsync what was written since the last sync"""
+        if not self._unsynced.is_set():
+            return
+        self._unsynced.clear()
+        try:
+            fd = os.open(self._log_path, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    # -- gate events -------------------------------------------------------
+
+    def record(self, events):
+        """Check and log gate events in order; returns one result per event
+
+        Each event is a dict with ``type`` (``'in'`` or ``'out'``),
+        ``vehicle_no`` and optionally ``vehicle_type``, ``gate``, ``by`` and
+        ``at`` (epoch seconds within the last ``MAX_EVENT_AGE``, default
+        now).  A result is the ticket, or
+        ``{'error': ...}`` (with ``'status'`` 404 or 409) for an event that
+        was refused; refused events don't stop the others.
+        """
+        results = []
+        entries = []
+        try:
+            f = open(self._log_path, 'ab')
+        except FileNotFoundError:
+            os.makedirs(self.directory, exist_ok=True)
+            f = open(self._log_path, 'ab')
+        with f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                with self._lock:
+                    size = os.fstat(f.fileno()).st_size
+                    if size > self.log_offset:
+                        self._replay()
+                        if size > self.log_offset:
+                            # The tail of a writer that died mid-write; no event was completed
+                            f.truncate(self.log_offset)
+                    for event in events:
+                        try:
+                            entry = self._check(event)
+                        except NotInside as e:
+                            results.append({'error': f"{e.args[0]} is not inside", 'status': 404})
+                            continue
+                        except AlreadyInside as e:
+                            results.append({'error': str(e), 'status': 409})
+                            continue
+                        except (ValueError, TypeError) as e:
+                            results.append({'error': str(e), 'status': 400})
+                            continue
+                        results.append(self._result(entry))
+                        self._apply(entry)
+                        entries.append(entry)
+                    if entries:
+                        try:
+                            f.write(dump_lines(entries))
+                            f.flush()
+                        except BaseException:
+                            # Back to what the log holds
+                            self._load()
+                            self._replay()
+                            raise
+                        self.log_offset = f.tell()
+                        self._maybe_checkpoint()
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        if entries:
+            self._schedule_sync()
+        return results
+
+    def _result(self, entry):
+        """What a gate gets back for a logged event"""
+        if entry['type'] == 'in':
+            return {'ticket_no': entry['ticket_no'], 'vehicle_no': entry['vehicle_no'],
+                    'vehicle_type': entry['vehicle_type'], 'entered_at': entry['at'], 'gate': entry['gate']}
+        ticket = self.parked[normalize_key(entry['vehicle_no'])]
+        return dict(self._ticket_view(ticket), exited_at=entry['at'], seconds=entry['seconds'],
+                    amount=entry['amount'] / 100)
+
+    def _schedule_sync(self):
+        if not self._unsynced.is_set():
+            self._unsynced.set()
+        if self._syncer is None:
+            with self._lock:
+                if self._syncer is None:
+                    self._syncer = threading.Thread(target=self._sync_loop, name='ticket-sync', daemon=True)
+                    self._syncer.start()
+                    atexit.register(self.sync)
+
+    def check_in(self, vehicle_no, vehicle_type='car', gate=None, by=None, at=None):
+        """Open a ticket; raises AlreadyInside if the vehicle has one open"""
+        result, = self.record([{'type': 'in', 'vehicle_no': vehicle_no, 'vehicle_type': vehicle_type,
+                                'gate': gate, 'by': by, 'at': at}])
+        if result.get('status') == 409:
+            raise AlreadyInside(result['error'])
+        if 'error' in result:
+            raise ValueError(result['error'])
+        return result
+
+    def check_out(self, vehicle_no, gate=None, by=None, at=None):
+        """Close the vehicle's ticket and price it; raises NotInside if it isn't inside"""
+        result, = self.record([{'type': 'out', 'vehicle_no': vehicle_no, 'gate': gate, 'by': by, 'at': at}])
+        if result.get('status') == 404:
+            raise NotInside(vehicle_no)
+        if 'error' in result:
+            raise ValueError(result['error'])
+        return result
+
+    # -- queries -----------------------------------------------------------
+
+    @staticmethod
+    def _ticket_view(ticket):
+        return {'ticket_no': ticket[_TICKET_NO], 'vehicle_no': ticket[_VEHICLE_NO],
+                'vehicle_type': ticket[_VEHICLE_TYPE], 'entered_at': ticket[_ENTERED_AT],
+                'gate': ticket[_GATE]}
+
+    def inside(self, vehicle_no):
+        """The open ticket of a vehicle, or None"""
+        with self._lock:
+            ticket = self.parked.get(normalize_key(vehicle_no))
+            return None if ticket is None else self._ticket_view(ticket)
+
+    def summary(self, limit=100):
+        """Vehicles inside (the longest-staying ``limit``), counts and today's takings"""
+        with self._lock:
+            tickets = sorted(self.parked.values(), key=lambda ticket: ticket[_ENTERED_AT])[:limit]
+            return {'inside': len(self.parked),
+                    'issued': self.issued,
+                    'closed': self.closed,
+                    'takings_today': self.takings.get(_day(time.time()), 0) / 100,
+                    'vehicles': [self._ticket_view(ticket) for ticket in tickets]}
+
+
+class TicketOffices:
+    """Ticket office of each site, loaded on first use"""
+
+    def __init__(self, store, inventory):
+        self.store = store
+        self.inventory = inventory
+        self._offices = {}
+        self._lock = threading.Lock()
+
+    def get(self, site_id):
+        with self._lock:
+            office = self._offices.get(site_id)
+            if office is None:
+                site = self.inventory.get_site(site_id)
+                office = TicketOffice(os.path.join(self.store.site_dir(site.id), 'tickets'),
+                                      site.tariffs, prefix=f"{site.bill_prefix}T")
+                office.load()
+                self._offices[site_id] = office
+            return office
+
+    def record(self, site_id, events):
+        return self.get(site_id).record(events)
+
+    def check_in(self, site_id, vehicle_no, vehicle_type='car', gate=None, by=None, at=None):
+        return self.get(site_id).check_in(vehicle_no, vehicle_type, gate, by, at)
+
+    def check_out(self, site_id, vehicle_no, gate=None, by=None, at=None):
+        return self.get(site_id).check_out(vehicle_no, gate, by, at)
+
+    def summary(self, site_id, limit=100):
+        self.get(site_id).refresh()
+        return self.get(site_id).summary(limit)
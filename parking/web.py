@@ -0,0 +1,1669 @@
+"""The billing web app, shared by every entry point.
+
+:func:`create_app` builds an app from a config mapping; ``app.py`` (local
+runs, gunicorn, ``asgi.py``) and ``api/index.py`` (Vercel) are thin shims
+that only pick the config.  Backends are chosen by config keys:
+
+``STORAGE_BACKEND``
+    ``'sharded'`` keeps bills in the :class:`ShardedStore` under
+    ``DATA_DIR``; ``'memory'`` uses the same store in a private temporary
+    directory (RAM-backed ``/dev/shm`` where available) that is lost when
+    the process exits, like the old in-memory list of the Vercel app.
+``SESSION_BACKEND``
+    ``'cookie'`` for Flask's signed cookie sessions, ``'server'`` for
+    :class:`FileSessionInterface` files next to the data.
+``PDF_BACKEND``
+    ``'inline'`` renders bills in the request thread, ``'process'`` in a
+    pool of ``PDF_WORKERS`` processes.
+
+``PDF_CONCURRENCY`` and ``WRITE_CONCURRENCY`` bound how many requests of a
+worker render PDFs and save bills at once; the rest wait in a queue of
+``ADMISSION_QUEUE`` (``ADMISSION_QUEUE_PER_USER`` per user) for at most
+``ADMISSION_TIMEOUT`` seconds, and are answered 429 beyond that (see
+parking/admission.py).  ``STREAM_CONCURRENCY`` caps open ``/billed/stream``
+connections, which are refused with 429 rather than queued.  ``/admission``
+reports the queues.
+
+Bills issued with an email address or phone number are sent from an outbox
+(see parking/delivery.py) by ``DELIVERY_WORKERS`` threads, through SMTP
+(``DELIVERY_SMTP``, ``host:port``), a messaging webhook
+(``DELIVERY_WEBHOOK``), or into files under ``DELIVERY_DIR`` during
+development.  These default to the ``PARKING_DELIVERY_*`` environment
+variables; with none set, nothing is queued.  ``/deliveries`` reports the
+outbox.
+
+Route functions reach the backends of the app handling the request through
+the module-level proxies ``STORE``, ``SEARCH``, ``LEDGER``, ``TICKETS``,
+``AUDIT``, ``ADMISSION``, ``OUTBOX``, ``EVENTS``, ``INVENTORY``, ``FRAGMENTS`` and
+``ASSETS``.
+"""
+from flask import Blueprint, Flask, current_app, has_request_context, render_template_string, request, stream_with_context, send_from_directory, redirect, session, jsonify, abort
+from werkzeug.local import LocalProxy
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, InvalidOperation
+from markupsafe import Markup
+import atexit
+import os
+import secrets
+import shutil
+import tempfile
+import time
+
+from parking.inventory import load_inventory, PAYMENT_MODES, VEHICLE_TYPES, YEARS
+from parking.storage import ShardedStore, MONTHS, period_key, data_dir_from_env, legacy_file, record_amount, LEGACY_BILLED_FILE
+from parking.search import SearchIndexes
+from parking.ledger import Ledgers
+from parking.tickets import TicketOffices
+from parking.audit import AuditLog, audit_dir
+from parking.admission import Admission, Overloaded
+from parking.delivery import (CHANNELS, DirectoryTransport, Outbox, SmtpTransport, WebhookTransport, outbox_dir,
+                              valid_email, valid_phone)
+from parking.bills import DEFAULT_FORMAT, FORMATS, render_pdf
+from parking.assets import Assets, ONE_YEAR, page_etag
+from parking.fragments import FragmentCache
+from parking.events import EventBus, events_dir
+from parking.importer import CsvFormatError, import_csv, format_progress, open_csv
+from parking.serialization import dumps
+from parking.sessions import FileSessionInterface
+
+# Templates and static files live at the top of the repository
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STORAGE_BACKENDS = ('sharded', 'memory')
+SESSION_BACKENDS = ('cookie', 'server')
+PDF_BACKENDS = ('inline', 'process')
+
+DEFAULT_CONFIG = {
+    'STORAGE_BACKEND': 'sharded',
+    'SESSION_BACKEND': 'cookie',
+    'PDF_BACKEND': 'inline',
+    'PDF_WORKERS': os.cpu_count() or 1,
+    # Move old single-file records into the store on startup
+    'MIGRATE_LEGACY_FILES': True,
+    # Streams end after this long; browsers reconnect and resume from the last event
+    'STREAM_SECONDS': 300,
+    # Open /billed/stream connections per worker; more are answered 429 and poll
+    'STREAM_CONCURRENCY': 16,
+    # Concurrent PDF renders per worker (default: PDF_WORKERS)
+    'PDF_CONCURRENCY': None,
+    'WRITE_CONCURRENCY': 4,
+    'ADMISSION_QUEUE': 64,
+    'ADMISSION_QUEUE_PER_USER': 8,
+    'ADMISSION_TIMEOUT': 15,
+    # Bill delivery (see parking/delivery.py): SMTP "host:port", webhook URL, or a directory
+    'DELIVERY_SMTP': os.environ.get('PARKING_DELIVERY_SMTP'),
+    'DELIVERY_SMTP_USER': os.environ.get('PARKING_DELIVERY_SMTP_USER'),
+    'DELIVERY_SMTP_PASSWORD': os.environ.get('PARKING_DELIVERY_SMTP_PASSWORD'),
+    'DELIVERY_SMTP_STARTTLS': os.environ.get('PARKING_DELIVERY_SMTP_STARTTLS') == '1',
+    'DELIVERY_FROM': os.environ.get('PARKING_DELIVERY_FROM', 'bills@localhost'),
+    'DELIVERY_WEBHOOK': os.environ.get('PARKING_DELIVERY_WEBHOOK'),
+    'DELIVERY_WEBHOOK_TOKEN': os.environ.get('PARKING_DELIVERY_WEBHOOK_TOKEN'),
+    'DELIVERY_DIR': os.environ.get('PARKING_DELIVERY_DIR'),
+    'DELIVERY_WORKERS': 2,
+    'DELIVERY_BATCH': 50,
+    'DELIVERY_ATTEMPTS': 8,
+}
+
+bp = Blueprint('parking', __name__)
+
+# Streamed pages go out in chunks of about this many characters; the first,
+# with the page head, as soon as it is rendered
+FIRST_CHUNK_SIZE = 1024
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# Four users with different passwords
+USERS = {
+    'Arivuselvi': 'arivu123',
+    'Venkatesan': 'venkat123', 
+    'Dhiyanes': 'dhiya123',
+    'Master': 'Master123'
+}
+
+# Old single-file storage, migrated into the sharded store on startup
+BILLED_FILE = LEGACY_BILLED_FILE
+
+class Backends:
+    """Storage, search, events and caches of one app"""
+
+    def __init__(self, app):
+        config = app.config
+        self.data_dir = config['DATA_DIR']
+        # Storage for billed records, sharded per site and billing month
+        self.store = ShardedStore(self.data_dir)
+        self.search = SearchIndexes(self.store)
+        # Payments and running balances of issued bills (see parking/ledger.py)
+        self.ledger = Ledgers(self.store)
+        # Hash-chained record of billing actions (see parking/audit.py)
+        self.audit = AuditLog(audit_dir(self.data_dir))
+        # Bounded queues in front of PDF rendering and bill writes (see parking/admission.py)
+        self.admission = Admission({'pdf': config['PDF_CONCURRENCY'] or config['PDF_WORKERS'],
+                                    'write': config['WRITE_CONCURRENCY'],
+                                    'stream': config['STREAM_CONCURRENCY']},
+                                   max_waiting=config['ADMISSION_QUEUE'],
+                                   per_user=config['ADMISSION_QUEUE_PER_USER'],
+                                   timeout=config['ADMISSION_TIMEOUT'])
+        # Live /billed updates, shared by all workers through files (see parking/events.py)
+        self.events = EventBus(events_dir(self.data_dir))
+        # Parking sites, zones and slots (see parking/inventory.py)
+        self.inventory = load_inventory()
+        # Pay-and-park gate events and vehicles inside (see parking/tickets.py)
+        self.tickets = TicketOffices(self.store, self.inventory)
+        # Bills waiting to be emailed or messaged (see parking/delivery.py)
+        self.outbox = make_outbox(config, self.data_dir)
+        # Rendered slot cards of /billed (see slot_cards)
+        self.fragments = FragmentCache()
+        # Stylesheets, linked by content hash (see parking/assets.py)
+        self.assets = Assets(os.path.join(app.root_path, 'static'))
+        self.slot_records_template = app.jinja_env.from_string(SLOT_RECORDS_HTML)
+        # Streamed pages (see stream_page), compiled once instead of per render_template_string
+        self.billed_template = app.jinja_env.from_string(BILLED_HTML)
+        self.dues_template = app.jinja_env.from_string(DUES_HTML)
+        # Changes whenever a template or stylesheet does, so cached pages expire on deploy
+        self.pages_version = page_etag(self.assets.version, LOGIN_HTML, BILLING_HTML, BILLED_HTML,
+                                       SLOT_RECORDS_HTML, DUES_HTML)
+
+def make_outbox(config, data_dir):
+    """The delivery outbox, sending on the channels ``config`` has a transport for"""
+    if config['DELIVERY_DIR']:
+        channels = CHANNELS
+    else:
+        channels = tuple(channel for channel, key in (('email', 'DELIVERY_SMTP'), ('message', 'DELIVERY_WEBHOOK'))
+                         if config[key])
+
+    def transports():
+        # One set per worker thread: connections are kept open between batches
+        if config['DELIVERY_DIR']:
+            transport = DirectoryTransport(config['DELIVERY_DIR'], config['DELIVERY_FROM'])
+            return {'email': transport, 'message': transport}
+        found = {}
+        if config['DELIVERY_SMTP']:
+            host, _, port = config['DELIVERY_SMTP'].partition(':')
+            found['email'] = SmtpTransport(host, int(port or 25), config['DELIVERY_FROM'],
+                                           config['DELIVERY_SMTP_USER'], config['DELIVERY_SMTP_PASSWORD'],
+                                           config['DELIVERY_SMTP_STARTTLS'])
+        if config['DELIVERY_WEBHOOK']:
+            found['message'] = WebhookTransport(config['DELIVERY_WEBHOOK'], config['DELIVERY_WEBHOOK_TOKEN'])
+        return found
+
+    executor = config.get('PDF_EXECUTOR')
+    if executor is None:
+        render = render_pdf
+    else:
+        def render(record, header):
+            return executor.submit(render_pdf, record, header).result()
+    return Outbox(outbox_dir(data_dir), transports, channels, render, workers=config['DELIVERY_WORKERS'],
+                  batch_size=config['DELIVERY_BATCH'], max_attempts=config['DELIVERY_ATTEMPTS'])
+
+def _backends():
+    return current_app.extensions['parking']
+
+STORE = LocalProxy(lambda: _backends().store)
+SEARCH = LocalProxy(lambda: _backends().search)
+LEDGER = LocalProxy(lambda: _backends().ledger)
+AUDIT = LocalProxy(lambda: _backends().audit)
+TICKETS = LocalProxy(lambda: _backends().tickets)
+ADMISSION = LocalProxy(lambda: _backends().admission)
+OUTBOX = LocalProxy(lambda: _backends().outbox)
+EVENTS = LocalProxy(lambda: _backends().events)
+INVENTORY = LocalProxy(lambda: _backends().inventory)
+FRAGMENTS = LocalProxy(lambda: _backends().fragments)
+ASSETS = LocalProxy(lambda: _backends().assets)
+
+def _memory_dir():
+    """Private scratch directory, removed when the process exits"""
+    shm = '/dev/shm'
+    directory = tempfile.mkdtemp(prefix='parking-', dir=shm if os.access(shm, os.W_OK) else None)
+    atexit.register(shutil.rmtree, directory, ignore_errors=True)
+    return directory
+
+def create_app(config=None):
+    """Build the billing app; ``config`` overrides :data:`DEFAULT_CONFIG`
+
+    ``SECRET_KEY`` and ``DATA_DIR`` default to the ``SECRET_KEY`` and
+    ``PARKING_DATA_DIR`` environment variables.
+    """
+    app = Flask(__name__, root_path=ROOT_PATH)
+    app.config.update(DEFAULT_CONFIG)
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', secrets.token_hex(16))
+    app.config.update(config or {})
+    for key, choices in (('STORAGE_BACKEND', STORAGE_BACKENDS), ('SESSION_BACKEND', SESSION_BACKENDS),
+                         ('PDF_BACKEND', PDF_BACKENDS)):
+        if app.config[key] not in choices:
+            raise ValueError(f"{key} must be one of {', '.join(choices)}, not {app.config[key]!r}")
+
+    if app.config['STORAGE_BACKEND'] == 'memory':
+        app.config['DATA_DIR'] = _memory_dir()
+        # Nothing on disk to carry over into a scratch store
+        app.config['MIGRATE_LEGACY_FILES'] = False
+    elif not app.config.get('DATA_DIR'):
+        app.config['DATA_DIR'] = data_dir_from_env()
+    if app.config['SESSION_BACKEND'] == 'server':
+        app.session_interface = FileSessionInterface(os.path.join(app.config['DATA_DIR'], '.sessions'))
+    if app.config['PDF_BACKEND'] == 'process' and app.config.get('PDF_EXECUTOR') is None:
+        # Workers start on the first bill, not at import time
+        app.config['PDF_EXECUTOR'] = ProcessPoolExecutor(app.config['PDF_WORKERS'])
+
+    app.extensions['parking'] = Backends(app)
+    app.register_blueprint(bp)
+    with app.app_context():
+        initialize_files(migrate=app.config['MIGRATE_LEGACY_FILES'])
+    return app
+
+@bp.app_template_global()
+def asset_url(name):
+    return f"/assets/{ASSETS.url_name(name)}"
+
+def billed_file(site_id=None):
+    """Path of the old single-file records of a site"""
+    default_site = INVENTORY.default_site
+    return legacy_file(site_id or default_site, default_site)
+
+def current_site():
+    """Site selected for the logged in session"""
+    return INVENTORY.get_site(session.get('site'))
+
+def initialize_files(migrate=True):
+    """Initialize data files if they don't exist"""
+    try:
+        for site_id in INVENTORY.sites:
+            STORE.initialize(site_id)
+            if not migrate:
+                continue
+            migrated = STORE.import_legacy_file(site_id, billed_file(site_id),
+                                                INVENTORY.get_site(site_id).bill_prefix)
+            if migrated:
+                print(f"Migrated {migrated} records of {site_id} into {STORE.site_dir(site_id)}")
+                audit('migrate', site_id, sync=True, records=migrated, file=billed_file(site_id))
+                # Old bills are history: settled on the ledger
+                LEDGER.add_bills(site_id, STORE.iter_records(site_id), settled=True)
+            stamped = STORE.add_timestamps(site_id)
+            if stamped:
+                print(f"Added timestamps to {stamped} records of {site_id}")
+        return True
+    except Exception as e:
+        print(f"Error initializing files: {e}")
+        return False
+
+def load_billed_records(site_id=None, periods=None):
+    """Load billed records of a site, optionally only some YYYY-MM periods"""
+    try:
+        return STORE.load_records(site_id or INVENTORY.default_site, periods)
+    except:
+        return []
+
+def save_billed_record(record, payment=None):
+    """Save a new billed record in the shard of its site and period
+
+    ``payment`` (``{'mode': ..., 'by': ...}``) marks the bill paid in full
+    at the counter; it goes on the dues ledger with the bill.
+    """
+    site_id = record.get('site') or INVENTORY.default_site
+    try:
+        # Load the search index first so a fresh build can't include this record twice
+        SEARCH.get(site_id)
+    except Exception as e:
+        print(f"Error loading search index: {e}")
+    try:
+        # Likewise the ledger: a new one enters the bills on record as settled
+        LEDGER.get(site_id)
+    except Exception as e:
+        print(f"Error loading dues ledger: {e}")
+    try:
+        # Numbers the bill (record['bill_no']) in the same locked write
+        STORE.append(site_id, record, bill_prefix=INVENTORY.get_site(site_id).bill_prefix)
+    except:
+        return False
+    try:
+        SEARCH.add(site_id, record)
+    except Exception as e:
+        print(f"Error indexing record for search: {e}")
+    try:
+        LEDGER.add_bills(site_id, [record], payment=payment)
+    except Exception as e:
+        print(f"Error adding bill to the dues ledger: {e}")
+        payment = None
+    audit('bill', site_id, user=record.get('created_by'), bill_no=record['bill_no'],
+          vehicle_no=record.get('vehicle_no'), slot_number=record.get('slot_number'),
+          period=record.get('period'), amount=record_amount(record))
+    if payment is not None:
+        audit('payment', site_id, user=payment['by'], bill_no=record['bill_no'],
+              amount=record_amount(record), mode=payment['mode'])
+    summary = STORE.summary(site_id)
+    publish_event(site_id, {
+        'type': 'bill',
+        'record': {field: record.get(field, '') for field in
+                   ('bill_no', 'name', 'vehicle_no', 'slot_number', 'month', 'year', 'created_by')},
+        'totals': {'count': summary['count'], 'amount': summary['amount'],
+                   'slots': len(summary['slots'])},
+    })
+    queue_delivery(site_id, [record])
+    return True
+
+def queue_delivery(site_id, records):
+    """Queue bills for their tenants' email and phone; never fails the request
+
+    Returns the number of messages queued.  Only the outbox append happens
+    here; PDFs are rendered and sent by the outbox's threads.
+    """
+    header = INVENTORY.get_site(site_id).header()
+    messages = [{'channel': channel, 'to': record[field], 'site': site_id, 'record': record, 'header': header}
+                for record in records
+                for channel, field in (('email', 'email'), ('message', 'phone'))
+                if record.get(field) and channel in OUTBOX.channels]
+    if not messages:
+        return 0
+    try:
+        return OUTBOX.enqueue(messages)
+    except Exception as e:
+        print(f"Error queueing bill delivery: {e}")
+        return 0
+
+def reset_billed_records(site_id=None, created_by=None):
+    """Reset all billed records of a site (only for Master user)
+
+    The previous records are kept as a restorable snapshot.
+    """
+    site_id = site_id or INVENTORY.default_site
+    try:
+        snapshot_id = STORE.reset(site_id, created_by=created_by)
+    except:
+        return False
+    audit('reset', site_id, sync=True, user=created_by, snapshot=snapshot_id)
+    publish_event(site_id, {'type': 'reset'})
+    return True
+
+def audit(action, site_id=None, sync=False, **details):
+    """Add a billing action to the audit log; never fails the request
+
+    The user defaults to the one logged in.  ``sync`` actions (those that
+    replace or remove data) are on disk before this returns.
+    """
+    if 'user' not in details:
+        details['user'] = session.get('username') if has_request_context() else None
+    try:
+        AUDIT.record(action, site_id, sync=sync, **details)
+    except Exception as e:
+        print(f"Error auditing {action}: {e}")
+
+def publish_event(site_id, event):
+    """Tell open /billed pages about a change; never fails the request"""
+    try:
+        EVENTS.publish(site_id, event)
+    except Exception as e:
+        print(f"Error publishing {event['type']} event: {e}")
+
+def cached_page(render, etag_parts, last_modified=None, cache_control='private, no-cache'):
+    """Respond with ``render()`` unless the client's copy is still current
+
+    The ETag is derived from ``etag_parts`` before rendering, so a matching
+    If-None-Match (or If-Modified-Since) is answered with 304 without
+    rendering the page at all.
+    """
+    etag = page_etag(_backends().pages_version, *etag_parts)
+    if last_modified is not None:
+        last_modified = datetime.fromtimestamp(int(last_modified), timezone.utc)
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    else:
+        fresh = (last_modified is not None and request.if_modified_since is not None
+                 and request.if_modified_since >= last_modified)
+    response = current_app.response_class(status=304) if fresh else current_app.make_response(render())
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+def render_bill_pdf(record, site_header):
+    """Render a bill PDF, in app.config['PDF_EXECUTOR'] when one is configured
+
+    ``PDF_BACKEND = 'process'`` (and the ASGI entry point) set a process pool
+    there so CPU-heavy rendering runs outside the request threads.
+    """
+    executor = current_app.config.get('PDF_EXECUTOR')
+    if executor is None:
+        return render_pdf(record, site_header)
+    return executor.submit(render_pdf, record, site_header).result()
+
+def requested_format():
+    """Bill format asked for by ``format`` in the form or query string, or None if unknown"""
+    fmt = request.values.get('format') or DEFAULT_FORMAT
+    return fmt if fmt in FORMATS else None
+
+def pdf_slot(fmt):
+    """A PDF rendering slot for the logged in user, if ``fmt`` needs one"""
+    return ADMISSION.slot('pdf', session.get('username')) if fmt == 'pdf' else nullcontext()
+
+@bp.app_errorhandler(Overloaded)
+def overloaded(e):
+    """Tell the client to come back instead of queueing without bound"""
+    response = current_app.response_class(
+        f"Busy generating bills, please retry in {e.retry_after} seconds", status=429, mimetype='text/plain')
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+def bill_response(record, site_header, fmt, filename):
+    """Send ``record`` as a bill in format ``fmt``; only PDFs need the worker pool"""
+    bill_format = FORMATS[fmt]
+    if fmt == 'pdf':
+        body = render_bill_pdf(record, site_header)
+    else:
+        body = bill_format.render(record, site_header)
+    # The rendered bytes are the body as they are: no file wrapper, no chunking
+    response = current_app.response_class(body, content_type=bill_format.mimetype)
+    response.headers.set('Content-Disposition', 'attachment' if bill_format.attachment else 'inline',
+                         filename=f"{filename}.{bill_format.extension}")
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Login required decorator
+def login_required(f):
+    def decorated_function(*args, **kwargs):
+        if 'logged_in' not in session:
+            return redirect('/login')
+        return f(*args, **kwargs)
+    decorated_function.__name__ = f.__name__
+    return decorated_function
+
+def master_required(f):
+    """Decorator to require Master user"""
+    def decorated_function(*args, **kwargs):
+        if 'logged_in' not in session or session.get('username') != 'Master':
+            return "Access denied. Master privileges required.", 403
+        return f(*args, **kwargs)
+    decorated_function.__name__ = f.__name__
+    return decorated_function
+
+@bp.route('/')
+@login_required
+def home():
+    return redirect('/billing')
+
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'POST':
+        username = request.form['username']
+        password = request.form['password']
+        
+        if username in USERS and USERS[username] == password:
+            session['logged_in'] = True
+            session['username'] = username
+            return redirect('/billing')
+        else:
+            return render_template_string(LOGIN_HTML, error="Invalid credentials!")
+    
+    # The login form is the same for everyone
+    return cached_page(lambda: render_template_string(LOGIN_HTML), ['login'],
+                       cache_control='public, max-age=300')
+
+@bp.route('/logout')
+def logout():
+    session.clear()
+    return redirect('/login')
+
+@bp.route('/site', methods=['POST'])
+@login_required
+def select_site():
+    """Switch the session to another parking site"""
+    site_id = request.form.get('site')
+    if site_id not in INVENTORY.sites:
+        return "Unknown parking site", 400
+    session['site'] = site_id
+    return redirect(request.referrer or '/billing')
+
+@bp.route('/assets/<path:filename>')
+def assets(filename):
+    """Fingerprinted static files, cacheable for a year"""
+    name, current = ASSETS.resolve(filename)
+    if name is None:
+        abort(404)
+    if not current:
+        # Linked from a page rendered before the file changed
+        return send_from_directory(ASSETS.directory, name, max_age=0)
+    response = send_from_directory(ASSETS.directory, name, max_age=ONE_YEAR)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@bp.route('/slots/search')
+@login_required
+def search_slots():
+    """Slot autocomplete for the current site"""
+    site = current_site()
+    try:
+        limit = min(int(request.args.get('limit', 20)), 100)
+    except ValueError:
+        limit = 20
+    slots = site.search_slots(request.args.get('q', ''),
+                              vehicle_type=request.args.get('vehicle_type') or None,
+                              limit=limit)
+    return jsonify([{'id': slot['id'], 'zone': slot['zone'],
+                     'vehicle_types': slot['vehicle_types']} for slot in slots])
+
+@bp.route('/search')
+@login_required
+def search_bills():
+    """As-you-type search over customer names and vehicle numbers"""
+    try:
+        limit = min(int(request.args.get('limit', 20)), 100)
+    except ValueError:
+        limit = 20
+    return jsonify(SEARCH.search(current_site().id, request.args.get('q', ''), limit))
+
+@bp.route('/bills')
+@login_required
+def bills_between():
+    """Bills issued from one date to another, both inclusive
+
+    ``/bills?from=2025-10-01&to=2025-10-31``; ``order=newest`` lists the
+    latest bills first.
+    """
+    try:
+        first = datetime.strptime(request.args['from'], '%Y-%m-%d')
+        last = datetime.strptime(request.args.get('to') or request.args['from'], '%Y-%m-%d')
+    except (KeyError, ValueError):
+        return "from and to must be dates like 2025-10-31", 400
+    try:
+        limit = min(int(request.args.get('limit', 100)), 1000)
+    except ValueError:
+        limit = 100
+    return jsonify(SEARCH.between(current_site().id, first.timestamp(),
+                                  (last + timedelta(days=1)).timestamp(), limit,
+                                  newest_first=request.args.get('order') == 'newest'))
+
+@bp.route('/billing')
+@login_required
+def billing():
+    current_year = datetime.now().year
+    site = current_site()
+    return cached_page(lambda: render_template_string(BILLING_HTML,
+                                slots=site.search_slots(limit=50),
+                                years=YEARS,
+                                current_year=current_year,
+                                vehicle_types=VEHICLE_TYPES,
+                                payment_modes=PAYMENT_MODES,
+                                site=site,
+                                sites=INVENTORY.site_list(),
+                                delivery_enabled=bool(OUTBOX.channels),
+                                username=session.get('username')),
+                       ['billing', session.get('username'), site.id, site.name, len(site), current_year,
+                        bool(OUTBOX.channels), *PAYMENT_MODES])
+
+@bp.route('/billed')
+@login_required
+def billed():
+    site = current_site()
+    month = request.args.get('month')
+    year = request.args.get('year')
+    if (month and month not in MONTHS) or (year and year not in YEARS):
+        return f"Month must be one of {', '.join(MONTHS)} and year {YEARS[0]}-{YEARS[-1]}", 400
+    # The page only changes when the site's records or snapshots do
+    revision, modified = STORE.revision(site.id)
+    return cached_page(lambda: render_billed(site), ['billed', revision, session.get('username'),
+                                                     site.id, request.query_string],
+                       last_modified=modified)
+
+def slot_cards(site, generation, usage):
+    """Slot cards of /billed, one at a time, from cached per-(slot, period) fragments
+
+    ``generation`` and ``usage`` come from :meth:`ShardedStore.slot_periods`.
+    Fragments are keyed by generation and record count from the manifest, so
+    only slots that got new bills are rendered.  A missing fragment is
+    rendered with every other missing fragment of its period, in one pass
+    over that period's shard, and the rest wait in the cache for their cards.
+    """
+    by_period = {}
+    for slot, counts in usage.items():
+        for period, count in counts:
+            by_period.setdefault(period, {})[slot] = count
+    for slot, counts in usage.items():
+        yield {'slot': slot,
+               'count': sum(count for _, count in counts),
+               'fragments': slot_fragments(site.id, generation, slot, counts, by_period)}
+
+def slot_fragments(site_id, generation, slot, counts, by_period):
+    """Rendered records of one slot card, a period at a time"""
+    for period, count in counts:
+        html = FRAGMENTS.get((site_id, generation, slot, period, count))
+        if html is None:
+            html = render_period_fragments(site_id, generation, period, by_period[period], slot)
+        yield Markup(html)
+
+def render_period_fragments(site_id, generation, period, slots, slot):
+    """Render and cache the uncached fragments of one period; returns ``slot``'s
+
+    ``slots`` maps each slot billed in the period to its record count.  The
+    period's records are read once and only those of uncached slots kept.
+    """
+    wanted = {other: count for other, count in slots.items()
+              if other == slot or FRAGMENTS.get((site_id, generation, other, period, count)) is None}
+    found = {other: [] for other in wanted}
+    try:
+        for record in STORE.iter_records(site_id, [period], generation):
+            records = found.get(record.get('slot_number', ''))
+            # Bills appended after the manifest was read belong to a later key
+            if records is not None and len(records) < wanted[record.get('slot_number', '')]:
+                records.append(record)
+    except FileNotFoundError:
+        # The generation was reset or restored away while the page was sent
+        return ''
+    for other, records in found.items():
+        html = _backends().slot_records_template.render(records=records)
+        FRAGMENTS.put((site_id, generation, other, period, wanted[other]), html)
+        if other == slot:
+            fragment = html
+    return fragment
+
+def stream_page(template, **context):
+    """Response body that renders ``template`` while it is being sent
+
+    Only the chunk being filled is held, so memory doesn't grow with the
+    page; the first chunk (the page head) goes out before the slow parts
+    are rendered.
+    """
+    current_app.update_template_context(context)
+
+    def chunks():
+        buffer, size, limit = [], 0, FIRST_CHUNK_SIZE
+        for text in template.generate(context):
+            buffer.append(text)
+            size += len(text)
+            if size >= limit:
+                yield ''.join(buffer)
+                buffer, size, limit = [], 0, STREAM_CHUNK_SIZE
+        if buffer:
+            yield ''.join(buffer)
+
+    return stream_with_context(chunks())
+
+def render_billed(site):
+    summary = STORE.summary(site.id)
+    
+    # Optional period filter: only the matching month shards are opened
+    month = request.args.get('month')
+    year = request.args.get('year')
+    periods = None
+    if year and month:
+        periods = [period_key(month, year)]
+    elif year:
+        periods = [p for p in summary['periods'] if p.startswith(f"{year}-")]
+    # Counts come from the manifest; records are only read as their cards are sent
+    generation, usage = STORE.slot_periods(site.id, periods)
+    
+    is_master = session.get('username') == 'Master'
+    return stream_page(_backends().billed_template,
+                       slot_cards=slot_cards(site, generation, usage),
+                       slot_count=len(usage),
+                       username=session.get('username'),
+                       is_master=is_master,
+                       site=site,
+                       sites=INVENTORY.site_list(),
+                       total_slots=len(site),
+                       slots_used=len(summary['slots']),
+                       total_amount=summary['amount'],
+                       months=MONTHS,
+                       years=YEARS,
+                       selected_month=month,
+                       selected_year=year,
+                       shown_records=sum(count for counts in usage.values() for _, count in counts),
+                       snapshots=STORE.list_snapshots(site.id) if is_master else [],
+                       delivery_enabled=bool(OUTBOX.channels),
+                       total_records=summary['count'])
+
+@bp.route('/billed/stream')
+@login_required
+def billed_stream():
+    """Server-sent events with bills and resets of the current site"""
+    site_id = current_site().id
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_id')
+    # The stream outlives the request context, so take what it needs now
+    seconds = current_app.config['STREAM_SECONDS']
+    # Each stream holds a request thread: past the cap, dashboards poll instead
+    admission = ADMISSION._get_current_object()
+    admission.acquire('stream', session.get('username'), wait=False)
+    opened = time.perf_counter()
+    # Subscribed before the response starts, so no bill falls in between
+    events = EVENTS.listen(site_id, last_id, timeout=seconds)
+
+    def stream():
+        yield 'retry: 3000\n\n'
+        for item in events:
+            if item is None:
+                yield ': keep-alive\n\n'
+                continue
+            event_id, event = item
+            message = f"event: {event['type']}\ndata: {dumps(event).decode('utf-8')}\n\n"
+            yield f"id: {event_id}\n{message}" if event_id else message
+
+    response = current_app.response_class(stream(), mimetype='text/event-stream',
+                                          headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs when the server closes the response, whether or not it was streamed
+    response.call_on_close(lambda: admission.release('stream', time.perf_counter() - opened))
+    return response
+
+@bp.route('/reset_billing', methods=['POST'])
+@login_required
+@master_required
+def reset_billing():
+    """Reset all billing data of the current site - only accessible by Master user"""
+    if reset_billed_records(current_site().id, created_by=session.get('username')):
+        return redirect('/billed')
+    else:
+        return "Error resetting billing data", 500
+
+@bp.route('/import', methods=['POST'])
+@login_required
+@master_required
+def import_bills():
+    """Import historical bills from an uploaded CSV, streaming a progress report"""
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return "No CSV file uploaded", 400
+    site = current_site()
+    created_by = session.get('username')
+
+    def report():
+        stats = None
+        try:
+            for stats in import_csv(open_csv(upload.stream), STORE, site, SEARCH, created_by, ledger=LEDGER):
+                yield format_progress(stats) + '\n'
+        except CsvFormatError as e:
+            audit('import', site.id, sync=True, user=created_by, file=upload.filename, error=str(e),
+                  imported=stats['imported'] if stats else 0)
+            yield f"Error: {e}\n"
+            return
+        audit('import', site.id, sync=True, user=created_by, file=upload.filename,
+              **{key: stats[key] for key in ('rows', 'imported', 'duplicates', 'invalid')})
+        for line, error in stats['errors']:
+            yield f"line {line}: {error}\n"
+        publish_event(site.id, {'type': 'resync'})
+
+    return current_app.response_class(stream_with_context(report()), mimetype='text/plain')
+
+@bp.route('/snapshots', methods=['POST'])
+@login_required
+@master_required
+def create_snapshot():
+    """Snapshot the current site's billing data - only accessible by Master user"""
+    try:
+        snapshot_id = STORE.create_snapshot(current_site().id, created_by=session.get('username'))
+    except Exception as e:
+        return f"Error creating snapshot: {str(e)}", 500
+    audit('snapshot', current_site().id, snapshot=snapshot_id)
+    return redirect('/billed')
+
+@bp.route('/snapshots/<snapshot_id>/restore', methods=['POST'])
+@login_required
+@master_required
+def restore_snapshot(snapshot_id):
+    """Replace the current site's billing data with a snapshot"""
+    try:
+        STORE.restore_snapshot(current_site().id, snapshot_id, created_by=session.get('username'))
+    except KeyError:
+        return "Snapshot not found", 404
+    except Exception as e:
+        return f"Error restoring snapshot: {str(e)}", 500
+    audit('restore', current_site().id, sync=True, snapshot=snapshot_id)
+    publish_event(current_site().id, {'type': 'resync'})
+    return redirect('/billed')
+
+@bp.route('/snapshots/<snapshot_id>/delete', methods=['POST'])
+@login_required
+@master_required
+def delete_snapshot(snapshot_id):
+    if not STORE.delete_snapshot(current_site().id, snapshot_id):
+        return "Snapshot not found", 404
+    audit('delete_snapshot', current_site().id, sync=True, snapshot=snapshot_id)
+    return redirect('/billed')
+
+@bp.route('/seal_periods', methods=['POST'])
+@login_required
+@master_required
+def seal_periods():
+    """Close and archive all months before the current one - only accessible by Master user"""
+    now = datetime.now()
+    try:
+        periods = STORE.archive_before(current_site().id, f"{now.year:04d}-{now.month:02d}")
+    except Exception as e:
+        return f"Error archiving billing data: {str(e)}", 500
+    audit('seal', current_site().id, periods=periods)
+    return redirect('/billed')
+
+@bp.route('/generate', methods=['POST'])
+@login_required
+def generate():
+    try:
+        # Get form data
+        name = request.form['name']
+        vehicle_no = request.form['vehicle_no']
+        vehicle_type = request.form['vehicle_type']
+        slot_number = request.form['slot_number']
+        month = request.form['month']
+        year = request.form['year']
+        payment_mode = request.form['payment_mode']
+        paid_now = request.form.get('payment_status', 'paid') == 'paid'
+        email = request.form.get('email', '').strip()
+        phone = request.form.get('phone', '').strip()
+        fmt = requested_format()
+        if fmt is None:
+            return f"Unknown bill format {request.values.get('format')}", 400
+        
+        if month not in MONTHS or year not in YEARS:
+            return f"Month must be one of {', '.join(MONTHS)} and year {YEARS[0]}-{YEARS[-1]}", 400
+        
+        site = current_site()
+        if site.get_slot(slot_number) is None:
+            return f"Unknown parking slot {slot_number} for {site.name}", 400
+        if not site.slot_allows(slot_number, vehicle_type):
+            return f"Slot {slot_number} does not accept vehicle type {vehicle_type}", 400
+        if payment_mode not in PAYMENT_MODES:
+            return f"Unknown payment mode {payment_mode}", 400
+        if email and not valid_email(email):
+            return "Invalid email address", 400
+        if phone and not valid_phone(phone):
+            return "Invalid phone number", 400
+        
+        billed_record = {
+            'name': name,
+            'vehicle_no': vehicle_no,
+            'vehicle_type': vehicle_type,
+            'site': site.id,
+            'slot_number': slot_number,
+            'month': month,
+            'year': year,
+            'payment_mode': payment_mode,
+            'bill_date': datetime.now().strftime("%d-%m-%Y %H:%M:%S"),
+            'bill_amount': 'Rs. 1000.00',
+            'created_by': session.get('username')
+        }
+        # Where the bill is sent, if anywhere (see queue_delivery)
+        if email:
+            billed_record['email'] = email
+        if phone:
+            billed_record['phone'] = phone
+        
+        # The PDF slot is taken before saving, so a busy renderer never
+        # turns away a bill that was already saved
+        with pdf_slot(fmt):
+            # Save first: the bill number printed on the bill is allocated with the write
+            with ADMISSION.slot('write', session.get('username')):
+                payment = {'mode': payment_mode, 'by': session.get('username')} if paid_now else None
+                if not save_billed_record(billed_record, payment):
+                    return "Error saving bill", 500
+            
+            filename = f"Parking_Bill_{billed_record['bill_no']}_{name.replace(' ', '_')}_{month}_{year}"
+            return bill_response(billed_record, site.header(), fmt, filename)
+        
+    except Overloaded:
+        raise
+    except Exception as e:
+        return f"Error generating bill: {str(e)}", 500
+
+@bp.route('/bills/<bill_no>')
+@login_required
+def reprint_bill(bill_no):
+    """Download an issued bill again by its number, in any bill format"""
+    site = current_site()
+    fmt = requested_format()
+    if fmt is None:
+        return f"Unknown bill format {request.values.get('format')}", 400
+    # The index only says which shard to read; the bill comes from the store
+    doc = SEARCH.find_bill(site.id, bill_no)
+    record = doc and STORE.find_record(site.id, period_key(doc['month'], doc['year']), bill_no)
+    if record is None:
+        return f"Bill {bill_no} not found for {site.name}", 404
+    try:
+        with pdf_slot(fmt):
+            return bill_response(record, site.header(), fmt, f"Parking_Bill_{bill_no}")
+    except Overloaded:
+        raise
+    except Exception as e:
+        return f"Error generating bill: {str(e)}", 500
+
+@bp.route('/bills/<bill_no>/payments', methods=['POST'])
+@login_required
+def record_payment(bill_no):
+    """Record a full or part payment of an issued bill"""
+    site = current_site()
+    try:
+        amount = Decimal(request.form['amount'])
+    except (KeyError, InvalidOperation):
+        return "Payment amount must be a number", 400
+    # Whole paise only; also refuses inf and nan, which float() would accept
+    if not amount.is_finite() or amount.as_tuple().exponent < -2:
+        return "Payment amount must be in rupees with at most 2 decimal places", 400
+    if request.form.get('payment_mode') not in (None, *PAYMENT_MODES):
+        return f"Unknown payment mode {request.form['payment_mode']}", 400
+    try:
+        LEDGER.pay(site.id, bill_no, amount, request.form.get('payment_mode'), session.get('username'))
+    except KeyError:
+        return f"Bill {bill_no} not found for {site.name}", 404
+    except ValueError as e:
+        return str(e), 400
+    audit('payment', site.id, bill_no=bill_no, amount=float(amount), mode=request.form.get('payment_mode'))
+    return redirect('/dues')
+
+def gate_event(event_type):
+    """Gate event of the JSON or form body, by the logged in user"""
+    data = request.get_json(silent=True) or request.form
+    return {'type': event_type, 'by': session.get('username'),
+            **{field: data.get(field) for field in ('vehicle_no', 'vehicle_type', 'gate', 'at')}}
+
+def gate_response(result, status=200):
+    if 'error' in result:
+        return jsonify(error=result['error']), result['status']
+    return jsonify(result), status
+
+@bp.route('/gate/in', methods=['POST'])
+@login_required
+def gate_in():
+    """Check a pay-and-park vehicle in: opens its ticket"""
+    result, = TICKETS.record(current_site().id, [gate_event('in')])
+    return gate_response(result, 201)
+
+@bp.route('/gate/out', methods=['POST'])
+@login_required
+def gate_out():
+    """Check a vehicle out: closes its ticket with the duration and amount due"""
+    result, = TICKETS.record(current_site().id, [gate_event('out')])
+    return gate_response(result)
+
+@bp.route('/gate/events', methods=['POST'])
+@login_required
+def gate_events():
+    """A gate controller's batch of events, logged with one write
+
+    The body is a JSON list of events (``type`` ``in`` or ``out``,
+    ``vehicle_no``, optional ``vehicle_type``, ``gate`` and ``at``); the
+    answer lists a ticket or an ``error`` for each, in order.
+    """
+    events = request.get_json(silent=True)
+    if not isinstance(events, list) or not all(isinstance(event, dict) for event in events):
+        return "Expected a JSON list of gate events", 400
+    username = session.get('username')
+    return jsonify(TICKETS.record(current_site().id, [dict(event, by=username) for event in events]))
+
+@bp.route('/gate')
+@login_required
+def gate_summary():
+    """Vehicles inside, longest stay first, with ticket counts and today's takings"""
+    return jsonify(TICKETS.summary(current_site().id, request.args.get('limit', 100, type=int)))
+
+@bp.before_app_request
+def start_outbox():
+    """Send what is waiting in the outbox, from this worker if it becomes the sender"""
+    OUTBOX.start()
+
+@bp.route('/deliveries')
+@login_required
+def deliveries():
+    """Outbox counts of bill deliveries, and the latest dead letters for Master"""
+    stats = OUTBOX.stats()
+    stats['channels'] = list(OUTBOX.channels)
+    if session.get('username') == 'Master':
+        stats['dead_letters'] = [
+            {'bill_no': letter['record'].get('bill_no'), 'site': letter['site'], 'channel': letter['channel'],
+             'to': letter['to'], 'attempts': letter['attempts'], 'error': letter['error']}
+            for letter in OUTBOX.dead_letters()]
+    response = jsonify(stats)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@bp.route('/deliveries/run', methods=['POST'])
+@login_required
+@master_required
+def run_deliveries():
+    """Queue every bill of a month with an email or phone for delivery"""
+    month = request.form.get('month')
+    year = request.form.get('year')
+    if month not in MONTHS or not (year or '').isdigit():
+        return "Month and year are required", 400
+    site = current_site()
+    queued = 0
+    batch = []
+    for record in STORE.iter_records(site.id, [period_key(month, year)]):
+        if record.get('email') or record.get('phone'):
+            batch.append(record)
+        if len(batch) >= 1000:
+            queued += queue_delivery(site.id, batch)
+            batch = []
+    queued += queue_delivery(site.id, batch)
+    audit('deliver', site.id, month=month, year=year, queued=queued)
+    if request.values.get('format') == 'json':
+        return jsonify({'queued': queued})
+    return redirect('/billed')
+
+@bp.route('/deliveries/dead/requeue', methods=['POST'])
+@login_required
+@master_required
+def requeue_dead_deliveries():
+    """Try every dead letter again"""
+    requeued = OUTBOX.requeue_dead()
+    audit('requeue_deliveries', current_site().id, requeued=requeued)
+    return jsonify({'requeued': requeued})
+
+@bp.route('/admission')
+@login_required
+def admission_stats():
+    """Running and queued requests of each stage in this worker, for monitoring"""
+    response = jsonify(ADMISSION.stats())
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@bp.route('/dues')
+@login_required
+def dues():
+    """Tenants with overdue bills, served from the dues ledger"""
+    site = current_site()
+    tenants = LEDGER.overdue(site.id)
+    if request.args.get('format') == 'json':
+        return jsonify(tenants)
+    return current_app.response_class(stream_page(
+        _backends().dues_template,
+        tenants=tenants,
+        totals=LEDGER.totals(site.id),
+        payment_modes=PAYMENT_MODES,
+        date=lambda timestamp: datetime.fromtimestamp(timestamp).strftime('%d-%m-%Y'),
+        site=site,
+        sites=INVENTORY.site_list(),
+        username=session.get('username'),
+        is_master=session.get('username') == 'Master'))
+
+# HTML Templates
+LOGIN_HTML = '''
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Login - Parking System</title>
+    <link rel="stylesheet" href="{{ asset_url('css/login.css') }}">
+</head>
+<body>
+    <div class="login-container">
+        <div class="login-header">
+            <h1>🅿️ Parking System</h1>
+            <p>Vengatesan Car Parking</p>
+        </div>
+        <form method="POST">
+            <div class="form-group">
+                <label>Username:</label>
+                <input type="text" name="username" required>
+            </div>
+            <div class="form-group">
+                <label>Password:</label>
+                <input type="password" name="password" required>
+            </div>
+            <button type="submit" class="login-btn">Login</button>
+            {% if error %}
+            <div class="error">{{ error }}</div>
+            {% endif %}
+        </form>
+        
+        <div class="demo-accounts">
+            <h4>Demo Accounts:</h4>
+            <div class="user-list">
+                <div><strong>Master</strong> / Master123</div>
+                <div><strong>Arivuselvi</strong> / arivu123</div>
+                <div><strong>Venkatesan</strong> / venkat123</div>
+                <div><strong>Dhiyanes</strong> / dhiya123</div>
+            </div>
+        </div>
+    </div>
+</body>
+</html>
+'''
+
+BILLING_HTML = '''
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Billing - Parking System</title>
+    <link rel="stylesheet" href="{{ asset_url('css/billing.css') }}">
+</head>
+<body>
+    <div class="navbar">
+        <div class="nav-brand">🅿️ {{ site.name }}</div>
+        <div class="nav-menu">
+            <a href="/billing" class="nav-item active">Billing</a>
+            <a href="/billed" class="nav-item">Billed</a>
+            <a href="/dues" class="nav-item">Dues</a>
+        </div>
+        <div class="user-info">
+            {% if sites|length > 1 %}
+            <form action="/site" method="POST" class="site-form" style="display: inline;">
+                <select name="site" onchange="this.form.submit()">
+                    {% for s in sites %}
+                    <option value="{{ s.id }}" {% if s.id == site.id %}selected{% endif %}>{{ s.name }}</option>
+                    {% endfor %}
+                </select>
+            </form> |
+            {% endif %}
+            Welcome, {{ username }} | <a href="/logout" style="color: #667eea;">Logout</a>
+        </div>
+    </div>
+
+    <div class="container">
+        <div class="form-container">
+            <div class="welcome-message">
+                <h1>Monthly Parking Bill Generator</h1>
+                <p>Generate parking bills for monthly customers</p>
+            </div>
+            
+            <div class="business-info">
+                <p><strong>📍 Address:</strong> {{ site.address }}</p>
+                <p><strong>📞 Contact:</strong> {{ site.contact }}</p>
+                <p><strong>💰 Monthly Rate:</strong> Rs. 1000</p>
+            </div>
+            
+            <form action="/generate" method="POST">
+                <div class="form-group">
+                    <label for="name">Customer Name:</label>
+                    <input type="text" id="name" name="name" required>
+                </div>
+                
+                <div class="form-group">
+                    <label for="vehicle_no">Vehicle Number:</label>
+                    <input type="text" id="vehicle_no" name="vehicle_no" required>
+                </div>
+                
+                <div class="form-group">
+                    <label for="email">Email (optional):</label>
+                    <input type="email" id="email" name="email" autocomplete="off">
+                </div>
+                
+                <div class="form-group">
+                    <label for="phone">Phone (optional):</label>
+                    <input type="tel" id="phone" name="phone" autocomplete="off">
+                    <div class="hint">The bill is sent here as well{% if not delivery_enabled %} once delivery is set up{% endif %}</div>
+                </div>
+                
+                <div class="form-group">
+                    <label for="vehicle_type">Vehicle Type:</label>
+                    <select id="vehicle_type" name="vehicle_type" required>
+                        {% for vehicle_type in vehicle_types %}
+                        <option value="{{ vehicle_type }}">{{ vehicle_type|capitalize }}</option>
+                        {% endfor %}
+                    </select>
+                </div>
+                
+                <div class="form-group">
+                    <label for="slot_number">Parking Slot:</label>
+                    <input type="text" id="slot_number" name="slot_number" list="slot_options"
+                           autocomplete="off" placeholder="Type a slot number, e.g. {{ slots[0].id if slots else 'SLOT-01' }}" required>
+                    <datalist id="slot_options">
+                        {% for slot in slots %}
+                        <option value="{{ slot.id }}">Zone {{ slot.zone }}</option>
+                        {% endfor %}
+                    </datalist>
+                    <div class="hint">{{ site|length }} slots at this site</div>
+                </div>
+                
+                <div class="form-group">
+                    <label for="month">Month:</label>
+                    <select id="month" name="month" required>
+                        <option value="January">January</option>
+                        <option value="February">February</option>
+                        <option value="March">March</option>
+                        <option value="April">April</option>
+                        <option value="May">May</option>
+                        <option value="June">June</option>
+                        <option value="July">July</option>
+                        <option value="August">August</option>
+                        <option value="September">September</option>
+                        <option value="October">October</option>
+                        <option value="November">November</option>
+                        <option value="December">December</option>
+                    </select>
+                </div>
+                
+                <div class="form-group">
+                    <label for="year">Year:</label>
+                    <select id="year" name="year" required>
+                        {% for year in years %}
+                        <option value="{{ year }}" {% if year == current_year %}selected{% endif %}>{{ year }}</option>
+                        {% endfor %}
+                    </select>
+                </div>
+                
+                <div class="form-group">
+                    <label for="payment_mode">Payment Mode:</label>
+                    <select id="payment_mode" name="payment_mode" required>
+                        {% for mode in payment_modes %}
+                        <option value="{{ mode }}">{{ mode }}</option>
+                        {% endfor %}
+                    </select>
+                </div>
+                
+                <div class="form-group">
+                    <label for="payment_status">Payment:</label>
+                    <select id="payment_status" name="payment_status">
+                        <option value="paid">Paid now</option>
+                        <option value="unpaid">Pay later (goes on the dues ledger)</option>
+                    </select>
+                </div>
+                
+                <div class="form-group">
+                    <label for="format">Bill Format:</label>
+                    <select id="format" name="format">
+                        <option value="pdf">PDF (A4)</option>
+                        <option value="html">Printable page</option>
+                        <option value="text">Text receipt</option>
+                        <option value="escpos">Thermal printer (ESC/POS)</option>
+                    </select>
+                </div>
+                
+                <button type="submit" class="submit-btn">Generate Bill</button>
+            </form>
+        </div>
+    </div>
+
+    <script>
+        // Server-side slot search so large sites never ship every slot to the browser
+        (function () {
+            var input = document.getElementById('slot_number');
+            var vehicleType = document.getElementById('vehicle_type');
+            var options = document.getElementById('slot_options');
+            var timer = null;
+            function refresh() {
+                var url = '/slots/search?q=' + encodeURIComponent(input.value) +
+                          '&vehicle_type=' + encodeURIComponent(vehicleType.value);
+                fetch(url).then(function (r) { return r.json(); }).then(function (slots) {
+                    options.innerHTML = '';
+                    slots.forEach(function (slot) {
+                        var option = document.createElement('option');
+                        option.value = slot.id;
+                        option.textContent = 'Zone ' + slot.zone;
+                        options.appendChild(option);
+                    });
+                });
+            }
+            function schedule() {
+                clearTimeout(timer);
+                timer = setTimeout(refresh, 150);
+            }
+            input.addEventListener('input', schedule);
+            vehicleType.addEventListener('change', schedule);
+        })();
+    </script>
+</body>
+</html>
+'''
+
+BILLED_HTML = '''
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Billed Records - Parking System</title>
+    <link rel="stylesheet" href="{{ asset_url('css/billed.css') }}">
+</head>
+<body>
+    <div class="navbar">
+        <div class="nav-brand">🅿️ {{ site.name }}</div>
+        <div class="nav-menu">
+            <a href="/billing" class="nav-item">Billing</a>
+            <a href="/billed" class="nav-item active">Billed</a>
+            <a href="/dues" class="nav-item">Dues</a>
+        </div>
+        <div class="user-info">
+            {% if sites|length > 1 %}
+            <form action="/site" method="POST" class="site-form" style="display: inline;">
+                <select name="site" onchange="this.form.submit()">
+                    {% for s in sites %}
+                    <option value="{{ s.id }}" {% if s.id == site.id %}selected{% endif %}>{{ s.name }}</option>
+                    {% endfor %}
+                </select>
+            </form> |
+            {% endif %}
+            Welcome, {{ username }} 
+            {% if is_master %}<span class="master-badge">MASTER</span>{% endif %}
+            | <a href="/logout" style="color: #667eea;">Logout</a>
+        </div>
+    </div>
+
+    <div class="container">
+        <div class="content-container">
+            <h1>Billed Records - {{ site.name }}</h1>
+            
+            {% if total_records > 0 %}
+            <div class="stats-info">
+                <strong>Total Records: <span id="total_records">{{ total_records }}</span></strong> | 
+                <strong>Total Revenue: ₹<span id="total_amount">{{ '%.0f'|format(total_amount) }}</span></strong> | 
+                <strong>Slots Used: <span id="slots_used">{{ slots_used }}</span>/{{ total_slots }}</strong>
+            </div>
+
+            <div class="search-box">
+                <input type="search" id="bill_search" placeholder="🔍 Find bills by customer name or vehicle number (e.g. TN 31 AB 1234)" autocomplete="off">
+                <div id="search_results"></div>
+            </div>
+
+            <form method="GET" action="/billed" class="period-filter">
+                <select name="month">
+                    <option value="">All months</option>
+                    {% for m in months %}
+                    <option value="{{ m }}" {% if m == selected_month %}selected{% endif %}>{{ m }}</option>
+                    {% endfor %}
+                </select>
+                <select name="year">
+                    <option value="">All years</option>
+                    {% for y in years %}
+                    <option value="{{ y }}" {% if y == selected_year %}selected{% endif %}>{{ y }}</option>
+                    {% endfor %}
+                </select>
+                <button type="submit">Filter</button>
+                {% if selected_year %}
+                <span>Showing {{ shown_records }} of {{ total_records }} records</span>
+                {% endif %}
+            </form>
+            {% endif %}
+
+            <div class="slot-grid">
+                {% for card in slot_cards %}
+                <div class="slot-card" data-slot="{{ card.slot }}" data-count="{{ card.count }}">
+                    <div class="slot-header">{{ card.slot }} ({{ card.count }})</div>
+                    {% for fragment in card.fragments %}{{ fragment }}{% endfor %}
+                </div>
+                {% endfor %}
+            </div>
+
+            <div id="no_records" style="text-align: center; color: #666; padding: 40px;{% if slot_count %} display: none;{% endif %}">
+                No billed records found
+            </div>
+
+            {% if is_master %}
+            <div class="reset-section">
+                <h3>🔧 Master Control</h3>
+                <p>Total records: <strong>{{ total_records }}</strong></p>
+                <form action="/seal_periods" method="POST" style="margin-bottom: 15px;">
+                    <button type="submit" class="reset-btn" style="background: #667eea;">🔒 Close Past Months</button>
+                </form>
+                {% if delivery_enabled %}
+                <form action="/deliveries/run" method="POST" style="margin-bottom: 15px;">
+                    <select name="month" required>
+                        {% for m in months %}
+                        <option value="{{ m }}" {% if m == selected_month %}selected{% endif %}>{{ m }}</option>
+                        {% endfor %}
+                    </select>
+                    <select name="year" required>
+                        {% for y in years %}
+                        <option value="{{ y }}" {% if y == selected_year %}selected{% endif %}>{{ y }}</option>
+                        {% endfor %}
+                    </select>
+                    <button type="submit" class="reset-btn" style="background: #2196F3;">📧 Send Month's Bills</button>
+                </form>
+                {% endif %}
+                <form action="/snapshots" method="POST" style="margin-bottom: 15px;">
+                    <button type="submit" class="reset-btn" style="background: #4CAF50;">📸 Take Snapshot</button>
+                </form>
+                <form action="/import" method="POST" enctype="multipart/form-data" style="margin-bottom: 15px;">
+                    <input type="file" name="file" accept=".csv,text/csv" required>
+                    <button type="submit" class="reset-btn" style="background: #ff9800;">📥 Import CSV History</button>
+                </form>
+                <form action="/reset_billing" method="POST" onsubmit="return confirmReset()">
+                    <button type="submit" class="reset-btn">🚨 Reset All Data</button>
+                </form>
+
+                {% if snapshots %}
+                <h4>Snapshots</h4>
+                <table class="snapshot-table">
+                    <tr><th>Taken</th><th>Reason</th><th>By</th><th>Records</th><th></th></tr>
+                    {% for snap in snapshots %}
+                    <tr>
+                        <td>{{ snap.created_at }}</td>
+                        <td>{{ snap.reason }}</td>
+                        <td>{{ snap.created_by or '-' }}</td>
+                        <td>{{ snap.count }}</td>
+                        <td>
+                            <form action="/snapshots/{{ snap.id }}/restore" method="POST" style="display: inline;"
+                                  onsubmit="return confirm('Restore this snapshot? Current data is snapshotted first.')">
+                                <button type="submit">Restore</button>
+                            </form>
+                            <form action="/snapshots/{{ snap.id }}/delete" method="POST" style="display: inline;"
+                                  onsubmit="return confirm('Delete this snapshot permanently?')">
+                                <button type="submit">Delete</button>
+                            </form>
+                        </td>
+                    </tr>
+                    {% endfor %}
+                </table>
+                {% endif %}
+            </div>
+            {% endif %}
+        </div>
+    </div>
+
+    <script>
+        (function () {
+            var input = document.getElementById('bill_search');
+            if (!input) { return; }
+            var results = document.getElementById('search_results');
+            var timer = null;
+            function show(bills) {
+                results.innerHTML = '';
+                bills.forEach(function (bill) {
+                    var item = document.createElement('div');
+                    item.className = 'record-item';
+                    var name = document.createElement('strong');
+                    name.textContent = bill.name;
+                    item.appendChild(name);
+                    item.appendChild(document.createTextNode(
+                        ' | ' + (bill.bill_no ? bill.bill_no + ' | ' : '') + bill.vehicle_no + ' | ' + bill.slot_number +
+                        ' | ' + bill.month + ' ' + bill.year + ' | ' + bill.bill_date));
+                    results.appendChild(item);
+                });
+            }
+            input.addEventListener('input', function () {
+                clearTimeout(timer);
+                if (!input.value.trim()) { show([]); return; }
+                timer = setTimeout(function () {
+                    fetch('/search?q=' + encodeURIComponent(input.value))
+                        .then(function (r) { return r.json(); }).then(show);
+                }, 120);
+            });
+        })();
+
+        // Live updates: bills issued by colleagues appear without a reload
+        (function () {
+            if (!window.EventSource) { return; }
+            var month = {{ (selected_month or '')|tojson }};
+            var year = {{ (selected_year or '')|tojson }};
+            var grid = document.querySelector('.slot-grid');
+            var source;
+            var lastId = '';
+            function setText(id, value) {
+                var el = document.getElementById(id);
+                if (el) { el.textContent = value; }
+            }
+            function findCard(slot) {
+                var cards = grid.querySelectorAll('.slot-card');
+                for (var i = 0; i < cards.length; i++) {
+                    if (cards[i].getAttribute('data-slot') === slot) { return cards[i]; }
+                }
+                return null;
+            }
+            function addLine(item, tag, text) {
+                var el = document.createElement(tag);
+                el.textContent = text;
+                item.appendChild(el);
+                if (tag !== 'small') { item.appendChild(document.createElement('br')); }
+            }
+            function onBill(e) {
+                var data = JSON.parse(e.data);
+                var bill = data.record;
+                if (!document.getElementById('total_records')) { location.reload(); return; }
+                setText('total_records', data.totals.count);
+                setText('total_amount', Math.round(data.totals.amount));
+                setText('slots_used', data.totals.slots);
+                if ((month && bill.month !== month) || (year && bill.year !== year)) { return; }
+                var card = findCard(bill.slot_number);
+                if (!card) {
+                    card = document.createElement('div');
+                    card.className = 'slot-card';
+                    card.setAttribute('data-slot', bill.slot_number);
+                    card.setAttribute('data-count', '0');
+                    var header = document.createElement('div');
+                    header.className = 'slot-header';
+                    card.appendChild(header);
+                    grid.appendChild(card);
+                }
+                var count = parseInt(card.getAttribute('data-count'), 10) + 1;
+                card.setAttribute('data-count', count);
+                card.querySelector('.slot-header').textContent = bill.slot_number + ' (' + count + ')';
+                var item = document.createElement('div');
+                item.className = 'record-item';
+                addLine(item, 'strong', bill.name);
+                if (bill.bill_no) {
+                    var link = document.createElement('a');
+                    link.href = '/bills/' + encodeURIComponent(bill.bill_no);
+                    link.textContent = bill.bill_no;
+                    item.appendChild(document.createTextNode('Bill: '));
+                    item.appendChild(link);
+                    item.appendChild(document.createElement('br'));
+                }
+                addLine(item, 'span', 'Vehicle: ' + bill.vehicle_no);
+                addLine(item, 'span', 'Period: ' + bill.month + ' ' + bill.year);
+                addLine(item, 'small', 'By: ' + bill.created_by);
+                card.appendChild(item);
+                var empty = document.getElementById('no_records');
+                if (empty) { empty.style.display = 'none'; }
+            }
+            function onReset() {
+                // Master also sees the snapshot the reset just created
+                if ({{ is_master|tojson }}) { location.reload(); return; }
+                grid.innerHTML = '';
+                setText('total_records', 0);
+                setText('total_amount', 0);
+                setText('slots_used', 0);
+                document.getElementById('no_records').style.display = '';
+            }
+            function track(handler) {
+                return function (e) {
+                    if (e.lastEventId) { lastId = e.lastEventId; }
+                    handler(e);
+                };
+            }
+            function connect() {
+                source = new EventSource('/billed/stream' + (lastId ? '?last_id=' + encodeURIComponent(lastId) : ''));
+                source.addEventListener('bill', track(onBill));
+                source.addEventListener('reset', track(onReset));
+                source.addEventListener('resync', function () { location.reload(); });
+                source.onerror = function () {
+                    // Refused (the server has enough open streams): poll again later
+                    if (source.readyState === EventSource.CLOSED) { setTimeout(connect, 30000); }
+                };
+            }
+            connect();
+        })();
+
+        function confirmReset() {
+            return confirm('🚨 ARE YOU SURE?\\n\\nThis will clear ALL billing records of {{ site.name }}.\\nA snapshot is kept and can be restored from Master Control.');
+        }
+    </script>
+</body>
+</html>
+'''
+
+# Tenants with overdue bills, and payment forms, for /dues
+DUES_HTML = '''
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Dues - Parking System</title>
+    <link rel="stylesheet" href="{{ asset_url('css/billed.css') }}">
+</head>
+<body>
+    <div class="navbar">
+        <div class="nav-brand">🅿️ {{ site.name }}</div>
+        <div class="nav-menu">
+            <a href="/billing" class="nav-item">Billing</a>
+            <a href="/billed" class="nav-item">Billed</a>
+            <a href="/dues" class="nav-item active">Dues</a>
+        </div>
+        <div class="user-info">
+            {% if sites|length > 1 %}
+            <form action="/site" method="POST" class="site-form" style="display: inline;">
+                <select name="site" onchange="this.form.submit()">
+                    {% for s in sites %}
+                    <option value="{{ s.id }}" {% if s.id == site.id %}selected{% endif %}>{{ s.name }}</option>
+                    {% endfor %}
+                </select>
+            </form> |
+            {% endif %}
+            Welcome, {{ username }}
+            {% if is_master %}<span class="master-badge">MASTER</span>{% endif %}
+            | <a href="/logout" style="color: #667eea;">Logout</a>
+        </div>
+    </div>
+
+    <div class="container">
+        <div class="content-container">
+            <h1>Overdue Tenants - {{ site.name }}</h1>
+            <div class="stats-info">
+                <strong>Overdue Tenants: {{ tenants|length }}</strong> |
+                <strong>Unpaid Bills: {{ totals.bills }}</strong> |
+                <strong>Outstanding: ₹{{ '%.2f'|format(totals.amount) }}</strong>
+            </div>
+
+            {% if tenants %}
+            <table class="snapshot-table">
+                <tr><th>Vehicle</th><th>Customer</th><th>Overdue</th><th>Balance</th><th>Due Since</th><th>Bills</th></tr>
+                {% for tenant in tenants %}
+                <tr>
+                    <td>{{ tenant.vehicle_no }}</td>
+                    <td>{{ tenant.name }}</td>
+                    <td>₹{{ '%.2f'|format(tenant.overdue) }}</td>
+                    <td>₹{{ '%.2f'|format(tenant.balance) }}</td>
+                    <td>{{ date(tenant.oldest_due_at) }}</td>
+                    <td>
+                        {% for bill in tenant.bills %}
+                        <form action="/bills/{{ bill.bill_no }}/payments" method="POST" style="margin: 4px 0;">
+                            <a href="/bills/{{ bill.bill_no }}?format=html" target="_blank">{{ bill.bill_no }}</a>
+                            {{ bill.slot_number }}, ₹{{ '%.2f'|format(bill.balance) }} due
+                            <input type="number" name="amount" value="{{ '%.2f'|format(bill.balance) }}"
+                                   min="0.01" max="{{ '%.2f'|format(bill.balance) }}" step="0.01" style="width: 90px;">
+                            <select name="payment_mode">
+                                {% for mode in payment_modes %}
+                                <option value="{{ mode }}">{{ mode }}</option>
+                                {% endfor %}
+                            </select>
+                            <button type="submit">Record Payment</button>
+                        </form>
+                        {% endfor %}
+                    </td>
+                </tr>
+                {% endfor %}
+            </table>
+            {% else %}
+            <div style="text-align: center; color: #666; padding: 40px;">No overdue bills</div>
+            {% endif %}
+        </div>
+    </div>
+</body>
+</html>
+'''
+
+# Records of one slot and period inside a /billed slot card
+SLOT_RECORDS_HTML = '''
+                    {% for record in records %}
+                    <div class="record-item">
+                        <strong>{{ record.name }}</strong><br>
+                        {% if record.bill_no %}Bill: <a href="/bills/{{ record.bill_no }}">{{ record.bill_no }}</a>
+                        (<a href="/bills/{{ record.bill_no }}?format=html" target="_blank">print</a>)<br>{% endif %}
+                        Vehicle: {{ record.vehicle_no }}<br>
+                        Period: {{ record.month }} {{ record.year }}<br>
+                        <small>By: {{ record.created_by }}</small>
+                    </div>
+                    {% endfor %}
+'''
+
+def make_handler(app):
+    """Vercel serverless function handler for ``app``"""
+    def handler(request, context):
+        with app.app_context():
+            response = app.full_dispatch_request()
+            return {
+                'statusCode': response.status_code,
+                'headers': dict(response.headers),
+                'body': response.get_data(as_text=True)
+            }
+    return handler
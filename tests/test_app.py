@@ -0,0 +1,199 @@
+"""The billing pages and endpoints, against every backend combination"""
+import re
+import time
+
+from tests.conftest import BILL_FORM
+
+
+def bill_number(response):
+    """Bill number from the filename of a bill response"""
+    return re.search(r'Parking_Bill_([A-Z]+\d{6}-\d{4})', response.headers['Content-Disposition']).group(1)
+
+
+def test_pages_need_a_login(app):
+    client = app.test_client()
+    for path in ('/billing', '/billed', '/search?q=kum', '/bills/VP202510-0001', '/admission', '/dues'):
+        response = client.get(path)
+        assert response.status_code == 302, path
+        assert response.headers['Location'].endswith('/login')
+
+
+def test_generate_returns_a_numbered_pdf(issue_bill):
+    response = issue_bill()
+    assert response.status_code == 200
+    assert response.mimetype == 'application/pdf'
+    assert response.data.startswith(b'%PDF')
+    assert bill_number(response) == 'VP202510-0001'
+    assert bill_number(issue_bill()) == 'VP202510-0002'
+
+
+def test_generate_rejects_bad_input(issue_bill):
+    assert issue_bill(slot_number='NO-SUCH-SLOT').status_code == 400
+    assert issue_bill(payment_mode='Cheque').status_code == 400
+    assert issue_bill(email='tenant@example.com\r\nBcc: someone@example.com').status_code == 400
+    assert issue_bill(phone='12').status_code == 400
+    assert issue_bill(format='docx').status_code == 400
+    assert issue_bill(month='Foo').status_code == 400
+    assert issue_bill(year='abc').status_code == 400
+    assert issue_bill(year='1900').status_code == 400
+
+
+def test_every_payment_mode_is_accepted(issue_bill):
+    for mode in ('Cash', 'Online', 'Card', 'UPI'):
+        assert issue_bill(payment_mode=mode, format='text').status_code == 200, mode
+
+
+def test_billed_lists_bills_and_revalidates(client, issue_bill):
+    issue_bill()
+    response = client.get('/billed')
+    assert response.status_code == 200
+    assert b'Kumar' in response.data
+    assert client.get('/billed', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    issue_bill(name='Selvam')
+    response = client.get('/billed', headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 200
+    assert b'Selvam' in response.data
+
+
+def test_search_finds_bills_with_numeric_times(client, issue_bill):
+    issue_bill()
+    results = client.get('/search?q=kum').get_json()
+    assert [result['name'] for result in results] == ['Kumar']
+    assert isinstance(results[0]['issued_at'], int)
+    assert results[0]['period'] == 202510
+    assert client.get('/search?q=tn31ab').get_json()[0]['bill_no'] == 'VP202510-0001'
+    assert client.get('/search?q=nobody').get_json() == []
+
+
+def test_reprint_is_the_issued_bill(client, issue_bill):
+    issued = issue_bill(format='text', email='tenant@example.com')
+    response = client.get(f'/bills/{bill_number(issued)}?format=text')
+    assert response.status_code == 200
+    assert response.data == issued.data
+    response = client.get(f'/bills/{bill_number(issued)}')
+    assert response.mimetype == 'application/pdf'
+    assert client.get('/bills/VP209901-0001').status_code == 404
+
+
+def test_reset_empties_the_site(client, issue_bill):
+    bill_no = bill_number(issue_bill())
+    response = client.post('/reset_billing')
+    assert response.status_code == 302
+    assert b'Kumar' not in client.get('/billed').data
+    assert client.get('/search?q=kum').get_json() == []
+    assert client.get(f'/bills/{bill_no}').status_code == 404
+    # Numbers are never handed out twice, even after a reset
+    assert bill_number(issue_bill()) == 'VP202510-0002'
+
+
+def test_reset_needs_master(app):
+    client = app.test_client()
+    client.post('/login', data={'username': 'Arivuselvi', 'password': 'arivu123'})
+    assert client.post('/reset_billing').status_code == 403
+
+
+def test_payments_go_on_the_dues_ledger(client, issue_bill):
+    issue_bill()
+    issue_bill(name='Selvam', slot_number='SLOT-08', payment_status='unpaid')
+    # Nothing is overdue on the day it is issued
+    assert client.get('/dues?format=json').get_json() == []
+    # Paid at the counter: nothing is left to pay
+    assert client.post('/bills/VP202510-0001/payments', data={'amount': '1'}).status_code == 400
+    paid = client.post('/bills/VP202510-0002/payments', data={'amount': '400', 'payment_mode': 'UPI'})
+    assert paid.status_code == 302
+    assert client.post('/bills/VP202510-0002/payments', data={'amount': '700'}).status_code == 400
+
+
+def test_logout(client):
+    assert client.get('/logout').status_code == 302
+    assert client.get('/billing').status_code == 302
+
+
+def test_bill_form_matches_the_fixture(client):
+    page = client.get('/billing').data
+    for field in BILL_FORM:
+        assert f'name="{field}"'.encode() in page, field
+
+
+def test_billed_period_filter(client, issue_bill):
+    issue_bill()
+    issue_bill(name='Selvam', month='November')
+    response = client.get('/billed?month=October&year=2025')
+    assert response.status_code == 200
+    assert b'Kumar' in response.data and b'Selvam' not in response.data
+    assert b'Selvam' in client.get('/billed?year=2025').data
+    for query in ('month=Foo&year=2025', 'month=October&year=abc', 'year=abc', 'year=1900'):
+        assert client.get(f'/billed?{query}').status_code == 400, query
+
+
+def test_streams_beyond_the_cap_are_refused(app, client):
+    stage = app.extensions['parking'].admission.stages['stream']
+    stage.limit = 1
+    first = client.get('/billed/stream')
+    assert first.status_code == 200
+    assert client.get('/billed/stream').status_code == 429
+    first.close()
+    assert stage.stats()['running'] == 0
+    second = client.get('/billed/stream')
+    assert second.status_code == 200
+    second.close()
+
+
+def test_payment_amounts_are_whole_paise(client, issue_bill):
+    issue_bill(payment_status='unpaid')
+    for amount in ('inf', '-inf', 'nan', '1e999', '10.005', 'ten', ''):
+        response = client.post('/bills/VP202510-0001/payments', data={'amount': amount})
+        assert response.status_code == 400, amount
+    # More than the bill's balance
+    assert client.post('/bills/VP202510-0001/payments', data={'amount': '1000.01'}).status_code == 400
+    assert client.post('/bills/VP202510-0001/payments', data={'amount': '999.99'}).status_code == 302
+    assert client.post('/bills/VP202510-0001/payments', data={'amount': '0.01'}).status_code == 302
+    assert client.post('/bills/VP202510-0001/payments', data={'amount': '0.01'}).status_code == 400
+
+
+def test_gate_events_price_the_stay(client):
+    now = time.time()
+    assert client.post('/gate/in', json={'vehicle_no': 'TN 31 AB 1234', 'at': now - 3600}).status_code == 201
+    assert client.post('/gate/in', json={'vehicle_no': 'TN 31 AB 1234'}).status_code == 409
+    left = client.post('/gate/out', json={'vehicle_no': 'TN 31 AB 1234', 'at': 'inf'})
+    assert left.status_code == 400
+    left = client.post('/gate/out', json={'vehicle_no': 'TN 31 AB 1234', 'at': now})
+    assert left.get_json()['amount'] == 30
+    assert client.get('/gate').get_json()['takings_today'] == 30
+
+
+def test_a_reset_can_be_undone_from_its_snapshot(app, client, issue_bill):
+    bill_no = bill_number(issue_bill())
+    client.post('/reset_billing')
+    snapshot, = app.extensions['parking'].store.list_snapshots('main')
+    assert client.post(f"/snapshots/{snapshot['id']}/restore").status_code == 302
+    assert b'Kumar' in client.get('/billed').data
+    assert client.get(f'/bills/{bill_no}').status_code == 200
+    assert client.post('/snapshots/no-such-snapshot/restore').status_code == 404
+
+
+def test_the_stream_sends_new_bills_and_resumes(client, issue_bill):
+    issue_bill()
+    stream = client.get('/billed/stream')
+    chunks = stream.iter_encoded()
+    assert next(chunks) == b'retry: 3000\n\n'
+    issue_bill(name='Selvam', slot_number='SLOT-08')
+    event = next(chunks).decode('utf-8')
+    stream.close()
+    assert 'event: bill\n' in event and 'Selvam' in event and 'Kumar' not in event
+    event_id = re.search(r'^id: (\S+)$', event, re.M).group(1)
+
+    # A reconnecting dashboard gets the bills issued while it was away
+    issue_bill(name='Ravi', slot_number='SLOT-09')
+    stream = client.get('/billed/stream', headers={'Last-Event-ID': event_id})
+    chunks = stream.iter_encoded()
+    next(chunks)
+    assert 'Ravi' in next(chunks).decode('utf-8')
+    stream.close()
+
+    # An id it can't resume from makes the page reload
+    stream = client.get('/billed/stream?last_id=bogus')
+    chunks = stream.iter_encoded()
+    next(chunks)
+    assert next(chunks).startswith(b'event: resync\n')
+    stream.close()
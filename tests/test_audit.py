@@ -0,0 +1,83 @@
+"""Hash chain of the audit log, and what verify_log finds when it is tampered with."""
+import pytest
+
+from parking.audit import GENESIS, AuditLog, verify_log
+
+
+@pytest.fixture
+def log(tmp_path):
+    log = AuditLog(str(tmp_path / '.audit'))
+    for number in range(1, 6):
+        log.record('generate', 'main', 'Master', bill_no=f'VP202510-{number:04d}')
+    log.record('reset', 'main', 'Master', sync=True)
+    yield log
+    log.close()
+
+
+def lines(log):
+    with open(log.path, 'rb') as f:
+        return f.readlines()
+
+
+def rewrite(log, new_lines):
+    with open(log.path, 'wb') as f:
+        f.writelines(new_lines)
+
+
+def test_an_untouched_log_verifies(log):
+    result = verify_log(log.path)
+    assert result['entries'] == 6
+    assert result['problems'] == []
+    assert result['head'] != GENESIS
+
+
+def test_entries_from_two_writers_share_one_chain(log):
+    other = AuditLog(log.directory)
+    other.record('payment', 'main', 'Arivuselvi', sync=True, bill_no='VP202510-0002')
+    log.record('import', 'main', 'import', sync=True)
+    other.close()
+    assert verify_log(log.path)['problems'] == []
+    assert verify_log(log.path)['entries'] == 8
+
+
+def test_an_edited_entry_breaks_the_chain_after_it(log):
+    edited = lines(log)
+    edited[2] = edited[2].replace(b'VP202510-0003', b'VP202510-0099')
+    rewrite(log, edited)
+    assert verify_log(log.path)['problems'] == [
+        "line 4: chain broken (entry 4 does not follow the line before it)"]
+
+
+def test_a_removed_entry_is_found(log):
+    removed = lines(log)
+    del removed[1]
+    rewrite(log, removed)
+    problems = verify_log(log.path)['problems']
+    assert problems == ["line 2: chain broken (entry 3 does not follow the line before it)",
+                        "line 2: entry 3 where 2 was expected"]
+
+
+def test_reordered_entries_are_found(log):
+    reordered = lines(log)
+    reordered[1], reordered[2] = reordered[2], reordered[1]
+    rewrite(log, reordered)
+    assert len(verify_log(log.path)['problems']) >= 2
+
+
+def test_garbage_and_a_torn_last_line_are_found(log):
+    damaged = lines(log)
+    damaged[0] = b'not json\n'
+    damaged[-1] = damaged[-1].rstrip(b'\n')
+    rewrite(log, damaged)
+    problems = verify_log(log.path)['problems']
+    assert problems[0].startswith("line 1: unreadable entry")
+    assert problems[-1] == "line 6: incomplete entry"
+
+
+def test_lines_cut_off_the_end_change_the_head(log):
+    head = verify_log(log.path)['head']
+    rewrite(log, lines(log)[:-1])
+    result = verify_log(log.path)
+    # The chain itself is intact: only the head kept elsewhere shows the cut
+    assert result['problems'] == []
+    assert result['head'] != head
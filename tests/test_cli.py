@@ -0,0 +1,69 @@
+"""The maintenance commands of ``python -m parking`` on a scratch data directory."""
+import json
+
+import pytest
+
+from parking.__main__ import main
+
+HISTORY = """name,vehicle_no,vehicle_type,slot_number,month,year,payment_mode,bill_no
+Kumar,TN 31 AB 1234,car,SLOT-07,October,2025,Cash,OLD-1
+Devi,TN 31 CD 5678,bike,SLOT-08,11,2025,UPI,OLD-2
+Kumar,TN 31 AB 1234,car,SLOT-07,October,2025,Cash,OLD-1
+Ravi,TN 31 EF 9012,boat,SLOT-09,October,2025,Cash,OLD-3
+"""
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    return str(tmp_path / 'data')
+
+
+@pytest.fixture
+def history(tmp_path):
+    path = tmp_path / 'history.csv'
+    path.write_text(HISTORY, encoding='utf-8')
+    return str(path)
+
+
+def test_import_reports_duplicates_and_invalid_rows(data_dir, history, capsys):
+    assert main(['--data-dir', data_dir, 'import', history]) == 2
+    out = capsys.readouterr().out
+    assert '4 rows: 2 imported, 1 duplicates, 1 invalid' in out
+    assert 'line 5:' in out
+
+    # Bills already on record are skipped on a second run
+    assert main(['--data-dir', data_dir, 'import', history]) == 2
+    assert '0 imported, 3 duplicates' in capsys.readouterr().out
+
+
+def test_import_rejects_a_csv_without_the_required_columns(data_dir, tmp_path, capsys):
+    path = tmp_path / 'bad.csv'
+    path.write_text("name,vehicle_no\nKumar,TN 31 AB 1234\n", encoding='utf-8')
+    assert main(['--data-dir', data_dir, 'import', str(path)]) == 1
+    assert 'error:' in capsys.readouterr().err
+
+
+def test_export_writes_the_imported_bills(data_dir, history, tmp_path, capsys):
+    main(['--data-dir', data_dir, 'import', history])
+    output = tmp_path / 'bills.jsonl'
+    assert main(['--data-dir', data_dir, 'export', '-o', str(output)]) == 0
+    records = [json.loads(line) for line in output.read_text(encoding='utf-8').splitlines()]
+    assert sorted(record['legacy_bill_no'] for record in records) == ['OLD-1', 'OLD-2']
+    assert {record['site'] for record in records} == {'main'}
+
+
+def test_verify_and_audit_pass_after_an_import(data_dir, history, capsys):
+    main(['--data-dir', data_dir, 'import', history])
+    capsys.readouterr()
+    assert main(['--data-dir', data_dir, 'verify']) == 0
+    assert main(['--data-dir', data_dir, 'audit']) == 0
+    out = capsys.readouterr().out
+    assert 'main: verified: 2 records' in out
+    assert 'audit log: 1 entries checked' in out
+
+
+def test_import_writes_into_one_site(data_dir, history):
+    with pytest.raises(SystemExit):
+        main(['--data-dir', data_dir, '--site', 'main', '--site', 'main', 'import', history])
+    with pytest.raises(SystemExit):
+        main(['--data-dir', data_dir, '--site', 'nowhere', 'import', history])
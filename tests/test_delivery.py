@@ -0,0 +1,117 @@
+"""The delivery outbox: retries with backoff, dead letters and requeueing."""
+import threading
+
+import pytest
+
+from parking import delivery
+from parking.delivery import DeliveryError, Outbox, compose_email, valid_email, valid_phone
+
+
+class FlakyTransport:
+    """Stand-in transport that fails the first ``failures`` sends of each bill"""
+
+    def __init__(self, failures=0, permanent=False):
+        self.failures = failures
+        self.permanent = permanent
+        self.attempts = {}
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def send(self, batch):
+        results = []
+        with self.lock:
+            for message, pdf in batch:
+                attempt = self.attempts[message['key']] = self.attempts.get(message['key'], 0) + 1
+                if attempt <= self.failures:
+                    results.append(DeliveryError("421 try again later", permanent=self.permanent))
+                else:
+                    self.sent.append(message['to'])
+                    results.append(None)
+        return results
+
+    def close(self):
+        pass
+
+
+def message(bill_no='VP202510-0001', to='kumar@example.com'):
+    return {'channel': 'email', 'to': to, 'site': 'main', 'header': {'name': 'Main Parking'},
+            'record': {'bill_no': bill_no, 'name': 'Kumar'}}
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(delivery, 'BACKOFF_BASE', 0.01)
+
+
+@pytest.fixture
+def make_outbox(tmp_path):
+    outboxes = []
+
+    def make(transport, channels=('email',), **options):
+        outbox = Outbox(str(tmp_path / '.outbox'), lambda: {'email': transport}, channels,
+                        lambda record, header: b'%PDF-1.3', **options)
+        outboxes.append(outbox)
+        return outbox
+    yield make
+    for outbox in outboxes:
+        outbox.close()
+
+
+def test_failed_sends_are_retried(make_outbox):
+    transport = FlakyTransport(failures=2)
+    outbox = make_outbox(transport)
+    assert outbox.enqueue([message()]) == 1
+    assert outbox.wait_idle(10)
+    assert transport.sent == ['kumar@example.com']
+    stats = outbox.stats()
+    assert (stats['sent'], stats['retried'], stats['dead']) == (1, 2, 0)
+
+
+def test_messages_go_to_the_dead_letters_after_max_attempts(make_outbox):
+    transport = FlakyTransport(failures=3)
+    outbox = make_outbox(transport, max_attempts=3)
+    outbox.enqueue([message()])
+    assert outbox.wait_idle(10)
+    letter, = outbox.dead_letters()
+    assert (letter['attempts'], letter['error']) == (3, "421 try again later")
+    assert transport.sent == []
+
+    # Requeued with its attempts reset; this time the send goes through
+    assert outbox.requeue_dead() == 1
+    assert outbox.dead_letters() == []
+    assert outbox.wait_idle(10)
+    assert transport.sent == ['kumar@example.com']
+
+
+def test_a_refused_message_is_not_retried(make_outbox):
+    transport = FlakyTransport(failures=1, permanent=True)
+    outbox = make_outbox(transport)
+    outbox.enqueue([message()])
+    assert outbox.wait_idle(10)
+    letter, = outbox.dead_letters()
+    assert letter['attempts'] == 1
+    assert outbox.stats()['retried'] == 0
+
+
+def test_the_queue_survives_the_process_and_drops_duplicates(make_outbox):
+    # Without channels nothing is sent, as in a worker that only queues
+    queuing = make_outbox(None, channels=())
+    assert queuing.enqueue([message(), message(), message('VP202510-0002')]) == 2
+    assert queuing.enqueue([message()]) == 0
+
+    transport = FlakyTransport()
+    sender = make_outbox(transport)
+    assert sender.stats()['pending'] == 2
+    sender.start()
+    assert sender.wait_idle(10)
+    assert len(transport.sent) == 2
+
+
+def test_addresses_and_headers_are_checked():
+    assert valid_email('kumar@example.com')
+    assert not valid_email('kumar@example.com\r\nBcc: x@example.com')
+    assert valid_phone('+91 98765-43210')
+    assert not valid_phone('12345')
+    with pytest.raises(DeliveryError) as error:
+        compose_email(dict(message(), to='kumar@example.com\nBcc: x@example.com', id='1'), b'%PDF', 'bills@localhost')
+    assert error.value.permanent
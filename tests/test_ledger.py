@@ -0,0 +1,61 @@
+"""Dues ledger entries shared by several workers."""
+import threading
+
+import pytest
+
+from parking.ledger import Ledger
+
+RECORD = {'bill_no': 'VP202510-0001', 'name': 'Kumar', 'vehicle_no': 'TN 31 AB 1234',
+          'slot_number': 'SLOT-07', 'period': 202510, 'bill_amount': 'Rs. 1000.00',
+          'issued_at': 1760000000}
+
+
+@pytest.fixture
+def directory(tmp_path):
+    ledger = Ledger(str(tmp_path / 'ledger'))
+    ledger.load()
+    ledger.add_bills([RECORD])
+    return ledger.directory
+
+
+def worker_ledger(directory):
+    """The ledger as another worker process sees it"""
+    ledger = Ledger(directory)
+    ledger.load()
+    return ledger
+
+
+def test_overpayment_is_refused(directory):
+    ledger = worker_ledger(directory)
+    with pytest.raises(ValueError):
+        ledger.pay('VP202510-0001', 1000.01)
+    with pytest.raises(ValueError):
+        ledger.pay('VP202510-0001', float('inf'))
+    with pytest.raises(KeyError):
+        ledger.pay('VP202510-9999', 1)
+    assert ledger.pay('VP202510-0001', 600)['balance'] == 400
+    # Another worker's ledger catches up before checking the balance
+    with pytest.raises(ValueError):
+        worker_ledger(directory).pay('VP202510-0001', 500)
+
+
+def test_only_one_of_concurrent_full_payments_is_accepted(directory):
+    ledgers = [worker_ledger(directory) for _ in range(8)]
+    start = threading.Barrier(len(ledgers))
+    accepted, refused = [], []
+
+    def pay(ledger):
+        start.wait()
+        try:
+            accepted.append(ledger.pay('VP202510-0001', 1000, 'Cash'))
+        except ValueError:
+            refused.append(ledger)
+
+    threads = [threading.Thread(target=pay, args=(ledger,)) for ledger in ledgers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(accepted) == 1
+    assert len(refused) == len(ledgers) - 1
+    assert worker_ledger(directory).bill('VP202510-0001')['paid'] == 1000
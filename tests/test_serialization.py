@@ -0,0 +1,42 @@
+"""Encoding and atomic file writes"""
+import os
+import threading
+
+from parking.serialization import dump_file, dumps, iter_json_array, load_file, loads
+
+
+def test_round_trip_is_compact_utf8():
+    record = {'name': 'குமார்', 'amount': 1000.5, 'tags': [1, None, True]}
+    data = dumps(record)
+    assert data == '{"name":"குமார்","amount":1000.5,"tags":[1,null,true]}'.encode('utf-8')
+    assert loads(data) == record
+
+
+def test_iter_json_array_streams_items(tmp_path):
+    path = tmp_path / 'records.json'
+    path.write_text('[{"a": 1}, {"b": "]"}, [2, 3]]', encoding='utf-8')
+    with open(path, encoding='utf-8') as f:
+        assert list(iter_json_array(f, chunk_size=4)) == [{'a': 1}, {'b': ']'}, [2, 3]]
+
+
+def test_concurrent_dump_file_never_installs_a_mixed_file(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    payloads = [[{'worker': worker, 'i': i, 'pad': 'x' * 40} for i in range(size)]
+                for worker, size in enumerate((20000, 10, 5000, 1))]
+    errors = []
+
+    def write(payload):
+        try:
+            for _ in range(20):
+                dump_file(payload, path)
+                assert load_file(path) in payloads
+        except Exception as e:  # collected for the main thread
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(payload,)) for payload in payloads]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert os.listdir(tmp_path) == ['checkpoint.json']
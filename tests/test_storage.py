@@ -0,0 +1,126 @@
+"""Sharded bill storage: one shard per billing period, in generations."""
+import os
+import stat
+
+import pytest
+
+from parking.storage import ShardedStore
+
+
+def bill(name, month='October', year='2025', slot='SLOT-07'):
+    return {'name': name, 'vehicle_no': f'TN 31 {name.upper()[:2]} 1234', 'vehicle_type': 'car',
+            'slot_number': slot, 'month': month, 'year': year, 'payment_mode': 'Cash',
+            'bill_date': f"01-{'09' if month == 'September' else '10'}-{year} 09:00:00",
+            'bill_amount': 'Rs. 1000.00', 'created_by': 'Master'}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ShardedStore(str(tmp_path / 'data'))
+    store.initialize('main')
+    return store
+
+
+def names(records):
+    return [record['name'] for record in records]
+
+
+def test_bills_are_numbered_and_kept_per_period(store):
+    store.append_many('main', [bill('Kumar'), bill('Devi', 'September'), bill('Ravi', slot='SLOT-08')], 'VP')
+    assert store.periods('main') == ['2025-09', '2025-10']
+    assert names(store.iter_records('main')) == ['Devi', 'Kumar', 'Ravi']
+    assert names(store.iter_records('main', periods=['2025-10'])) == ['Kumar', 'Ravi']
+    summary = store.summary('main')
+    assert (summary['count'], summary['amount']) == (3, 3000)
+    assert summary['slots'] == {'SLOT-07': 2, 'SLOT-08': 1}
+    record = store.find_record('main', '2025-10', 'VP202510-0002')
+    assert record['name'] == 'Ravi'
+    assert record['period'] == 202510
+    assert store.find_record('main', '2025-10', 'VP202510-0099') is None
+
+
+def test_every_saved_bill_changes_the_revision(store):
+    store.append('main', bill('Kumar'), 'VP')
+    first, _ = store.revision('main')
+    store.append('main', bill('Devi'), 'VP')
+    second, _ = store.revision('main')
+    assert first != second
+    assert store.summary('main')['count'] == 2
+
+
+def test_a_sealed_period_takes_new_bills_in_a_new_segment(store):
+    store.append_many('main', [bill('Kumar'), bill('Devi', 'September')], 'VP')
+    assert store.seal_before('main', '2025-10') == ['2025-09']
+    assert store.seal('main', '2025-09') is False
+    sealed, = store.manifest('main')['shards']['2025-09']['segments']
+    assert not os.stat(os.path.join(store.data_dir('main'), sealed)).st_mode & stat.S_IWUSR
+    store.append('main', bill('Ravi', 'September'), 'VP')
+    segments = store.manifest('main')['shards']['2025-09']['segments']
+    assert segments[0] == sealed and len(segments) == 2
+    assert names(store.iter_records('main', periods=['2025-09'])) == ['Devi', 'Ravi']
+    assert store.verify('main')['problems'] == []
+
+
+def test_a_new_store_reads_what_another_wrote(store):
+    store.append_many('main', [bill('Kumar'), bill('Devi')], 'VP')
+    other = ShardedStore(store.root)
+    other.append('main', bill('Ravi'), 'VP')
+    assert names(store.iter_records('main')) == ['Kumar', 'Devi', 'Ravi']
+    assert [record['bill_no'] for record in store.iter_records('main')] == [
+        'VP202510-0001', 'VP202510-0002', 'VP202510-0003']
+
+
+def test_archived_periods_read_the_same(store):
+    store.append_many('main', [bill(f'Kumar {number}', 'September') for number in range(50)] + [bill('Devi')], 'VP')
+    before = list(store.iter_records('main'))
+    assert store.archive_before('main', '2025-10', codec='gzip') == ['2025-09']
+    assert store.archive('main', '2025-09', codec='gzip') is False
+    shard = store.manifest('main')['shards']['2025-09']
+    assert shard['archived'] and shard['sealed']
+    assert shard['segments'][0].endswith('.jsonl.gz')
+    assert list(store.iter_records('main')) == before
+    assert store.find_record('main', '2025-09', 'VP202509-0050')['name'] == 'Kumar 49'
+    footprint = store.footprint('main')['2025-09']
+    assert footprint['bytes'] < footprint['raw_bytes']
+    assert store.verify('main')['problems'] == []
+
+
+def test_bills_after_archiving_go_to_a_new_segment(store):
+    store.append_many('main', [bill('Kumar', 'September')], 'VP')
+    store.archive('main', '2025-09', codec='gzip')
+    store.append('main', bill('Devi', 'September'), 'VP')
+    assert names(store.iter_records('main')) == ['Kumar', 'Devi']
+    # Archiving again merges them into one compressed segment
+    assert store.archive('main', '2025-09', codec='gzip') is True
+    assert len(store.manifest('main')['shards']['2025-09']['segments']) == 1
+    assert names(store.iter_records('main')) == ['Kumar', 'Devi']
+
+
+def test_reset_keeps_the_bills_as_a_snapshot_to_restore(store):
+    store.append_many('main', [bill('Kumar'), bill('Devi', 'September')], 'VP')
+    snapshot_id = store.reset('main')
+    assert list(store.iter_records('main')) == []
+    snapshot, = store.list_snapshots('main')
+    assert (snapshot['id'], snapshot['reason'], snapshot['count']) == (snapshot_id, 'reset', 2)
+
+    store.append('main', bill('Ravi'), 'VP')
+    before_restore = store.restore_snapshot('main', snapshot_id)
+    assert names(store.iter_records('main')) == ['Devi', 'Kumar']
+    # What the restore replaced is a snapshot too
+    assert {meta['id']: meta['count'] for meta in store.list_snapshots('main')}[before_restore] == 1
+    with pytest.raises(KeyError):
+        store.restore_snapshot('main', 'no-such-snapshot')
+
+
+def test_snapshots_are_not_changed_by_later_bills(store):
+    store.append('main', bill('Kumar'), 'VP')
+    snapshot_id = store.create_snapshot('main', reason='manual')
+    store.append('main', bill('Devi'), 'VP')
+    store.restore_snapshot('main', snapshot_id)
+    assert names(store.iter_records('main')) == ['Kumar']
+    store.append('main', bill('Ravi'), 'VP')
+    store.restore_snapshot('main', snapshot_id)
+    assert names(store.iter_records('main')) == ['Kumar']
+    assert store.verify('main')['problems'] == []
+    assert store.delete_snapshot('main', snapshot_id) is True
+    assert store.delete_snapshot('main', snapshot_id) is False
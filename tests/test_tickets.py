@@ -0,0 +1,70 @@
+"""Pay-and-park tickets: pricing, takings and gate event times."""
+import time
+
+import pytest
+
+from parking.inventory import DEFAULT_TARIFFS
+from parking.tickets import MAX_CLOCK_SKEW, MAX_EVENT_AGE, AlreadyInside, NotInside, TicketOffice, ticket_price
+
+HOUR = 3600
+
+
+@pytest.fixture
+def office(tmp_path):
+    office = TicketOffice(str(tmp_path / 'tickets'), DEFAULT_TARIFFS)
+    office.load()
+    return office
+
+
+def test_ticket_price():
+    car = DEFAULT_TARIFFS['car']
+    assert ticket_price(car, 10 * 60) == 0
+    assert ticket_price(car, 10 * 60 + 1) == 30
+    assert ticket_price(car, 2 * HOUR + 1) == 90
+    assert ticket_price(car, 23 * HOUR) == 250
+    assert ticket_price(car, 24 * HOUR + HOUR) == 280
+
+
+def test_takings_add_up_the_tickets_closed_today(office):
+    now = time.time()
+    office.check_in('TN 31 AB 1234', 'car', at=now - 2 * HOUR - 60)
+    office.check_in('TN 31 CD 5678', 'bike', at=now - 5 * 60)
+    office.check_in('TN 31 EF 9012', 'car', at=now - HOUR)
+    assert office.check_out('TN 31 AB 1234', at=now)['amount'] == 90
+    # Within the grace period
+    assert office.check_out('tn31cd5678', at=now)['amount'] == 0
+    summary = office.summary()
+    assert summary['takings_today'] == 90
+    assert (summary['inside'], summary['issued'], summary['closed']) == (1, 3, 2)
+
+    # Another worker replays the same takings from the log
+    other = TicketOffice(office.directory, DEFAULT_TARIFFS)
+    other.load()
+    assert other.summary()['takings_today'] == 90
+
+
+def test_a_vehicle_is_inside_at_most_once(office):
+    office.check_in('TN 31 AB 1234')
+    with pytest.raises(AlreadyInside):
+        office.check_in('TN 31 AB 1234')
+    office.check_out('TN 31 AB 1234')
+    with pytest.raises(NotInside):
+        office.check_out('TN 31 AB 1234')
+
+
+@pytest.mark.parametrize('at', ['inf', '-inf', 'nan', 'soon', 1e300, 0])
+def test_unusable_event_times_are_refused(office, at):
+    result, = office.record([{'type': 'in', 'vehicle_no': 'TN 31 AB 1234', 'at': at}])
+    assert result['status'] == 400
+    assert office.summary()['issued'] == 0
+
+
+def test_event_times_must_be_recent(office):
+    now = time.time()
+    with pytest.raises(ValueError):
+        office.check_in('TN 31 AB 1234', at=now - MAX_EVENT_AGE - 60)
+    with pytest.raises(ValueError):
+        office.check_in('TN 31 AB 1234', at=now + MAX_CLOCK_SKEW + 60)
+    office.check_in('TN 31 AB 1234', at=now - MAX_EVENT_AGE + 60)
+    with pytest.raises(ValueError):
+        office.check_out('TN 31 AB 1234', at=now - MAX_EVENT_AGE + 30)